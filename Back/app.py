@@ -1,8 +1,7 @@
 import os
-import openai
 import json
 import traceback
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file, g
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, session, jsonify, send_file, g, stream_with_context
 from flask_babel import Babel, _
 from werkzeug.utils import secure_filename
 import base64
@@ -13,25 +12,23 @@ from dotenv import load_dotenv
 from pdf2image import convert_from_path
 from pdf2image.exceptions import PDFInfoNotInstalledError
 import mimetypes
+import uuid
 from datetime import datetime
+from config import config
+from llm_cache import CACHE_BYPASS_HEADER, bypass_requested, llm_cache_bypass
+from llm_gateway import llm_gateway
+from llm_usage import UsageScope, llm_usage, llm_usage_scope
+from metrics import metrics
 
 # Загружаем переменные окружения из .env файла
 load_dotenv()
 
 # --- Настройка клиента OpenAI ---
-# Создаем единый клиент, который будет использоваться во всем приложении
-client = None
-api_key = os.getenv("OPENAI_API_KEY")
+# Общий шлюз с пулом соединений и лимитами аккаунта, тот же, что у DocumentProcessor
+client = llm_gateway if llm_gateway.available else None
 
-if api_key:
-    try:
-        client = openai.OpenAI(api_key=api_key)
-        # Проверяем подключение
-        client.models.list()
-        print("✅ OpenAI API успешно подключен")
-    except Exception as e:
-        print(f"⚠️  Ошибка подключения к OpenAI API: {e}")
-        client = None
+if client:
+    print("✅ OpenAI API настроен")
 else:
     print("⚠️  OPENAI_API_KEY не найден в .env файле")
 
@@ -47,6 +44,20 @@ LANGUAGES = {'en': 'English', 'ro': 'Română', 'ru': 'Русский'}
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'pdf', 'gif', 'webp'}
 
 
+# --- Системный промпт ассистента: читается один раз при запуске ---
+def load_system_prompt():
+    """Шаблон системного промпта ассистента или None, если файл не найден."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'system_prompt.txt')
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        print(f"⚠️  Файл с системным промптом не найден: {path}")
+        return None
+
+SYSTEM_PROMPT_TEMPLATE = load_system_prompt()
+
+
 # --- Настройка Babel для локализации ---
 def get_locale():
     # Попробовать получить язык из сессии
@@ -58,9 +69,37 @@ def get_locale():
 
 babel = Babel(app, locale_selector=get_locale)
 
+@app.before_request
+def set_llm_cache_bypass():
+    """Обход кэша ответов LLM по заголовку X-LLM-Cache-Bypass (для отладки)"""
+    llm_cache_bypass.set(bypass_requested(request.headers.get(CACHE_BYPASS_HEADER)))
+
 
 # --- Маршруты (Routes) ---
 
+@app.before_request
+def set_llm_usage_scope():
+    """Вызовы LLM во время запроса относятся в журнале llm_usage к его эндпоинту"""
+    g.llm_usage_token = llm_usage_scope.set(UsageScope(endpoint=request.path))
+
+@app.teardown_request
+def reset_llm_usage_scope(exc):
+    """Поток обработчика не переносит контекст журнала в следующий запрос"""
+    token = g.pop('llm_usage_token', None)
+    if token is not None:
+        llm_usage_scope.reset(token)
+
+def track_document(filename):
+    """Вызовы LLM до конца запроса относятся к загруженному файлу; возвращает ключ документа в журнале."""
+    document = f"{uuid.uuid4().hex[:8]}_{filename}"
+    llm_usage_scope.set(UsageScope(endpoint=request.path, document=document))
+    return document
+
+def attribute_document(document, doc_type):
+    """Тип документа для вызовов LLM, сделанных при его обработке."""
+    if config.LLM_USAGE_ENABLED and doc_type:
+        llm_usage.attribute(document, doc_type=doc_type)
+
 @app.before_request
 def before_request():
     g.locale = get_locale()
@@ -139,6 +178,7 @@ def extract():
             filename = secure_filename(file.filename)
             filepath = os.path.join(upload_folder, filename)
             file.save(filepath)
+            usage_document = track_document(filename)
 
             file_ext = os.path.splitext(filename)[1].lower()
             mime_type = "image/jpeg" # По умолчанию
@@ -178,8 +218,7 @@ def extract():
             prompt = _("Извлеки данные из этой таблицы в формате JSON. В ответе должен быть список объектов, где каждый объект - это строка, а ключи - это заголовки столбцов. Например: [{\"Колонка1\": \"Значение1\", \"Колонка2\": \"Значение2\"}]. Верни только JSON без какого-либо дополнительного текста или объяснений.")
             
             try:
-                response = client.chat.completions.create(
-                    model="gpt-4o",
+                response = client.chat_sync(
                     messages=[{
                         "role": "user",
                         "content": [
@@ -223,6 +262,7 @@ def extract():
                     if 'recent_documents' not in session:
                         session['recent_documents'] = []
                     
+                    attribute_document(usage_document, metadata.get('document_type'))
                     doc_type = metadata.get('document_type', _('Неизвестный тип'))
                     doc_id = metadata.get('document_number', f'file-{datetime.now().strftime("%H%M%S")}')
                     doc_date = metadata.get('document_date', datetime.now().strftime('%d.%m.%Y'))
@@ -305,9 +345,49 @@ def download(filename):
         print(f"Error creating Excel file: {e}")
         return "Error creating file", 500
 
+def assistant_messages(question):
+    """Сообщения для ассистента: системный промпт на языке интерфейса и вопрос пользователя."""
+    current_language_name = LANGUAGES.get(get_locale(), 'English')
+    system_prompt = SYSTEM_PROMPT_TEMPLATE.format(current_language=current_language_name)
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": question}
+    ]
+
+def wants_stream():
+    """Клиент просит ответ потоком: Accept: text/event-stream или "stream": true в запросе."""
+    return ('text/event-stream' in request.headers.get('Accept', '')
+            or bool((request.get_json(silent=True) or {}).get('stream')))
+
+def sse_event(data, event=None):
+    """Событие server-sent events."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def assistant_response(question, route):
+    """Ответ ассистента: потоком (SSE) по мере генерации или целиком в JSON."""
+    messages = assistant_messages(question)
+    if not wants_stream():
+        completion = client.chat_sync(messages=messages, max_tokens=1000, temperature=0.5)
+        return jsonify({'answer': completion.choices[0].message.content})
+
+    chunks = client.stream(messages, max_tokens=1000, temperature=0.5)
+
+    def events():
+        try:
+            for chunk in chunks:
+                yield sse_event({'delta': chunk})
+            yield sse_event({}, event='done')
+        except Exception as e:
+            print(f"Ошибка в {route}: {e}")
+            yield sse_event({'error': _('Ошибка при обращении к AI')}, event='error')
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/ask_ai', methods=['POST'])
 def ask_ai():
-    """API для общения с ИИ-ассистентом."""
+    """API для общения с ИИ-ассистентом (с "stream": true — ответ потоком SSE)."""
     if not client:
         return jsonify({'error': 'Клиент OpenAI не инициализирован.'}), 500
 
@@ -315,27 +395,11 @@ def ask_ai():
     if not question:
         return jsonify({'error': 'Вопрос не был предоставлен.'}), 400
 
-    try:
-        with open('system_prompt.txt', 'r', encoding='utf-8') as f:
-            system_prompt_template = f.read()
-        
-        current_language_name = LANGUAGES.get(get_locale(), 'English')
-        system_prompt = system_prompt_template.format(current_language=current_language_name)
-        
-        completion = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": question}
-            ],
-            max_tokens=1000,
-            temperature=0.5
-        )
-        answer = completion.choices[0].message.content
-        return jsonify({'answer': answer})
-
-    except FileNotFoundError:
+    if SYSTEM_PROMPT_TEMPLATE is None:
         return jsonify({'error': 'Файл с системным промптом (system_prompt.txt) не найден.'}), 500
+
+    try:
+        return assistant_response(question, '/ask_ai')
     except Exception as e:
         print(f"Ошибка в /ask_ai: {e}\n{traceback.format_exc()}")
         return jsonify({'error': f'Ошибка при обращении к ИИ-ассистенту: {e}'}), 500
@@ -356,6 +420,7 @@ def classify():
     filename = secure_filename(file.filename)
     filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     file.save(filepath)
+    usage_document = track_document(filename)
     # Обработка файла (pdf->jpeg, image->bytes)
     file_ext = os.path.splitext(filename)[1].lower()
     mime_type = mimetypes.guess_type(filepath)[0] or 'application/octet-stream'
@@ -377,8 +442,7 @@ def classify():
     base64_image = base64.b64encode(image_bytes).decode('utf-8')
     prompt = _("Определи тип, номер и дату документа на изображении. Верни JSON с ключами document_type, document_number, document_date.")
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        response = client.chat_sync(
             messages=[{
                 "role": "user",
                 "content": [
@@ -390,6 +454,7 @@ def classify():
             response_format={"type": "json_object"}
         )
         metadata = json.loads(response.choices[0].message.content)
+        attribute_document(usage_document, metadata.get('document_type'))
         return jsonify(metadata)
     except Exception as e:
         print(f"Ошибка в /classify: {e}")
@@ -410,6 +475,7 @@ def convert():
     filename = secure_filename(file.filename)
     filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     file.save(filepath)
+    track_document(filename)
     file_ext = os.path.splitext(filename)[1].lower()
     mime_type = mimetypes.guess_type(filepath)[0] or 'application/octet-stream'
     image_bytes = None
@@ -430,8 +496,7 @@ def convert():
     base64_image = base64.b64encode(image_bytes).decode('utf-8')
     prompt = _("Извлеки таблицу из этого изображения в формате JSON. Верни только JSON.")
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        response = client.chat_sync(
             messages=[{
                 "role": "user",
                 "content": [
@@ -479,8 +544,7 @@ def check():
         return jsonify({'error': _('Нет данных для проверки')}), 400
     prompt = _("Проверь эту таблицу на ошибки, подозрительные значения и соответствие законодательству Молдовы. Верни список найденных проблем или 'OK', если всё хорошо.")
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        response = client.chat_sync(
             messages=[{"role": "user", "content": f"{prompt}\n{json.dumps(data)}"}],
             max_tokens=1000
         )
@@ -492,32 +556,36 @@ def check():
 
 @app.route('/assistant', methods=['POST'])
 def assistant():
-    """ИИ-ассистент по закону Молдовы и использованию сайта."""
+    """ИИ-ассистент по закону Молдовы и использованию сайта (с "stream": true — ответ потоком SSE)."""
     if not client:
         return jsonify({'error': _('AI-функции временно недоступны.')}), 503
     question = request.json.get('question')
     if not question:
         return jsonify({'error': _('Вопрос не был предоставлен.')}), 400
     try:
-        with open('system_prompt.txt', 'r', encoding='utf-8') as f:
-            system_prompt_template = f.read()
-        current_language_name = LANGUAGES.get(get_locale(), 'English')
-        system_prompt = system_prompt_template.format(current_language=current_language_name)
-        completion = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": question}
-            ],
-            max_tokens=1000,
-            temperature=0.5
-        )
-        answer = completion.choices[0].message.content
-        return jsonify({'answer': answer})
+        if SYSTEM_PROMPT_TEMPLATE is None:
+            raise FileNotFoundError('system_prompt.txt')
+        return assistant_response(question, '/assistant')
     except Exception as e:
         print(f"Ошибка в /assistant: {e}")
         return jsonify({'error': _('Ошибка при обращении к AI')}), 500
 
+@app.route('/metrics')
+def get_metrics():
+    """Счётчики работы приложения (в том числе попадания в кэш LLM)."""
+    return jsonify(metrics.snapshot())
+
+@app.route('/metrics/llm-usage')
+def get_llm_usage():
+    """Токены, стоимость и задержка вызовов LLM (?group_by=doc_type|endpoint|model|provider|document&days=30)."""
+    group_by = request.args.get('group_by', 'doc_type')
+    days = request.args.get('days', 30, type=float)
+    try:
+        usage = llm_usage.summary(group_by, datetime.now().timestamp() - days * 86400)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'group_by': group_by, 'days': days, 'usage': usage})
+
 @app.route('/archive')
 def archive():
     """Архив документов: просмотр и скачивание загруженных файлов."""
@@ -560,8 +628,7 @@ def get_document_metadata(data: list) -> dict:
 Если какая-то информация отсутствует, используй "N/A".
 """
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        response = client.chat_sync(
             messages=[{"role": "user", "content": prompt}],
             max_tokens=150,
             response_format={"type": "json_object"}
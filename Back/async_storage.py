@@ -0,0 +1,106 @@
+"""
+Асинхронный фасад хранилища документов для обработчиков FastAPI
+Блокирующие запросы к базе выполняются в отдельных потоках, цикл событий остаётся свободным
+"""
+
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from config import config
+from data_models import DocumentData
+from document_storage import (
+    BaseDocumentStorage, ClassificationUpdate, DocumentStorage, StoredDocument, get_storage,
+)
+
+logger = logging.getLogger(__name__)
+
+class AsyncDocumentStorage:
+    """Асинхронная обёртка над синхронным хранилищем документов"""
+
+    def __init__(self, storage: BaseDocumentStorage, max_workers: Optional[int] = None):
+        self.storage = storage
+        # SQLite допускает одного писателя, поэтому все запросы идут через один поток базы;
+        # PostgreSQL получает столько потоков, сколько соединений в пуле
+        if max_workers is None:
+            max_workers = 1 if isinstance(storage, DocumentStorage) else config.DB_POOL_MAX_SIZE
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Выполнение блокирующей функции в потоке базы данных"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def shutdown(self):
+        """Остановка потоков базы данных"""
+        self.executor.shutdown(wait=True)
+
+    async def store_document(self, doc_data: DocumentData, filename: str, file_path: str,
+                             validation_result: Dict[str, List[str]] = None) -> int:
+        """Сохраняет документ в базу данных"""
+        return await self.run(self.storage.store_document, doc_data, filename, file_path, validation_result)
+
+    async def get_document(self, doc_id: int) -> Optional[StoredDocument]:
+        """Получает документ по ID"""
+        return await self.run(self.storage.get_document, doc_id)
+
+    async def get_document_for_api(self, doc_id: int) -> Optional[Dict[str, Any]]:
+        """Получение документа в формате для API"""
+        return await self.run(self.storage.get_document_for_api, doc_id)
+
+    async def get_documents(self, filters: Dict[str, Any] = None) -> List[StoredDocument]:
+        """Получение документов с фильтрацией"""
+        return await self.run(self.storage.get_documents, filters)
+
+    async def search_documents(self, **criteria) -> List[StoredDocument]:
+        """Поиск документов по различным критериям"""
+        return await self.run(self.storage.search_documents, **criteria)
+
+    async def load_documents_frame(self, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                                   doc_type: Optional[str] = None) -> pd.DataFrame:
+        """Колоночная выгрузка документов для аналитики"""
+        return await self.run(self.storage.load_documents_frame, date_from, date_to, doc_type)
+
+    async def get_statistics(self) -> Dict[str, Any]:
+        """Статистика по документам в базе"""
+        return await self.run(self.storage.get_statistics)
+
+    async def update_document(self, doc_id: int, updated_fields: Dict[str, Any],
+                              doc_type: Optional[str] = None) -> bool:
+        """Обновление документа пользователем"""
+        return await self.run(self.storage.update_document, doc_id, updated_fields, doc_type)
+
+    async def update_classifications(self, updates: Sequence[ClassificationUpdate]) -> int:
+        """Запись результатов переклассификации одной транзакцией"""
+        return await self.run(self.storage.update_classifications, updates)
+
+    async def delete_document(self, doc_id: int) -> bool:
+        """Удаляет документ по ID"""
+        return await self.run(self.storage.delete_document, doc_id)
+
+_async_storage: Optional[AsyncDocumentStorage] = None
+_async_storage_lock = threading.Lock()
+
+def get_async_storage() -> AsyncDocumentStorage:
+    """Асинхронный фасад над общим хранилищем (пересоздаётся при замене хранилища)"""
+    global _async_storage
+    storage = get_storage()
+    with _async_storage_lock:
+        if _async_storage is None or _async_storage.storage is not storage:
+            if _async_storage is not None:
+                _async_storage.executor.shutdown(wait=False)
+            _async_storage = AsyncDocumentStorage(storage)
+        return _async_storage
+
+def shutdown_async_storage() -> None:
+    """Остановка потоков базы данных при завершении приложения"""
+    global _async_storage
+    with _async_storage_lock:
+        if _async_storage is not None:
+            _async_storage.shutdown()
+            _async_storage = None
@@ -0,0 +1,4 @@
+"""
+Бенчмарки производительности обработки документов
+Запуск из каталога Back: python -m benchmarks.<имя_бенчмарка>
+"""
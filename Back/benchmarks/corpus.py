@@ -0,0 +1,213 @@
+"""
+Корпус OCR-текстов документов Молдовы для бенчмарков
+Тексты сохранены как их выдаёт Tesseract: с переносами строк, лишними пробелами и ошибками распознавания
+"""
+
+import random
+import re
+from dataclasses import dataclass
+from typing import List
+
+@dataclass(frozen=True)
+class CorpusDocument:
+    """Размеченный OCR-текст документа"""
+    name: str
+    doc_type: str
+    language: str
+    text: str
+
+OCR_CORPUS: List[CorpusDocument] = [
+    CorpusDocument("factura_ro_1", "factura_fiscala", "ro", """FACTURĂ FISCALĂ
+Seria MD AAA Nr. 0458213
+Data eliberării: 14.03.2025
+Furnizor: SRL "Agro Lux Trade"
+Cod fiscal: 1003600045123
+Adresa: mun. Chişinău, str. Columna 104
+Cumpărător: SA "Moldtelecom"
+IDNO: 1002600001234
+Nr. Denumirea mărfii       Cant.  Preţ    Suma
+1  Hârtie A4 80g           10     95,00   950,00
+2  Toner HP 85A            2      640,00  1 280,00
+Total fără TVA: 1 858,33 L
+TVA 20%: 371,67 L
+Total: 2 230,00 L
+Semnătura furnizorului ______"""),
+    CorpusDocument("factura_ro_2", "factura_fiscala", "ro", """FACTURA FISCALÄ  Nr 77120
+SRL 'Vita Farm'  IDNO 1012600033871
+data 02/04/2025
+Destinatar: II "Rusu Ion"
+Medicamente conform listei anexate
+Suma fara TVA 4 150,00 L
+TVA: 830,00 L
+Total 4 980,00 L
+fiscal code FISC"""),
+    CorpusDocument("factura_ru_1", "factura_fiscala", "ru", """СЧЕТ-ФАКТУРА № 1187
+от 21.01.2025
+Поставщик: ООО "Гранд Строй"
+Налоговый код: 1009600012457
+Покупатель: SRL "Euro Casa"
+Наименование           Кол-во  Цена     Сумма
+Цемент М500            40      98,50    3 940,00
+Песок речной, т        5       310,00   1 550,00
+Итого без НДС: 4 575,00 л
+НДС 20%: 915,00 л
+Сумма к оплате: 5 490,00 л"""),
+    CorpusDocument("bon_ro_1", "bon_fiscal", "ro", """S.R.L. "LINELLA"
+mun. Chisinau, bd. Dacia 27
+COD FISCAL: 1003600012345
+BON FISCAL
+Casa 03  Casier: Elena
+Paine alba            1 x 6,50      6,50 A
+Lapte 2.5% 1L         2 x 17,90    35,80 A
+Mere Golden kg        1.25 x 22,00 27,50 A
+TOTAL                              69,80 L
+NUMERAR                           100,00
+REST                               30,20
+TVA A 20%                          11,63
+12.03.2025 18:42
+Nr. bon 0004127  ID casă MD0042"""),
+    CorpusDocument("bon_ro_2", "bon_fiscal", "ro", """PECO PETROM SA
+Statia 115 Balti
+BON FISCAL nr 55871
+Benzina Regular 95  32,15 l x 24,89
+Total 800,21 L
+Card bancar 800,21
+TVA 20% 133,37 L
+data 05-05-2025  ora 09:14
+Va multumim! casă 2"""),
+    CorpusDocument("bon_ru_1", "bon_fiscal", "ru", """ФИСКАЛЬНЫЙ ЧЕК
+Магазин "Fidesco"
+Касса 1  кассир Ольга
+Хлеб ржаной        1 x 8,00    8,00
+Сыр Гауда 0,3кг    1 x 54,60  54,60
+ИТОГО              62,60 л
+Наличные           70,00
+Сдача               7,40
+НДС 20%            10,43
+11.02.2025 20:05
+Номер чека 004412"""),
+    CorpusDocument("stat_ro_1", "stat_plata", "ro", """STAT DE PLATĂ
+pentru luna martie 2025
+SRL "Soft Expert"  IDNO 1014600029991
+Nr  Numele angajați        Funcţia         Salarii
+1   Popescu Ana            contabil        12 500,00
+2   Ceban Mihai            programator     21 000,00
+3   Lungu Victor           manager         18 300,00
+Total plata: 51 800,00 L
+Data 31.03.2025"""),
+    CorpusDocument("stat_ru_1", "stat_plata", "ru", """ВЕДОМОСТЬ НА ВЫПЛАТУ ЗАРАБОТНОЙ ПЛАТЫ
+за февраль 2025
+ООО "Агро Юг"
+Сотрудники:
+Иванов П.С.   тракторист   9 800,00
+Сырбу Д.И.    бухгалтер   11 200,00
+Выплата произведена 05.03.2025
+Сумма 21 000,00 л"""),
+    CorpusDocument("decl_ro_1", "declaratie_tva", "ro", """DECLARAȚIE TVA
+forma TVA12
+Perioada fiscală: 02.2025
+Contribuabil: SRL "Nord Grup"
+Cod fiscal 1006600034567
+Livrări impozabile cota 20% ..... 245 000,00 L
+TVA calculată ..................... 49 000,00 L
+TVA spre plată la buget: 12 340,00 L
+Data prezentării 25.03.2025
+fiscal SFS"""),
+    CorpusDocument("decl_ru_1", "declaratie_tva", "ru", """ДЕКЛАРАЦИЯ НДС (форма TVA12)
+Налоговый период: 01.2025
+Налогоплательщик: ООО "Бест Логистик"
+Налоговый код: 1011600022222
+Облагаемые поставки по ставке 20%: 120 000,00 л
+НДС к уплате: 24 000,00 л
+дата 20.02.2025  тва"""),
+    CorpusDocument("contract_ro_1", "contract", "ro", """CONTRACT DE PRESTĂRI SERVICII Nr. 15/2025
+mun. Chişinău                                  10.01.2025
+SRL "Clean Pro", IDNO 1013600011111, numit în continuare Prestator, şi
+SA "Apă Canal", numit Beneficiar, au încheiat prezentul acord:
+1. Obiectul contractului: servicii de curăţenie a oficiului.
+2. Valoarea contractului constituie 36 000,00 L, inclusiv TVA.
+3. Termenul: 12 luni de la semnare."""),
+    CorpusDocument("contract_ru_1", "contract", "ru", """ДОГОВОР ПОСТАВКИ № 48
+г. Кишинёв                                   03.02.2025
+ООО "Молд Агро" (Поставщик) и SRL "Fresh Market" (Покупатель)
+заключили настоящее соглашение о нижеследующем:
+1. Предмет договора: поставка овощей.
+2. Сумма договора 150 000,00 л.
+3. Срок действия контракта до 31.12.2025."""),
+    CorpusDocument("aviz_ro_1", "aviz_expeditie", "ro", """AVIZ DE EXPEDIȚIE Nr. 0098812
+Data 18.04.2025
+Expeditor: SRL "Vinaria Purcari"
+Destinatar: SRL "Metro Cash"
+Livrare: mun. Chişinău, str. Uzinelor 8
+Vin roşu sec 0,75 l   120 buc   89,00   10 680,00
+Total 10 680,00 L
+Auto: C AB 123  Şofer: Gheorghe"""),
+    CorpusDocument("aviz_ru_1", "aviz_expeditie", "ru", """НАКЛАДНАЯ № 3321
+Дата 22.04.2025
+Отправитель: ООО "Пласт Форм"
+Получатель: SRL "Bricolaj"
+Отгрузка со склада: г. Бельцы
+Товар: трубы ПВХ 50мм  300 шт  x 41,00
+Итого 12 300,00 л
+Доставка транспортом отправителя"""),
+    CorpusDocument("ordin_ro_1", "ordine_plata", "ro", """ORDIN DE PLATĂ Nr. 512
+Data 07.05.2025
+Plătitor: SRL "IT Hub"  IDNO 1015600077777
+Banca plătitorului: BC "MAIB" SA
+Beneficiar: Serviciul Fiscal de Stat
+Suma: 18 450,00 L
+Destinaţia plăţii: transfer TVA pentru 04.2025
+Semnătura  L.Ş."""),
+    CorpusDocument("ordin_ru_1", "ordine_plata", "ru", """ПЛАТЁЖНОЕ ПОРУЧЕНИЕ № 208
+Дата 12.05.2025
+Плательщик: ООО "Техно Сервис"
+Банк: BC "Moldindconbank" SA
+Получатель: SRL "Rent Auto"
+Сумма 9 600,00 л
+Назначение платежа: перевод за аренду автомобиля, май 2025"""),
+    CorpusDocument("chit_ro_1", "chitanta", "ro", """CHITANȚĂ Nr. 0411
+Data 15.05.2025
+Am primit de la: Moraru Elena
+Suma: 1 500,00 L
+Pentru: plată pentru cursuri de contabilitate
+Confirmare primire   Casier ________"""),
+    CorpusDocument("chit_ru_1", "chitanta", "ru", """КВИТАНЦИЯ № 774
+Дата 16.05.2025
+Получено от: Бордян Сергей
+Сумма 450,00 л
+Назначение: платёж за членский взнос
+Подтверждение получения __________"""),
+]
+
+# Типичные ошибки распознавания: диакритика теряется, похожие символы путаются
+OCR_CONFUSIONS = {
+    "ă": "a", "â": "a", "î": "i", "ș": "s", "ş": "s", "ț": "t", "ţ": "t",
+    "o": "0", "l": "1", "e": "c", "i": "l", "S": "5", "B": "8",
+    "о": "o", "е": "e", "а": "a", "с": "c", "р": "p", "и": "н", "т": "m",
+}
+
+def _ocr_variant(text: str, rnd: random.Random, noise: float, drop_title: float) -> str:
+    """Вариант документа: другие цифры, шум распознавания, иногда без строки заголовка"""
+    text = re.sub(r"\d", lambda match: str(rnd.randint(0, 9)), text)
+    lines = text.split("\n")
+    if len(lines) > 2 and rnd.random() < drop_title:
+        lines = lines[1:]
+    chars = []
+    for char in "\n".join(lines):
+        if char in OCR_CONFUSIONS and rnd.random() < noise:
+            char = OCR_CONFUSIONS[char]
+        elif char == " " and rnd.random() < noise:
+            char = "  "
+        chars.append(char)
+    return "".join(chars)
+
+def augment_corpus(variants: int, seed: int, noise: float = 0.05, drop_title: float = 0.3) -> List[CorpusDocument]:
+    """Синтетические варианты корпуса для обучения и оценки классификаторов
+    (документы одного шаблона повторяются с другими суммами, датами и ошибками OCR)"""
+    rnd = random.Random(seed)
+    return [
+        CorpusDocument(f"{document.name}_v{index}", document.doc_type, document.language,
+                       _ocr_variant(document.text, rnd, noise, drop_title))
+        for document in OCR_CORPUS
+        for index in range(variants)
+    ]
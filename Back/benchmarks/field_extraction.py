@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк извлечения полей: прежний поиск по спискам шаблонов против предкомпилированного FieldExtractor
+"""
+
+import argparse
+import re
+import time
+from typing import Any, Callable, Dict
+
+from benchmarks.corpus import OCR_CORPUS
+from field_extractor import field_extractor
+
+# Прежний способ: шаблоны перебираются по одному, каждый — отдельным re.search по всему тексту
+LEGACY_PATTERNS = [
+    ("number", [r'№\s*(\d+)', r'Nr\.?\s*(\d+)', r'Numărul\s*(\d+)', r'Номер\s*(\d+)', r'(\d{6,})'],
+     re.IGNORECASE, lambda m: m.group(1)),
+    ("date", [r'(\d{1,2})\.(\d{1,2})\.(\d{4})', r'(\d{1,2})/(\d{1,2})/(\d{4})', r'(\d{1,2})-(\d{1,2})-(\d{4})'],
+     0, lambda m: f"{m.group(1).zfill(2)}.{m.group(2).zfill(2)}.{m.group(3)}"),
+    ("total_amount", [r'Total[:\s]*([\d\s,\.]+)\s*[Lл]', r'Suma[:\s]*([\d\s,\.]+)\s*[Lл]',
+                      r'Сумма[:\s]*([\d\s,\.]+)\s*[Lл]', r'([\d\s,\.]+)\s*[Lл]'],
+     re.IGNORECASE, lambda m: float(m.group(1).replace(' ', '').replace(',', '.'))),
+    ("vat_amount", [r'TVA[:\s]*([\d\s,\.]+)\s*[Lл]', r'НДС[:\s]*([\d\s,\.]+)\s*[Lл]', r'(\d+)\s*%'],
+     re.IGNORECASE, lambda m: float(m.group(1).replace(' ', '').replace(',', '.'))),
+    ("idno", [r'IDNO[:\s]*(\d{13})', r'Cod fiscal[:\s]*(\d{13})', r'Налоговый код[:\s]*(\d{13})'],
+     re.IGNORECASE, lambda m: m.group(1)),
+    ("company", [r'SRL\s+["\']([^"\']+)["\']', r'ООО\s+["\']([^"\']+)["\']', r'SA\s+["\']([^"\']+)["\']'],
+     re.IGNORECASE, lambda m: m.group(1).strip()),
+]
+
+def legacy_extract(text: str) -> Dict[str, Any]:
+    """Извлечение полей прежним способом (эталон для сравнения)"""
+    data = {}
+    for name, patterns, flags, convert in LEGACY_PATTERNS:
+        for pattern in patterns:
+            match = re.search(pattern, text, flags)
+            if match:
+                try:
+                    data[name] = convert(match)
+                    break
+                except ValueError:
+                    continue
+    return data
+
+def measure(extract: Callable[[str], Dict[str, Any]], repeat: int) -> float:
+    """Среднее время обработки одного документа корпуса в микросекундах"""
+    texts = [document.text for document in OCR_CORPUS]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            extract(text)
+    return (time.perf_counter() - start) / (repeat * len(texts)) * 1e6
+
+def main():
+    """Запуск бенчмарка"""
+    parser = argparse.ArgumentParser(description='Бенчмарк извлечения полей')
+    parser.add_argument('--repeat', type=int, default=200, help='Количество прогонов корпуса (по умолчанию: 200)')
+    args = parser.parse_args()
+
+    mismatches = [document.name for document in OCR_CORPUS
+                  if legacy_extract(document.text) != field_extractor.extract(document.text)]
+    if mismatches:
+        print(f"✗ Результаты расходятся: {', '.join(mismatches)}")
+    else:
+        print(f"✓ Результаты совпадают на {len(OCR_CORPUS)} документах")
+
+    legacy_us = measure(legacy_extract, args.repeat)
+    extractor_us = measure(field_extractor.extract, args.repeat)
+    print(f"Прежний поиск:        {legacy_us:8.1f} мкс/документ")
+    print(f"FieldExtractor:       {extractor_us:8.1f} мкс/документ")
+    print(f"Ускорение:            {legacy_us / extractor_us:8.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк поставщиков LLM на размеченном корпусе.
+Для каждого поставщика из config.LLM_PROVIDERS: точность классификации, доля разобранных JSON-ответов,
+качество исправления текста OCR (сходство с исходным текстом до искажений) и задержка запросов.
+С --mock поставщики заменяются локальными OpenAI-совместимыми серверами с заданной задержкой
+(проверка самого бенчмарка без сети и модели)
+"""
+
+import argparse
+import difflib
+import json
+import re
+import time
+from contextlib import ExitStack
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.corpus import OCR_CORPUS, CorpusDocument, augment_corpus
+from benchmarks.mock_openai import MockOpenAIServer
+from config import config
+from document_processor import DocumentProcessor
+from keyword_matcher import document_type_keywords
+from llm_cache import llm_cache_bypass
+from llm_gateway import LLMGateway, get_gateway
+
+# Задержка имитации поставщиков в режиме --mock, секунд
+MOCK_DELAYS = {"openai": 0.3, "local": 0.1}
+
+_DOCUMENT_TEXT = re.compile(r"Текст документа:\s*(.*?)\s*Ответь в формате JSON", re.DOTALL)
+
+def mock_responder(body: Dict[str, Any]) -> str:
+    """Ответ имитации: тип по ключевым словам, текст документа без изменений"""
+    match = _DOCUMENT_TEXT.search(body["messages"][-1]["content"])
+    text = match.group(1) if match else ""
+    scores = document_type_keywords.score(text, "ro")
+    doc_type = max(scores, key=scores.get) if scores and max(scores.values()) > 0 else "unknown"
+    return json.dumps({"text": text, "type": doc_type, "confidence": 0.9, "data": {}}, ensure_ascii=False)
+
+def similarity(text: str, reference: str) -> float:
+    """Сходство текстов без учёта пробелов (0..1)"""
+    return difflib.SequenceMatcher(None, " ".join(text.split()), " ".join(reference.split())).ratio()
+
+def run_provider(gateway: LLMGateway, documents: List[CorpusDocument],
+                 references: Dict[str, str]) -> Dict[str, Any]:
+    """Классификация и исправление текста каждого документа; запросы последовательные, без кэша"""
+    processor = DocumentProcessor()
+    processor.client = processor.enhancement_client = gateway
+    latencies: Dict[str, List[float]] = {"classify": [], "enhance": []}
+    correct = parsed = 0
+    enhanced_similarity, noisy_similarity = [], []
+
+    for document in documents:
+        start = time.perf_counter()
+        result = processor.classify_with_openai(document.text, document.language)
+        latencies["classify"].append(time.perf_counter() - start)
+        if isinstance(result, dict):
+            parsed += 1
+            correct += result.get("type") == document.doc_type
+
+        start = time.perf_counter()
+        analysis = processor.enhance_and_classify_with_openai(document.text, document.language)
+        latencies["enhance"].append(time.perf_counter() - start)
+        reference = references[document.name]
+        if analysis and isinstance(analysis.get("text"), str):
+            enhanced_similarity.append(similarity(analysis["text"], reference))
+            noisy_similarity.append(similarity(document.text, reference))
+
+    return {
+        "accuracy": correct / len(documents),
+        "json_rate": parsed / len(documents),
+        "enhanced_similarity": float(np.mean(enhanced_similarity)) if enhanced_similarity else 0.0,
+        "noisy_similarity": float(np.mean(noisy_similarity)) if noisy_similarity else 0.0,
+        "latencies": latencies,
+    }
+
+def format_latency(values: List[float]) -> str:
+    """p50 и p95 задержки в миллисекундах"""
+    p50, p95 = np.percentile(np.array(values) * 1000, [50, 95])
+    return f"p50 {p50:7.0f} мс, p95 {p95:7.0f} мс"
+
+def main():
+    """Запуск бенчмарка"""
+    parser = argparse.ArgumentParser(description='Бенчмарк поставщиков LLM: точность и задержка')
+    parser.add_argument('--providers', nargs='+', default=list(config.LLM_PROVIDERS),
+                        help=f'Поставщики из config.LLM_PROVIDERS (по умолчанию: {", ".join(config.LLM_PROVIDERS)})')
+    parser.add_argument('--variants', type=int, default=1,
+                        help='Искажённых вариантов каждого документа корпуса (0 — только исходный корпус)')
+    parser.add_argument('--seed', type=int, default=3, help='Зерно генератора искажений')
+    parser.add_argument('--mock', action='store_true',
+                        help='Локальные имитации поставщиков вместо настоящих серверов')
+    args = parser.parse_args()
+
+    documents = augment_corpus(args.variants, seed=args.seed) if args.variants else list(OCR_CORPUS)
+    # Эталон для исправления текста — документ корпуса до искажений (цифры варианта отличаются от эталона,
+    # поэтому сходство сравнивается со сходством неисправленного текста)
+    originals = {document.name: document.text for document in OCR_CORPUS}
+    references = {document.name: originals[document.name.rsplit("_v", 1)[0] if args.variants else document.name]
+                  for document in documents}
+    # Ответы измеряются без кэша: иначе повторный прогон покажет задержку SQLite, а не модели
+    llm_cache_bypass.set(True)
+
+    print(f"Корпус: {len(documents)} документов")
+    with ExitStack() as stack:
+        for name in args.providers:
+            provider: Optional[Any] = config.LLM_PROVIDERS.get(name)
+            if provider is None:
+                print(f"✗ {name}: поставщик не настроен")
+                continue
+            if args.mock:
+                server = stack.enter_context(MockOpenAIServer(mock_responder, delay=MOCK_DELAYS.get(name, 0.1)))
+                gateway = LLMGateway(api_key="mock", base_url=server.base_url, model=provider.model,
+                                     max_concurrency=provider.max_concurrency, max_retries=0, name=name)
+                # Ответы заглушки не попадают ни в кэш, ни в журнал расхода (None в конструкторе — общие экземпляры)
+                gateway.cache = gateway.usage = None
+                stack.callback(gateway.close)
+            else:
+                gateway = get_gateway(name)
+                if not gateway.available:
+                    print(f"✗ {name}: не задан ключ API")
+                    continue
+
+            start = time.perf_counter()
+            result = run_provider(gateway, documents, references)
+            elapsed = time.perf_counter() - start
+            print(f"{name} ({provider.model}):")
+            print(f"  Классификация:      точность {result['accuracy']:6.1%}, JSON разобран {result['json_rate']:6.1%}, "
+                  f"{format_latency(result['latencies']['classify'])}")
+            print(f"  Исправление + тип:  сходство с эталоном {result['enhanced_similarity']:6.1%} "
+                  f"(до исправления {result['noisy_similarity']:6.1%}), {format_latency(result['latencies']['enhance'])}")
+            print(f"  Всего: {elapsed:.1f} с")
+
+if __name__ == "__main__":
+    main()
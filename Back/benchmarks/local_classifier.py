@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк каскада классификации: ключевые слова → локальная модель → OpenAI.
+Точность и задержка каждого уровня и доля документов, которые пришлось бы отправить в LLM
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.corpus import augment_corpus
+from config import config
+from keyword_matcher import document_type_keywords
+from local_classifier import LocalDocumentClassifier
+
+def keyword_classify(text: str, language: str):
+    """Тип и уверенность по ключевым словам (как на первом этапе DocumentProcessor)"""
+    scores = document_type_keywords.score(text, language)
+    if not scores:
+        return None, 0.0
+    best = max(scores, key=scores.get)
+    return best, scores[best]
+
+def main():
+    """Запуск бенчмарка"""
+    parser = argparse.ArgumentParser(description='Бенчмарк локального классификатора документов')
+    parser.add_argument('--train-variants', type=int, default=8, help='Вариантов каждого документа для обучения')
+    parser.add_argument('--test-variants', type=int, default=4, help='Вариантов каждого документа для проверки')
+    args = parser.parse_args()
+
+    # Обучающая и проверочная выборки — разные синтетические варианты корпуса
+    train = augment_corpus(args.train_variants, seed=1)
+    test = augment_corpus(args.test_variants, seed=2)
+    threshold = config.CLASSIFICATION_CONFIDENCE_THRESHOLD
+
+    start = time.perf_counter()
+    model = LocalDocumentClassifier().fit([doc.text for doc in train], [doc.doc_type for doc in train])
+    print(f"Обучение: {len(train)} документов за {time.perf_counter() - start:.2f} с")
+
+    start = time.perf_counter()
+    keyword_results = [keyword_classify(doc.text, doc.language) for doc in test]
+    keyword_us = (time.perf_counter() - start) / len(test) * 1e6
+
+    start = time.perf_counter()
+    local_results = [model.classify(doc.text) for doc in test]
+    local_us = (time.perf_counter() - start) / len(test) * 1e6
+
+    start = time.perf_counter()
+    probabilities = model.predict_proba([doc.text for doc in test])
+    batch_us = (time.perf_counter() - start) / len(test) * 1e6
+
+    expected = [doc.doc_type for doc in test]
+    keyword_accuracy = np.mean([result[0] == label for result, label in zip(keyword_results, expected)])
+    local_accuracy = np.mean([result[0] == label for result, label in zip(local_results, expected)])
+    batch_agrees = all(model.labels[index] == result[0]
+                       for index, result in zip(np.argmax(probabilities, axis=1), local_results))
+
+    # Каскад: локальная модель используется там, где ключевые слова неуверенны
+    cascade, escalated = [], 0
+    for keyword_result, local_result in zip(keyword_results, local_results):
+        if keyword_result[1] >= threshold:
+            cascade.append(keyword_result[0])
+        elif local_result[1] >= config.LOCAL_CLASSIFIER_THRESHOLD:
+            cascade.append(local_result[0])
+        else:
+            cascade.append(None)
+            escalated += 1
+    decided = [(label, result) for label, result in zip(expected, cascade) if result]
+    cascade_accuracy = np.mean([label == result for label, result in decided]) if decided else 0.0
+    keyword_escalated = np.mean([result[1] < threshold for result in keyword_results])
+
+    print(f"Проверка: {len(test)} документов")
+    print(f"Ключевые слова:       точность {keyword_accuracy:6.1%}, {keyword_us:8.1f} мкс/документ, "
+          f"в LLM ушло бы {keyword_escalated:6.1%}")
+    print(f"Локальная модель:     точность {local_accuracy:6.1%}, {local_us:8.1f} мкс/документ "
+          f"(пакетом {batch_us:.1f} мкс/документ)")
+    print(f"Каскад:               точность {cascade_accuracy:6.1%} на решённых, "
+          f"в LLM уходит {escalated / len(test):6.1%}")
+    print(f"{'✓' if batch_agrees else '✗'} Пакетная и поштучная классификация совпадают")
+
+if __name__ == "__main__":
+    main()
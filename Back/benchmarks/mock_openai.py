@@ -0,0 +1,264 @@
+"""
+Локальный OpenAI-совместимый сервер для тестов и бенчмарков
+Отвечает на /v1/chat/completions (в том числе потоково) с настраиваемой задержкой и запоминает запросы,
+число одновременных запросов и клиентские соединения.
+Batch API (/v1/files, /v1/batches) имитируется на файлах во временном каталоге
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Set
+
+def completion_response(content: str, model: str, prompt_tokens: int = 10, completion_tokens: int = 5) -> Dict[str, Any]:
+    """Ответ chat.completions в формате OpenAI"""
+    return {
+        "id": f"chatcmpl-{time.time_ns()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+def chunk_response(content: Optional[str], model: str, finish_reason: Optional[str] = None) -> Dict[str, Any]:
+    """Фрагмент потокового ответа chat.completions"""
+    delta = {"content": content} if content is not None else {}
+    return {
+        "id": "chatcmpl-stream",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+class MockOpenAIServer:
+    """OpenAI-совместимый сервер в фоновом потоке"""
+
+    def __init__(self, responder: Optional[Callable[[Dict[str, Any]], str]] = None, delay: float = 0.0,
+                 batch_polls: int = 1):
+        self.responder = responder or (lambda body: "ok")
+        self.delay = delay
+        self.stream_delay = 0.0  # пауза между фрагментами потокового ответа
+        self.status = 200  # код ответа: 500 или 429 имитируют сбой сервиса
+        # Сколько раз пакет возвращается со статусом in_progress, прежде чем будет выполнен
+        self.batch_polls = batch_polls
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self._files: Dict[str, Dict[str, Any]] = {}
+        self._files_dir: Optional[tempfile.TemporaryDirectory] = None
+        self.requests: List[Dict[str, Any]] = []
+        self.client_ports: Set[int] = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive: соединения клиента переиспользуются
+
+            def log_message(self, format, *args):
+                pass
+
+            def handle_one_request(self):
+                try:
+                    super().handle_one_request()
+                except (BrokenPipeError, ConnectionResetError):
+                    # Клиент не дождался ответа (таймаут или отключение во время потока)
+                    self.close_connection = True
+
+            def _send(self, status: int, payload: Dict[str, Any]):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_bytes(self, data: bytes):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _read_body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def do_POST(self):
+                if self.path.endswith("/files"):
+                    self._send(200, server._upload_file(self.headers.get("Content-Type", ""), self._read_body()))
+                    return
+                body = json.loads(self._read_body() or b"{}")
+                if self.path.endswith("/batches"):
+                    self._send(200, server._create_batch(body))
+                    return
+                if not self.path.endswith("/chat/completions"):
+                    self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+                with server._lock:
+                    server.requests.append(body)
+                    server.client_ports.add(self.client_address[1])
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    if server.delay:
+                        time.sleep(server.delay)
+                    content = server.responder(body)
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+                if server.status != 200:
+                    self._send(server.status, {"error": {"message": "Mock failure", "type": "server_error"}})
+                    return
+                if body.get("stream"):
+                    include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+                    self._send_stream(content, body.get("model", "mock"), include_usage)
+                    return
+                self._send(200, completion_response(content, body.get("model", "mock")))
+
+            def _send_stream(self, content: str, model: str, include_usage: bool = False):
+                """Ответ chat.completions в режиме stream: события SSE по словам, chunked-кодирование;
+                с include_usage последним идёт фрагмент с расходом токенов"""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                words = content.split(" ")
+                for index, word in enumerate(words):
+                    if index and server.stream_delay:
+                        time.sleep(server.stream_delay)
+                    delta = word if index == 0 else f" {word}"
+                    self._write_chunk(f"data: {json.dumps(chunk_response(delta, model))}\n\n")
+                self._write_chunk(f"data: {json.dumps(chunk_response(None, model, 'stop'))}\n\n")
+                if include_usage:
+                    usage_chunk = {**chunk_response(None, model), "choices": [],
+                                   "usage": completion_response(content, model)["usage"]}
+                    self._write_chunk(f"data: {json.dumps(usage_chunk)}\n\n")
+                self._write_chunk("data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, text: str):
+                data = text.encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_GET(self):
+                parts = self.path.rstrip("/").split("/")
+                if len(parts) >= 3 and parts[-3] == "files" and parts[-1] == "content" and parts[-2] in server._files:
+                    with open(server._files[parts[-2]]["path"], "rb") as f:
+                        self._send_bytes(f.read())
+                elif len(parts) >= 2 and parts[-2] == "batches" and parts[-1] in server.batches:
+                    self._send(200, server._poll_batch(parts[-1]))
+                else:
+                    self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        return Handler
+
+    def _store_file(self, filename: str, purpose: str, data: bytes) -> Dict[str, Any]:
+        """Сохранение файла в каталоге сервера"""
+        with self._lock:
+            file_id = f"file-{len(self._files) + 1}"
+            path = os.path.join(self._files_dir.name, file_id)
+            with open(path, "wb") as f:
+                f.write(data)
+            info = {"id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+                    "filename": filename, "purpose": purpose, "status": "processed"}
+            self._files[file_id] = {**info, "path": path}
+        return info
+
+    def _upload_file(self, content_type: str, body: bytes) -> Dict[str, Any]:
+        """Загрузка файла (multipart/form-data): поля purpose и file"""
+        message = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+        fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+        purpose = fields["purpose"].get_payload(decode=True).decode()
+        return self._store_file(fields["file"].get_filename() or "upload.jsonl", purpose,
+                                fields["file"].get_payload(decode=True))
+
+    def _create_batch(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Создание пакета; запросы выполняются при одном из следующих опросов"""
+        with self._lock:
+            batch_id = f"batch_{len(self.batches) + 1}"
+            self.batches[batch_id] = {
+                "id": batch_id, "object": "batch", "endpoint": body["endpoint"], "errors": None,
+                "input_file_id": body["input_file_id"], "completion_window": body["completion_window"],
+                "status": "validating", "created_at": int(time.time()), "metadata": body.get("metadata"),
+                "request_counts": {"total": 0, "completed": 0, "failed": 0}, "polls": 0,
+            }
+            return self._batch_payload(batch_id)
+
+    def _poll_batch(self, batch_id: str) -> Dict[str, Any]:
+        """Состояние пакета; после batch_polls опросов пакет выполняется"""
+        with self._lock:
+            batch = self.batches[batch_id]
+            batch["polls"] += 1
+            if batch["status"] == "completed" or batch["polls"] <= self.batch_polls:
+                if batch["status"] != "completed":
+                    batch["status"] = "in_progress"
+                return self._batch_payload(batch_id)
+            input_path = self._files[batch["input_file_id"]]["path"]
+        with open(input_path, encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+
+        output, errors = [], []
+        for line in lines:
+            self.requests.append(line["body"])
+            if self.status == 200:
+                response = {"status_code": 200, "request_id": line["custom_id"],
+                            "body": completion_response(self.responder(line["body"]), line["body"].get("model", "mock"))}
+                output.append({"id": f"batch_req_{len(output)}", "custom_id": line["custom_id"],
+                               "response": response, "error": None})
+            else:
+                errors.append({"id": f"batch_req_{len(errors)}", "custom_id": line["custom_id"], "response": {
+                    "status_code": self.status, "request_id": line["custom_id"],
+                    "body": {"error": {"message": "Mock failure", "type": "server_error"}}}, "error": None})
+
+        def write(records: List[Dict[str, Any]]) -> Optional[str]:
+            if not records:
+                return None
+            data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+            return self._store_file(f"{batch_id}_output.jsonl", "batch_output", data)["id"]
+
+        output_file_id, error_file_id = write(output), write(errors)
+        with self._lock:
+            batch.update(status="completed", output_file_id=output_file_id, error_file_id=error_file_id,
+                         completed_at=int(time.time()),
+                         request_counts={"total": len(lines), "completed": len(output), "failed": len(errors)})
+            return self._batch_payload(batch_id)
+
+    def _batch_payload(self, batch_id: str) -> Dict[str, Any]:
+        return {key: value for key, value in self.batches[batch_id].items() if key != "polls"}
+
+    def start(self) -> "MockOpenAIServer":
+        self._files_dir = tempfile.TemporaryDirectory(prefix="mock_openai_")
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.05},
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._files_dir.cleanup()
+
+    def __enter__(self) -> "MockOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
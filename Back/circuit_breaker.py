@@ -0,0 +1,81 @@
+"""
+Автоматический выключатель для внешних сервисов (OpenAI)
+После серии ошибок или таймаутов вызовы сразу отклоняются на время охлаждения,
+затем пропускается один пробный вызов: успех замыкает выключатель, ошибка снова размыкает
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from config import config
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(RuntimeError):
+    """Вызов отклонён: выключатель разомкнут"""
+
+class CircuitBreaker:
+    """Выключатель: closed — вызовы проходят, open — отклоняются, half_open — идёт пробный вызов"""
+
+    def __init__(self, name: str, failure_threshold: Optional[int] = None, cooldown: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold or config.OPENAI_BREAKER_FAILURE_THRESHOLD
+        self.cooldown = config.OPENAI_BREAKER_COOLDOWN if cooldown is None else cooldown
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow(self) -> bool:
+        """Можно ли выполнить вызов; после охлаждения пропускается один пробный вызов"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self.clock() - self._opened_at >= self.cooldown:
+                # Следующий пробный вызов — не раньше, чем через ещё один период охлаждения
+                self._state = HALF_OPEN
+                self._opened_at = self.clock()
+                return True
+            metrics.increment(f"{self.name}_breaker_rejected")
+            return False
+
+    def record_success(self) -> None:
+        """Успешный вызов замыкает выключатель"""
+        with self._lock:
+            self._failures = 0
+            if self._state != CLOSED:
+                logger.info(f"Выключатель {self.name} замкнут: сервис снова отвечает")
+                self._state = CLOSED
+
+    def record_failure(self) -> None:
+        """Ошибка или таймаут; после failure_threshold подряд (или ошибки пробного вызова) выключатель размыкается"""
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                logger.warning(f"Выключатель {self.name} разомкнут на {self.cooldown:.0f} с "
+                               f"после {self._failures} ошибок подряд")
+                metrics.increment(f"{self.name}_breaker_opened")
+                self._state = OPEN
+                self._opened_at = self.clock()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Состояние для /api-status: разомкнутый выключатель, у которого истекло охлаждение, показывается
+        как half_open — следующий вызов будет пробным, хотя allow() ещё не вызывался"""
+        with self._lock:
+            retry_in = max(0.0, self.cooldown - (self.clock() - self._opened_at)) if self._state != CLOSED else 0.0
+            state = HALF_OPEN if self._state == OPEN and retry_in <= 0 else self._state
+            return {"state": state, "consecutive_failures": self._failures, "retry_in": round(retry_in, 1)}
@@ -0,0 +1,16 @@
+"""
+Общие настройки тестов: модули приложения работают с базой в памяти, временным кэшем и журналом LLM
+"""
+
+import os
+import tempfile
+
+from document_storage import DocumentStorage, set_storage
+from llm_cache import llm_cache
+from llm_usage import llm_usage
+
+set_storage(DocumentStorage(":memory:"))
+
+# Кэш ответов и журнал вызовов LLM — во временном каталоге, а не в каталоге проекта
+llm_cache.db_path = os.path.join(tempfile.mkdtemp(), "llm_cache.db")
+llm_usage.db_path = os.path.join(tempfile.mkdtemp(), "llm_usage.db")
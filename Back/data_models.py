@@ -17,6 +17,7 @@ class DocumentData:
     fields: List[DocumentField]
     raw_text: str
     confidence: float = 1.0
+    language: Optional[str] = None  # язык, определённый по тексту документа (ro / ru)
 
 # --- Pydantic модели для API ---
 
@@ -28,6 +29,7 @@ class UploadResponse(BaseModel):
     confidence: Optional[float] = None
     extracted_data: Optional[Dict[str, Any]] = None
     language: str = "ru"
+    detected_language: Optional[str] = None
 
 class DocumentResponse(BaseModel):
     """Модель документа для API ответов"""
@@ -40,6 +42,7 @@ class DocumentResponse(BaseModel):
     is_valid: bool
     validation_errors: List[str]
     status: str
+    language: Optional[str] = None
 
 class ReportRequest(BaseModel):
     """Запрос на генерацию отчета"""
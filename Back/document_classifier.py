@@ -1,9 +1,15 @@
 import re
 import logging
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 from dataclasses import dataclass
 from datetime import datetime
 
+import numpy as np
+
+from config import config
+from field_extractor import field_extractor
+from keyword_matcher import KeywordAutomaton
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -43,7 +49,7 @@ class MoldovanDocumentClassifier:
                 "act de achiziție", "act achizitie", "акт покупки",
                 "purchase act", "автомобиль", "машина", "auto"
             ],
-            "ordin_plata": [
+            "ordine_plata": [
                 "ordin de plată", "ordin plata", "платежное поручение",
                 "payment order", "банк", "bank", "iban"
             ],
@@ -52,96 +58,45 @@ class MoldovanDocumentClassifier:
                 "advance report", "командировка", "business trip"
             ]
         }
-        
-        # Паттерны для извлечения полей
-        self.field_patterns = {
-            "factura_fiscala": {
-                "number": r"(?:factură|factura|invoice|счет)[\s\-\#]*[№\#]?\s*([A-Z0-9\-]+)",
-                "date": r"(?:data|дата|date)[\s:]*(\d{1,2}[\.\/\-]\d{1,2}[\.\/\-]\d{2,4})",
-                "seller": r"(?:furnizor|поставщик|seller)[\s:]*([^\n]+)",
-                "buyer": r"(?:client|cumpărător|покупатель|buyer)[\s:]*([^\n]+)",
-                "idno": r"(?:idno|cod fiscal|идентификационный номер)[\s:]*([0-9]{13})",
-                "vat_amount": r"(?:tva|nds|ндс)[\s:]*([0-9,\.]+)",
-                "total_amount": r"(?:total|итого|suma totala)[\s:]*([0-9,\.]+)"
-            },
-            "bon_fiscal": {
-                "items": r"([^\n]+)\s+([0-9,\.]+)\s+([0-9,\.]+)",
-                "quantity": r"(?:cantitate|количество|qty)[\s:]*([0-9,\.]+)",
-                "total_amount": r"(?:total|итого|suma totala)[\s:]*([0-9,\.]+)",
-                "cash_register": r"(?:terminal|касса|cash)[\s:]*([A-Z0-9\-]+)"
-            },
-            "stat_plata": {
-                "employee": r"([А-Яа-яA-Za-z\s]+)\s+([А-Яа-яA-Za-z\s]+)",
-                "position": r"(?:должность|position)[\s:]*([^\n]+)",
-                "salary": r"(?:зарплата|salary)[\s:]*([0-9,\.]+)",
-                "taxes": r"(?:налоги|taxes)[\s:]*([0-9,\.]+)",
-                "contributions": r"(?:взносы|contributions)[\s:]*([0-9,\.]+)"
-            },
-            "act_achizitie": {
-                "car_data": r"(?:автомобиль|машина|auto)[\s:]*([^\n]+)",
-                "amount": r"(?:сумма|amount)[\s:]*([0-9,\.]+)",
-                "buyer": r"(?:покупатель|buyer)[\s:]*([^\n]+)",
-                "seller": r"(?:продавец|seller)[\s:]*([^\n]+)"
-            },
-            "ordin_plata": {
-                "amount": r"(?:сумма|amount)[\s:]*([0-9,\.]+)",
-                "purpose": r"(?:назначение|purpose)[\s:]*([^\n]+)",
-                "bank": r"(?:банк|bank)[\s:]*([^\n]+)",
-                "iban": r"(?:iban)[\s:]*([A-Z]{2}[0-9]{2}[A-Z0-9]{4}[0-9]{7})"
-            },
-            "raport_avans": {
-                "amount": r"(?:сумма|amount)[\s:]*([0-9,\.]+)",
-                "date": r"(?:дата|date)[\s:]*(\d{1,2}[\.\/\-]\d{1,2}[\.\/\-]\d{2,4})",
-                "business_trip": r"(?:командировка|business trip)[\s:]*([^\n]+)",
-                "spent": r"(?:потрачено|spent)[\s:]*([0-9,\.]+)",
-                "remaining": r"(?:остаток|remaining)[\s:]*([0-9,\.]+)"
-            }
-        }
+        # Все ключевые слова всех типов ищутся одним автоматом
+        self._automaton = KeywordAutomaton(self.doc_type_keywords)
     
     def classify_document(self, text: str) -> str:
         """Определяет тип документа на основе текста"""
-        text_lower = text.lower()
-        
-        # Подсчитываем совпадения для каждого типа документа
-        doc_scores = {}
-        for doc_type, keywords in self.doc_type_keywords.items():
-            score = 0
-            for keyword in keywords:
-                if keyword.lower() in text_lower:
-                    score += 1
-            doc_scores[doc_type] = score
-        
-        # Возвращаем тип с наибольшим количеством совпадений
-        if doc_scores:
-            best_type = max(doc_scores, key=doc_scores.get)
-            if doc_scores[best_type] > 0:
-                logger.info(f"Определен тип документа: {best_type} (счет: {doc_scores[best_type]})")
-                return best_type
-        
-        logger.warning("Тип документа не определен")
-        return "unknown"
+        return self.classify_batch([text])[0]
+    
+    def classify_batch(self, texts: Sequence[str]) -> List[str]:
+        """Определяет типы пакета документов по матрице совпадений ключевых слов"""
+        # Количество совпадений для каждого типа документа: (текст × слово) @ (слово × тип)
+        counts = self._automaton.count_batch(texts)
+        types = []
+        for row in counts:
+            # Тип с наибольшим количеством совпадений
+            best = int(np.argmax(row)) if len(row) else 0
+            if len(row) and row[best] > 0:
+                best_type = self._automaton.labels[best]
+                logger.info(f"Определен тип документа: {best_type} (счет: {int(row[best])})")
+                types.append(best_type)
+            else:
+                logger.warning("Тип документа не определен")
+                types.append("unknown")
+        return types
     
     def extract_fields(self, text: str, doc_type: str) -> List[DocumentField]:
         """Извлекает поля из документа определенного типа"""
         fields = []
         
-        if doc_type not in self.field_patterns:
-            logger.warning(f"Паттерны для типа документа {doc_type} не найдены")
-            return fields
-        
-        patterns = self.field_patterns[doc_type]
-        
-        for field_name, pattern in patterns.items():
-            matches = re.findall(pattern, text, re.IGNORECASE | re.MULTILINE)
-            if matches:
-                # Берем первое совпадение
-                value = matches[0] if isinstance(matches[0], str) else " ".join(matches[0])
-                fields.append(DocumentField(
-                    name=field_name,
-                    value=value.strip(),
-                    confidence=0.8
-                ))
-                logger.info(f"Извлечено поле {field_name}: {value}")
+        # Правила извлечения общие с DocumentProcessor и берутся из конфигурации типов документов
+        if not config.get_document_type_config(doc_type):
+            logger.warning(f"Правила для типа документа {doc_type} не найдены, извлекаются только общие поля")
+        
+        for field_name, value in field_extractor.extract(text, doc_type).items():
+            fields.append(DocumentField(
+                name=field_name,
+                value=str(value),
+                confidence=0.8
+            ))
+            logger.info(f"Извлечено поле {field_name}: {value}")
         
         return fields
     
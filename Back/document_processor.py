@@ -5,27 +5,58 @@
 
 import os
 import re
+import json
+import hashlib
+import tempfile
 import logging
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, List, Optional, Sequence, Tuple, Union, Any
 from pathlib import Path
 import pytesseract
 from PIL import Image
 import fitz  # PyMuPDF
-from openai import OpenAI
-from config import config
+import numpy as np
+from config import config, DocumentTypeConfig
 from i18n import i18n
 from data_models import DocumentData, DocumentField
+from keyword_matcher import document_type_keywords
+from field_extractor import field_extractor
+from local_classifier import local_classifier
+from ocr_language import TESSERACT_MODELS, detect_text_language, tesseract_models, ocr_language_detector
+from image_preprocessing import image_preprocessor
+from layout_ocr import OcrLine, lines_from_data, merge_layout_text
+from metrics import metrics
+from llm_gateway import get_gateway
+from single_flight import SingleFlight
+from latency_budget import latency_budget
+from llm_usage import llm_usage, llm_usage_scope, usage_scope
+from prompt_compaction import compact_text
 
 logger = logging.getLogger(__name__)
 
+# Типы документов для промптов OpenAI
+OPENAI_DOCUMENT_TYPES = """- factura_fiscala (счет-фактура)
+            - bon_fiscal (фискальный чек)
+            - stat_plata (ведомость на выплату)
+            - declaratie_tva (декларация НДС)
+            - contract (договор)
+            - aviz_expeditie (накладная)
+            - ordine_plata (платёжное поручение)
+            - chitanta (квитанция)"""
+
+def file_digest(file_path: str) -> str:
+    """SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 class DocumentProcessor:
     """Расширенный процессор документов для Молдовы"""
     
     def __init__(self):
         self.tesseract_path = config.TESSERACT_PATH
-        self.openai_api_key = config.OPENAI_API_KEY
-        self.openai_model = config.OPENAI_MODEL
         self.confidence_threshold = config.OCR_CONFIDENCE_THRESHOLD
         self.classification_threshold = config.CLASSIFICATION_CONFIDENCE_THRESHOLD
         
@@ -33,23 +64,62 @@ class DocumentProcessor:
         if self.tesseract_path:
             pytesseract.pytesseract.tesseract_cmd = self.tesseract_path
         
-        # Настройка OpenAI
-        self.client = None
-        if self.openai_api_key:
-            self.client = OpenAI(
-                api_key=self.openai_api_key,
-                timeout=30.0  # 30 секунд таймаут для запросов
-            )
+        # Автоматы ключевых слов и правила извлечения полей строятся при запуске, а не при первом документе
+        document_type_keywords.get_automaton(config.DEFAULT_LANGUAGE)
+        field_extractor.get_families()
+        
+        # Одинаковые файлы, загруженные одновременно, обрабатываются один раз
+        self._single_flight = SingleFlight("documents")
+        
+        # Доля изображений, для которых быстрого OCR оказалось недостаточно
+        metrics.register_ratio("ocr_escalation_rate", "ocr_progressive_escalated", "ocr_progressive_documents")
+        # Доля страниц с шаблоном, которые пришлось распознать целиком
+        metrics.register_ratio("ocr_layout_fallback_rate", "ocr_layout_fallbacks", "ocr_layout_pages")
+        
+        # Запросы к LLM идут через общие шлюзы поставщиков (OpenAI или локальный OpenAI-совместимый сервер)
+        self.client = self._provider_gateway(config.LLM_CLASSIFICATION_PROVIDER)
+        self.enhancement_client = self._provider_gateway(config.LLM_ENHANCEMENT_PROVIDER)
     
-    def extract_text_from_image(self, image_path: str, language: str = "ru") -> Tuple[str, float]:
+    @staticmethod
+    def _provider_gateway(provider: str):
+        """Шлюз поставщика LLM или None, если поставщик не настроен"""
+        try:
+            gateway = get_gateway(provider)
+        except ValueError as e:
+            logger.error(f"Ошибка настройки LLM: {e}")
+            return None
+        return gateway if gateway.available else None
+    
+    def extract_text_from_image(self, image_path: str, language: str = "ru",
+                                multilingual: bool = False) -> Tuple[str, float]:
         """Извлечение текста из изображения с помощью Tesseract"""
         try:
-            # Определение языков для OCR
-            lang_map = {"ru": "rus", "ro": "ron"}
-            ocr_lang = lang_map.get(language, "rus+ron+eng")
+            # Открытие изображения и подготовка к OCR (поворот, уменьшение, выравнивание, бинаризация)
+            image = image_preprocessor.open(image_path)
+            return self.ocr_page(image, language, multilingual)
+        except Exception as e:
+            logger.error(f"Ошибка OCR: {e}")
+            return "", 0.0
+    
+    def ocr_page(self, image: Image.Image, language: str = "ru", multilingual: bool = False) -> Tuple[str, float]:
+        """Распознавание подготовленной страницы; multilingual — все модели и вся страница без шаблонов"""
+        try:
+            if multilingual:
+                ocr_lang = tesseract_models(language if language in TESSERACT_MODELS else config.DEFAULT_LANGUAGE, mixed=True)
+            elif config.OCR_LANGUAGE_DETECTION:
+                # Определение языков для OCR: по самой странице, язык из запроса — только запасной вариант
+                page_language = ocr_language_detector.detect(image, language)
+                ocr_lang = page_language.tesseract
+                logger.info(f"Язык страницы: {page_language.language} ({page_language.method}), модели: {ocr_lang}")
+            else:
+                lang_map = {"ru": "rus", "ro": "ron"}
+                ocr_lang = lang_map.get(language, "rus+ron+eng")
             
-            # Открытие изображения
-            image = Image.open(image_path)
+            # Для типов с шаблоном в полном разрешении распознаются только нужные области
+            if config.OCR_LAYOUT_ENABLED and not multilingual:
+                layout_result = self.extract_text_by_layout(image, ocr_lang, language)
+                if layout_result:
+                    return layout_result
             
             # Извлечение текста с настройками для Молдовы
             custom_config = f'--oem 3 --psm 6 -l {ocr_lang}'
@@ -69,6 +139,80 @@ class DocumentProcessor:
             logger.error(f"Ошибка OCR: {e}")
             return "", 0.0
     
+    def ocr_fast(self, image: Image.Image, language: str = "ru") -> Tuple[str, float]:
+        """Быстрый проход: уменьшенная страница, только LSTM (--oem 1) и одна языковая модель"""
+        try:
+            small = image.copy()
+            small.thumbnail((config.OCR_FAST_MAX_SIDE, config.OCR_FAST_MAX_SIDE))
+            if config.OCR_LANGUAGE_DETECTION:
+                page_language = ocr_language_detector.detect(small, language).language
+            else:
+                page_language = language if language in TESSERACT_MODELS else config.DEFAULT_LANGUAGE
+            
+            data = pytesseract.image_to_data(small, config=f'--oem 1 --psm 6 -l {tesseract_models(page_language)}',
+                                             output_type=pytesseract.Output.DICT)
+            lines = lines_from_data(data, small.size)
+            text, avg_confidence = merge_layout_text(lines, [])
+            logger.info(f"Быстрый OCR: {len(text)} символов, уверенность: {avg_confidence:.2f}")
+            return text, avg_confidence
+            
+        except Exception as e:
+            logger.error(f"Ошибка быстрого OCR: {e}")
+            return "", 0.0
+    
+    def ocr_lines(self, image: Image.Image, ocr_lang: str, psm: int = 6,
+                  page_size: Optional[Tuple[int, int]] = None, offset: Tuple[int, int] = (0, 0)) -> List[OcrLine]:
+        """Строки текста с положением на странице (для областей — с учётом их смещения)"""
+        data = pytesseract.image_to_data(image, config=f'--oem 3 --psm {psm} -l {ocr_lang}',
+                                         output_type=pytesseract.Output.DICT)
+        return lines_from_data(data, page_size or image.size, offset)
+    
+    def extract_text_by_layout(self, image: Image.Image, ocr_lang: str,
+                               language: str = "ru") -> Optional[Tuple[str, float]]:
+        """OCR по шаблону типа: черновой проход по уменьшенной странице определяет тип,
+        затем в полном разрешении распознаются только области шаблона (None — шаблон неприменим)"""
+        try:
+            draft = image.copy()
+            draft.thumbnail((config.OCR_DRAFT_MAX_SIDE, config.OCR_DRAFT_MAX_SIDE))
+            draft_lines = self.ocr_lines(draft, ocr_lang)
+            draft_text = "\n".join(line.text for line in draft_lines)
+            
+            detected = detect_text_language(draft_text)
+            draft_language = detected.language if detected else language
+            # Ошибка типа не страшна: при неверном шаблоне в областях не найдутся обязательные поля
+            doc_type, _, _ = self.classify_batch([draft_text], draft_language, use_openai=False)[0]
+            doc_config = config.get_document_type_config(doc_type)
+            if not doc_config or not doc_config.ocr_regions:
+                return None
+            
+            regions = []
+            for region in doc_config.ocr_regions:
+                box = region.pixel_box(image.size)
+                regions.append((region, self.ocr_lines(image.crop(box), ocr_lang, region.psm, image.size, box[:2])))
+            text, avg_confidence = merge_layout_text(draft_lines, regions)
+            metrics.increment("ocr_layout_pages")
+            
+            # Страница распознаётся целиком, только если обязательное поле есть в черновике, но не в областях:
+            # поля, которых нет на всей странице, полный OCR не найдёт
+            missing = self.missing_required_fields(doc_config, self.extract_document_data(text, doc_config,
+                                                                                          draft_language))
+            if missing:
+                draft_data = self.extract_document_data(draft_text, doc_config, draft_language)
+                lost = [name for name in missing if draft_data.get(name)]
+                if lost:
+                    metrics.increment("ocr_layout_fallbacks")
+                    logger.info(f"OCR по шаблону {doc_type}: в областях нет полей {', '.join(lost)}, "
+                                f"распознаётся вся страница")
+                    return None
+            
+            logger.info(f"OCR по шаблону {doc_type}: {len(regions)} областей, {len(text)} символов, "
+                        f"уверенность: {avg_confidence:.2f}")
+            return text, avg_confidence
+            
+        except Exception as e:
+            logger.error(f"Ошибка OCR по шаблону: {e}")
+            return None
+    
     def extract_text_from_pdf(self, pdf_path: str, language: str = "ru") -> Tuple[str, float]:
         """Извлечение текста из PDF с поддержкой молдавских документов"""
         try:
@@ -94,10 +238,10 @@ class DocumentProcessor:
                         
                         if pix.n - pix.alpha < 4:  # GRAY or RGB
                             img_data = pix.tobytes("png")
-                            img_path = f"temp_img_{page_num}_{img_index}.png"
-                            
-                            with open(img_path, "wb") as f:
+                            # Уникальный временный файл: несколько PDF могут обрабатываться одновременно
+                            with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as f:
                                 f.write(img_data)
+                                img_path = f.name
                             
                             ocr_text, confidence = self.extract_text_from_image(img_path, language)
                             if ocr_text:
@@ -124,144 +268,127 @@ class DocumentProcessor:
     
     def classify_document(self, text: str, language: str = "ru") -> Tuple[str, float, Dict[str, Any]]:
         """Классификация документа по молдавским типам"""
+        return self.classify_batch([text], language)[0]
+    
+    def classify_batch(self, texts: Sequence[str], language: Union[str, Sequence[str]] = "ru",
+                       use_openai: bool = True,
+                       ai_results: Optional[Sequence[Optional[Dict[str, Any]]]] = None) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """Классификация пакета текстов: типы оцениваются матричными операциями для всего пакета,
+        данные извлекаются один раз для каждого текста; ai_results — уже полученные ответы OpenAI"""
+        languages = [language] * len(texts) if isinstance(language, str) else list(language)
         try:
-            text_lower = text.lower()
-            best_match = None
-            best_confidence = 0.0
-            extracted_data = {}
-            
-            # Поиск по ключевым словам
-            for doc_type in config.MOLDOVAN_DOCUMENT_TYPES:
-                keywords = doc_type.keywords_ro if language == "ro" else doc_type.keywords_ru
-                matches = 0
+            best_types: List[Optional[DocumentTypeConfig]] = [None] * len(texts)
+            confidences = np.zeros(len(texts))
+            
+            # Этап 1: оценка всех типов по ключевым словам, одна матрица на язык
+            for lang in set(languages):
+                rows = [index for index, text_lang in enumerate(languages) if text_lang == lang]
+                type_ids, scores = document_type_keywords.score_batch([texts[index] for index in rows], lang)
+                if not type_ids:
+                    continue
+                best_columns = np.argmax(scores, axis=1)
+                for row, column, row_scores in zip(rows, best_columns, scores):
+                    if row_scores[column] > 0:
+                        best_types[row] = config.get_document_type_config(type_ids[column])
+                        confidences[row] = row_scores[column]
+            
+            confident = confidences >= self.classification_threshold
+            
+            # Этап 1б: локальная модель для документов, где ключевых слов недостаточно
+            uncertain = np.flatnonzero(~confident)
+            if len(uncertain) and config.LOCAL_CLASSIFIER_ENABLED:
+                local_result = self.classify_locally([texts[index] for index in uncertain])
+                if local_result:
+                    labels, probabilities = local_result
+                    for index, row in zip(uncertain, probabilities):
+                        best = int(np.argmax(row))
+                        local_type = config.get_document_type_config(labels[best])
+                        if local_type and row[best] >= config.LOCAL_CLASSIFIER_THRESHOLD:
+                            best_types[index] = local_type
+                            confidences[index] = row[best]
+                            confident[index] = True
+            
+            # Запросы к OpenAI для всех неуверенных документов отправляются сразу и выполняются параллельно
+            ai_classifications = {}
+            uncertain_rows = [int(index) for index in np.flatnonzero(~confident)]
+            ai_rows = uncertain_rows if use_openai and self.client else []
+            if ai_results is not None:
+                ai_classifications = {index: ai_results[index] for index in uncertain_rows}
+            elif ai_rows:
+                ai_classifications = dict(zip(ai_rows, self.classify_with_openai_batch(
+                    [texts[index] for index in ai_rows], [languages[index] for index in ai_rows])))
+            
+            results = []
+            for index, text in enumerate(texts):
+                best_type = best_types[index]
+                best_confidence = float(confidences[index])
+                extracted_data = {}
                 
-                for keyword in keywords:
-                    if keyword.lower() in text_lower:
-                        matches += 1
+                # Этап 2: извлечение данных один раз, только для победившего типа
+                best_match = best_type.type_id if best_type else None
+                try:
+                    if best_type:
+                        extracted_data = self.extract_document_data(text, best_type, languages[index])
+                    
+                    # Если ни ключевые слова, ни локальная модель не уверены, используем ответ OpenAI
+                    ai_classification = self._coerce_ai_classification(ai_classifications.get(index))
+                    if ai_classification:
+                        best_match, best_confidence, ai_data = ai_classification
+                        extracted_data = {**extracted_data, **ai_data}
+                except Exception as e:
+                    # Ошибка одного документа не должна сбрасывать классификацию остальных
+                    logger.error(f"Ошибка классификации документа {index}: {e}")
                 
-                confidence = matches / len(keywords) if keywords else 0
+                if not best_match:
+                    best_match = "unknown"
+                    best_confidence = 1.0
                 
-                if confidence > best_confidence:
-                    best_confidence = confidence
-                    best_match = doc_type.type_id
-                    
-                    # Извлечение данных для найденного типа
-                    extracted_data = self.extract_document_data(text, doc_type, language)
-            
-            # Если уверенность ниже порога, используем OpenAI для классификации
-            if best_confidence < self.classification_threshold and self.openai_api_key:
-                ai_classification = self.classify_with_openai(text, language)
-                if ai_classification:
-                    best_match = ai_classification.get("type", "unknown")
-                    best_confidence = ai_classification.get("confidence", 0.0)
-                    extracted_data.update(ai_classification.get("data", {}))
+                logger.info(f"Документ классифицирован: {best_match} (уверенность: {best_confidence:.2f})")
+                results.append((best_match, best_confidence, extracted_data))
             
-            if not best_match:
-                best_match = "unknown"
-                best_confidence = 1.0
-            
-            logger.info(f"Документ классифицирован: {best_match} (уверенность: {best_confidence:.2f})")
-            return best_match, best_confidence, extracted_data
+            return results
             
         except Exception as e:
             logger.error(f"Ошибка классификации: {e}")
-            return "unknown", 1.0, {}
+            return [("unknown", 1.0, {}) for _ in texts]
+    
+    @staticmethod
+    def _coerce_ai_classification(result: Any) -> Optional[Tuple[str, float, Dict[str, Any]]]:
+        """Тип, уверенность и поля из ответа OpenAI или None, если ответ непригоден:
+        тип должен быть известным, уверенность — числом от 0 до 1, поля — словарём"""
+        if not isinstance(result, dict):
+            return None
+        doc_type = result.get("type")
+        if doc_type != "unknown" and not (isinstance(doc_type, str) and config.get_document_type_config(doc_type)):
+            logger.warning(f"OpenAI вернул неизвестный тип документа: {doc_type!r}")
+            return None
+        try:
+            confidence = float(result.get("confidence") or 0.0)
+        except (TypeError, ValueError):
+            confidence = 0.0
+        confidence = min(max(confidence, 0.0), 1.0) if np.isfinite(confidence) else 0.0
+        data = result.get("data")
+        return doc_type, confidence, data if isinstance(data, dict) else {}
+    
+    def classify_locally(self, texts: Sequence[str]) -> Optional[Tuple[List[str], np.ndarray]]:
+        """Типы и вероятности локальной модели для пакета (None, если модель ещё не обучена)"""
+        try:
+            model = local_classifier.get()
+            if not model:
+                return None
+            return model.labels, model.predict_proba(texts)
+        except Exception as e:
+            logger.error(f"Ошибка локальной классификации: {e}")
+            return None
     
     def extract_document_data(self, text: str, doc_type_config, language: str = "ru") -> Dict[str, Any]:
         """Извлечение данных из документа по типу"""
         data = {}
-        text_lines = text.split('\n')
         
         try:
-            # Извлечение номера документа
-            number_patterns = [
-                r'№\s*(\d+)',
-                r'Nr\.?\s*(\d+)',
-                r'Numărul\s*(\d+)',
-                r'Номер\s*(\d+)',
-                r'(\d{6,})'  # Длинные номера
-            ]
-            
-            for pattern in number_patterns:
-                match = re.search(pattern, text, re.IGNORECASE)
-                if match:
-                    data['number'] = match.group(1)
-                    break
-            
-            # Извлечение даты
-            date_patterns = [
-                r'(\d{1,2})\.(\d{1,2})\.(\d{4})',
-                r'(\d{1,2})/(\d{1,2})/(\d{4})',
-                r'(\d{1,2})-(\d{1,2})-(\d{4})'
-            ]
-            
-            for pattern in date_patterns:
-                match = re.search(pattern, text)
-                if match:
-                    day, month, year = match.groups()
-                    data['date'] = f"{day.zfill(2)}.{month.zfill(2)}.{year}"
-                    break
-            
-            # Извлечение сумм
-            amount_patterns = [
-                r'Total[:\s]*([\d\s,\.]+)\s*[Lл]',
-                r'Suma[:\s]*([\d\s,\.]+)\s*[Lл]',
-                r'Сумма[:\s]*([\d\s,\.]+)\s*[Lл]',
-                r'([\d\s,\.]+)\s*[Lл]'
-            ]
-            
-            for pattern in amount_patterns:
-                match = re.search(pattern, text, re.IGNORECASE)
-                if match:
-                    amount_str = match.group(1).replace(' ', '').replace(',', '.')
-                    try:
-                        data['total_amount'] = float(amount_str)
-                        break
-                    except ValueError:
-                        continue
-            
-            # Извлечение НДС
-            vat_patterns = [
-                r'TVA[:\s]*([\d\s,\.]+)\s*[Lл]',
-                r'НДС[:\s]*([\d\s,\.]+)\s*[Lл]',
-                r'(\d+)\s*%'
-            ]
-            
-            for pattern in vat_patterns:
-                match = re.search(pattern, text, re.IGNORECASE)
-                if match:
-                    vat_str = match.group(1).replace(' ', '').replace(',', '.')
-                    try:
-                        data['vat_amount'] = float(vat_str)
-                        break
-                    except ValueError:
-                        continue
-            
-            # Извлечение IDNO
-            idno_patterns = [
-                r'IDNO[:\s]*(\d{13})',
-                r'Cod fiscal[:\s]*(\d{13})',
-                r'Налоговый код[:\s]*(\d{13})'
-            ]
-            
-            for pattern in idno_patterns:
-                match = re.search(pattern, text, re.IGNORECASE)
-                if match:
-                    data['idno'] = match.group(1)
-                    break
-            
-            # Извлечение названий компаний
-            company_patterns = [
-                r'SRL\s+["\']([^"\']+)["\']',
-                r'ООО\s+["\']([^"\']+)["\']',
-                r'SA\s+["\']([^"\']+)["\']'
-            ]
-            
-            for pattern in company_patterns:
-                match = re.search(pattern, text, re.IGNORECASE)
-                if match:
-                    data['company'] = match.group(1).strip()
-                    break
+            # Общие поля и поля типа — по скомпилированным правилам из конфигурации
+            doc_type = doc_type_config.type_id if doc_type_config else None
+            data = field_extractor.extract(text, doc_type)
             
             logger.info(f"Извлечено данных: {len(data)} полей")
             return data
@@ -272,27 +399,47 @@ class DocumentProcessor:
     
     def classify_with_openai(self, text: str, language: str = "ru") -> Optional[Dict[str, Any]]:
         """Классификация документа с помощью OpenAI"""
-        try:
-            if not self.client:
-                return None
-            
-            # Подготовка промпта
-            lang_text = "румынском" if language == "ro" else "русском"
-            prompt = f"""
+        return self.classify_with_openai_batch([text], [language])[0]
+    
+    def classify_with_openai_batch(self, texts: Sequence[str], languages: Sequence[str]) -> List[Optional[Dict[str, Any]]]:
+        """Классификация нескольких документов с помощью OpenAI: запросы выполняются шлюзом параллельно"""
+        if not self.client:
+            return [None] * len(texts)
+        
+        futures = []
+        for text, language in zip(texts, languages):
+            try:
+                futures.append(self.client.submit(**self.classification_request(text, language)))
+            except Exception as e:
+                logger.error(f"Ошибка OpenAI: {e}")
+                futures.append(None)
+        return [self._parse_classification(future) if future else None for future in futures]
+    
+    def classification_request(self, text: str, language: str) -> Dict[str, Any]:
+        """Параметры запроса chat.completions для классификации (общие для шлюза и Batch API);
+        модель задаёт шлюз поставщика или клиент Batch API"""
+        return {
+            "messages": [
+                {"role": "system", "content": "Ты эксперт по классификации документов Молдовы."},
+                {"role": "user", "content": self._classification_prompt(text, language)}
+            ],
+            "max_tokens": 500,
+            "temperature": 0.1
+        }
+    
+    def _classification_prompt(self, text: str, language: str) -> str:
+        """Промпт классификации документа"""
+        lang_text = "румынском" if language == "ro" else "русском"
+        document_text = compact_text(text, config.OPENAI_CLASSIFICATION_PROMPT_TOKENS, language,
+                                     self.client.model if self.client else None).text
+        return f"""
             Проанализируй этот документ на {lang_text} языке и определи его тип.
             
             Возможные типы документов:
-            - factura_fiscala (счет-фактура)
-            - bon_fiscal (фискальный чек)
-            - stat_plata (ведомость на выплату)
-            - declaratie_tva (декларация НДС)
-            - contract (договор)
-            - aviz_expeditie (накладная)
-            - ordine_plata (платёжное поручение)
-            - chitanta (квитанция)
+            {OPENAI_DOCUMENT_TYPES}
             
             Текст документа:
-            {text[:2000]}
+            {document_text}
             
             Ответь в формате JSON:
             {{
@@ -306,18 +453,81 @@ class DocumentProcessor:
                 }}
             }}
             """
+    
+    def enhance_and_classify_with_openai(self, text: str, language: str = "ru") -> Optional[Dict[str, Any]]:
+        """Исправление текста OCR и классификация одним запросом к OpenAI в JSON-режиме.
+        Возвращает исправленный текст (text; только если текст вошёл в промпт целиком), тип (type),
+        уверенность (confidence) и поля (data)"""
+        if not self.enhancement_client:
+            return None
+        
+        lang_text = "румынском" if language == "ro" else "русском"
+        compacted = compact_text(text, config.OPENAI_ENHANCEMENT_PROMPT_TOKENS, language,
+                                 self.enhancement_client.model)
+        document_text = compacted.text
+        prompt = f"""
+            Текст извлечен OCR из бухгалтерского документа на {lang_text} языке.
+            1. Исправь ошибки OCR, сохрани ключевую информацию, такую как даты, номера, суммы, названия компаний.
+            2. Определи тип документа.
             
-            response = self.client.chat.completions.create(
-                model=self.openai_model,
+            Возможные типы документов:
+            {OPENAI_DOCUMENT_TYPES}
+            
+            Текст документа:
+            {document_text}
+            
+            Ответь в формате JSON:
+            {{
+                "text": "исправленный текст документа",
+                "type": "тип_документа",
+                "confidence": 0.95,
+                "data": {{
+                    "number": "номер",
+                    "date": "дата",
+                    "amount": "сумма",
+                    "company": "компания"
+                }}
+            }}
+            """
+        try:
+            future = self.enhancement_client.submit(
                 messages=[
-                    {"role": "system", "content": "Ты эксперт по классификации документов Молдовы."},
+                    {"role": "system", "content": "Ты эксперт по документам Молдовы: исправляешь текст после OCR "
+                                                  "и определяешь тип документа."},
                     {"role": "user", "content": prompt}
                 ],
-                max_tokens=500,
-                temperature=0.1
+                max_tokens=1500,
+                temperature=0.1,
+                response_format={"type": "json_object"}
             )
-            
-            result_text = response.choices[0].message.content.strip()
+        except Exception as e:
+            logger.error(f"Ошибка OpenAI: {e}")
+            return None
+        
+        result = self._parse_classification(future)
+        if result is not None and not isinstance(result, dict):
+            logger.warning(f"OpenAI вернул неожиданный JSON: {result}")
+            return None
+        if result and compacted.dropped_lines:
+            # Исправленный текст собран из сжатого промпта: строки, не попавшие в промпт, в нём потеряны
+            result.pop("text", None)
+        if result:
+            logger.info("Текст улучшен и классифицирован одним запросом к OpenAI")
+        return result
+    
+    def _parse_classification(self, future) -> Optional[Dict[str, Any]]:
+        """Ожидание ответа OpenAI и разбор JSON классификации"""
+        try:
+            response = future.result()
+        except Exception as e:
+            logger.error(f"Ошибка OpenAI: {e}")
+            return None
+        return self.parse_classification_response(response)
+    
+    def parse_classification_response(self, response) -> Optional[Dict[str, Any]]:
+        """Разбор JSON классификации из ответа chat.completions"""
+        try:
+            result_text = (response.choices[0].message.content or "").strip()
             
             # Проверяем, что ответ не пустой
             if not result_text:
@@ -343,6 +553,11 @@ class DocumentProcessor:
             logger.error(f"Ошибка OpenAI: {e}")
             return None
     
+    @staticmethod
+    def missing_required_fields(doc_config: DocumentTypeConfig, extracted_data: Dict[str, Any]) -> List[str]:
+        """Обязательные поля типа, которые не удалось извлечь"""
+        return [field for field in doc_config.required_fields if not extracted_data.get(field)]
+    
     def validate_document(self, doc_type: str, extracted_data: Dict[str, Any]) -> Dict[str, List[str]]:
         """Валидация документа на основе конфигурации"""
         errors = []
@@ -354,9 +569,8 @@ class DocumentProcessor:
             return {"errors": errors, "warnings": warnings}
         
         # Проверка обязательных полей
-        for field in doc_config.required_fields:
-            if field not in extracted_data or not extracted_data[field]:
-                errors.append(f"Отсутствует обязательное поле: {i18n.get_text(f'field_{field}')}")
+        for field in self.missing_required_fields(doc_config, extracted_data):
+            errors.append(f"Отсутствует обязательное поле: {i18n.get_text(f'field_{field}')}")
         
         # Специфические проверки
         if "date" in extracted_data and extracted_data["date"]:
@@ -373,7 +587,24 @@ class DocumentProcessor:
         return {"errors": errors, "warnings": warnings}
     
     def process_document(self, file_path: str, language: str = "ru") -> Tuple[Optional[DocumentData], Optional[Dict[str, List[str]]]]:
-        """Полная обработка документа: OCR, классификация, извлечение, валидация"""
+        """Полная обработка документа: OCR, классификация, извлечение, валидация.
+        Одновременные загрузки одного и того же файла обрабатываются один раз; вызовы OpenAI
+        укладываются в бюджет PIPELINE_LATENCY_BUDGET, иначе используется классификация без LLM.
+        Вызовы LLM записываются в журнал llm_usage с ключом документа (по умолчанию — имя файла) и его типом"""
+        document = llm_usage_scope.get().document or Path(file_path).name
+        with latency_budget(config.PIPELINE_LATENCY_BUDGET), usage_scope(document=document):
+            try:
+                key = f"{file_digest(file_path)}:{language}"
+            except OSError:
+                result = self._process_document(file_path, language)
+            else:
+                result = self._single_flight.do(key, self._process_document, file_path, language)
+        if config.LLM_USAGE_ENABLED and result[0]:
+            llm_usage.attribute(document, doc_type=result[0].doc_type)
+        return result
+
+    def _process_document(self, file_path: str, language: str = "ru") -> Tuple[Optional[DocumentData], Optional[Dict[str, List[str]]]]:
+        """Обработка документа без объединения одинаковых загрузок"""
         try:
             file_ext = Path(file_path).suffix.lower()
             text = ""
@@ -382,74 +613,97 @@ class DocumentProcessor:
             if file_ext == ".pdf":
                 text, ocr_confidence = self.extract_text_from_pdf(file_path, language)
             elif file_ext in config.ALLOWED_IMAGE_EXTENSIONS:
+                if config.OCR_PROGRESSIVE:
+                    return self.process_image_progressive(file_path, language)
                 text, ocr_confidence = self.extract_text_from_image(file_path, language)
             else:
                 return None, {"errors": [f"Неподдерживаемый формат файла: {file_ext}"], "warnings": []}
 
-            if not text.strip():
-                return None, {"errors": ["Не удалось извлечь текст из документа."], "warnings": []}
-            
-            # Улучшение текста с помощью OpenAI (опционально)
-            if config.USE_OPENAI_FOR_ENHANCEMENT:
-                text = self.enhance_text_with_openai(text, language)
-
-            # Классификация
-            doc_type, confidence, extracted_data = self.classify_document(text, language)
-            
-            # Валидация
-            validation_result = self.validate_document(doc_type, extracted_data)
-            
-            # Создание полей
-            fields = [DocumentField(name=k, value=str(v)) for k, v in extracted_data.items()]
-            
-            doc_data = DocumentData(
-                doc_type=doc_type,
-                confidence=confidence,
-                raw_text=text,
-                fields=fields
-            )
-            
-            logger.info(f"Обработка завершена: {doc_type} (уверенность: {confidence:.2f})")
-            return doc_data, validation_result
+            return self.analyze_text(text, language)
 
         except Exception as e:
             logger.error(f"Ошибка обработки документа: {e}", exc_info=True)
             return None, {"errors": [f"Внутренняя ошибка сервера: {e}"], "warnings": []}
 
-    def enhance_text_with_openai(self, text: str, language: str = "ru") -> str:
-        """Улучшение и структурирование текста с помощью OpenAI"""
-        try:
-            if not self.client:
-                return text
-            
-            lang_text = "румынском" if language == "ro" else "русском"
-            prompt = f"""
-            Приведи в порядок и структурируй следующий текст, извлеченный из бухгалтерского документа на {lang_text} языке.
-            Исправь ошибки OCR, сохрани ключевую информацию, такую как даты, номера, суммы, названия компаний.
-            
-            Оригинальный текст:
-            {text[:3000]}
-            
-            Улучшенный текст:
-            """
-            
-            response = self.client.chat.completions.create(
-                model=self.openai_model,
-                messages=[
-                    {"role": "system", "content": "Ты ассистент, который помогает исправлять текст после OCR."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=1000,
-                temperature=0.2
-            )
-            
-            enhanced_text = response.choices[0].message.content.strip()
-            logger.info("Текст улучшен с помощью OpenAI")
-            return enhanced_text
-            
-        except Exception as e:
-            logger.error(f"Ошибка улучшения текста: {e}")
-            return text
+    def process_image_progressive(self, image_path: str, language: str = "ru") -> Tuple[Optional[DocumentData], Dict[str, List[str]]]:
+        """Прогрессивный OCR изображения: быстрый проход, полное распознавание — только если тип не определён уверенно
+        или не найдены поля, которые умеют извлекать правила. Быстрый проход оценивается без LLM;
+        OpenAI вызывается один раз — для окончательного текста"""
+        image = image_preprocessor.open(image_path)
+        metrics.increment("ocr_progressive_documents")
+        
+        text, _ = self.ocr_fast(image, language)
+        if text.strip():
+            doc_data, validation_result = self.analyze_text(text, language, use_llm=False)
+            if (doc_data and doc_data.doc_type != "unknown"
+                    and doc_data.confidence >= self.classification_threshold
+                    and not self.missing_extractable_fields(doc_data)):
+                logger.info(f"Документ обработан по быстрому OCR: {doc_data.doc_type}")
+                if not self._llm_enhancement_enabled():
+                    return doc_data, validation_result
+                return self.analyze_text(text, language)
+        
+        # Полное распознавание, как для extract_text_from_image: язык страницы и OCR по шаблону типа
+        metrics.increment("ocr_progressive_escalated")
+        logger.info("Быстрого OCR недостаточно, выполняется полное распознавание")
+        text, _ = self.ocr_page(image, language)
+        return self.analyze_text(text, language)
+
+    def missing_extractable_fields(self, doc_data: DocumentData) -> List[str]:
+        """Обязательные поля, которые не найдены, хотя для них есть правило извлечения: полный OCR может их найти.
+        Поля без правил (стороны договора, список сотрудников) не находятся ни при каком качестве OCR"""
+        doc_config = config.get_document_type_config(doc_data.doc_type)
+        if not doc_config:
+            return []
+        extractable = {family.name for family in field_extractor.get_families(doc_data.doc_type)}
+        found = {field.name: field.value for field in doc_data.fields}
+        return [name for name in self.missing_required_fields(doc_config, found) if name in extractable]
+    
+    def _llm_enhancement_enabled(self) -> bool:
+        """Текст OCR исправляется и классифицируется через LLM"""
+        return bool(config.USE_OPENAI_FOR_ENHANCEMENT and self.enhancement_client)
+
+    def analyze_text(self, text: str, language: str = "ru",
+                     use_llm: bool = True) -> Tuple[Optional[DocumentData], Dict[str, List[str]]]:
+        """Классификация, извлечение и валидация распознанного текста; use_llm=False — только ключевые слова
+        и локальная модель"""
+        if not text.strip():
+            return None, {"errors": ["Не удалось извлечь текст из документа."], "warnings": []}
+        
+        # Язык документа по распознанному тексту, а не по языку интерфейса
+        if config.OCR_LANGUAGE_DETECTION:
+            detected = detect_text_language(text)
+            if detected:
+                language = detected.language
+        
+        # Исправление текста и классификация OpenAI одним запросом (опционально)
+        if not use_llm:
+            doc_type, confidence, extracted_data = self.classify_batch([text], language, use_openai=False)[0]
+        elif self._llm_enhancement_enabled():
+            analysis = self.enhance_and_classify_with_openai(text, language)
+            if analysis and isinstance(analysis.get("text"), str) and analysis["text"].strip():
+                text = analysis["text"]
+            # Ответ OpenAI используется, только если ключевые слова и локальная модель не уверены
+            doc_type, confidence, extracted_data = self.classify_batch([text], language, ai_results=[analysis])[0]
+        else:
+            doc_type, confidence, extracted_data = self.classify_document(text, language)
+        
+        # Валидация
+        validation_result = self.validate_document(doc_type, extracted_data)
+        
+        # Создание полей
+        fields = [DocumentField(name=k, value=str(v)) for k, v in extracted_data.items()]
+        
+        doc_data = DocumentData(
+            doc_type=doc_type,
+            confidence=confidence,
+            raw_text=text,
+            fields=fields,
+            language=language
+        )
+        
+        logger.info(f"Обработка завершена: {doc_type} (уверенность: {confidence:.2f})")
+        return doc_data, validation_result
 
 # Создаем единственный экземпляр процессора
 document_processor = DocumentProcessor()
\ No newline at end of file
@@ -1,15 +1,24 @@
 import json
 import os
 import logging
-from typing import Dict, List, Optional, Any
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Any
 from datetime import datetime, date
 from dataclasses import dataclass, asdict
 from pathlib import Path
 import sqlite3
+from abc import ABC, abstractmethod
+import pandas as pd
+from config import config
 from data_models import DocumentData, DocumentField
 
 logger = logging.getLogger(__name__)
 
+# Переименованные типы документов: старый id -> id из config.MOLDOVAN_DOCUMENT_TYPES.
+# Сохранённые документы переводятся на новый id при открытии базы
+RENAMED_DOC_TYPES = {"ordin_plata": "ordine_plata"}
+
 @dataclass
 class StoredDocument:
     """Сохраненный документ в базе данных"""
@@ -23,6 +32,8 @@ class StoredDocument:
     confidence: float = 1.0
     validation_errors: List[str] = None
     validation_warnings: List[str] = None
+    language: Optional[str] = None
+    verified: bool = False  # тип и поля подтверждены или исправлены пользователем
     
     @property
     def document_type(self) -> str:
@@ -44,17 +55,234 @@ class StoredDocument:
         """Проверка валидности документа"""
         return len(self.validation_errors or []) == 0
 
-class DocumentStorage:
+@dataclass
+class ClassificationUpdate:
+    """Новый результат классификации сохранённого документа"""
+    doc_id: int
+    doc_type: str
+    confidence: float
+    fields: Optional[List[DocumentField]] = None  # None — извлечённые поля не меняются
+
+class BaseDocumentStorage(ABC):
+    """Интерфейс хранилища документов, общий для всех бэкендов"""
+    
+    # Поля документа, которые выгружаются в колоночном виде для аналитики
+    FRAME_FIELDS = ("company", "idno", "total_amount", "vat_amount")
+    FRAME_NUMERIC_FIELDS = ("total_amount", "vat_amount")
+    
+    @abstractmethod
+    def init_database(self):
+        """Инициализация базы данных"""
+    
+    @abstractmethod
+    def store_document(self, doc_data: DocumentData, filename: str, file_path: str,
+                      validation_result: Dict[str, List[str]] = None) -> int:
+        """Сохраняет документ в базу данных"""
+    
+    @abstractmethod
+    def get_document(self, doc_id: int) -> Optional[StoredDocument]:
+        """Получает документ по ID"""
+    
+    @abstractmethod
+    def search_documents(self,
+                        doc_type: Optional[str] = None,
+                        idno: Optional[str] = None,
+                        date_from: Optional[str] = None,
+                        date_to: Optional[str] = None,
+                        amount_min: Optional[float] = None,
+                        amount_max: Optional[float] = None,
+                        filename: Optional[str] = None) -> List[StoredDocument]:
+        """Поиск документов по различным критериям"""
+    
+    @abstractmethod
+    def load_documents_frame(self,
+                             date_from: Optional[str] = None,
+                             date_to: Optional[str] = None,
+                             doc_type: Optional[str] = None) -> pd.DataFrame:
+        """Колоночная выгрузка документов для аналитики одним запросом"""
+    
+    @abstractmethod
+    def get_statistics(self) -> Dict[str, Any]:
+        """Собирает статистику по документам в базе."""
+    
+    @abstractmethod
+    def delete_document(self, doc_id: int) -> bool:
+        """Удаляет документ по ID"""
+    
+    @abstractmethod
+    def get_documents(self, filters: Dict[str, Any] = None) -> List[StoredDocument]:
+        """Получение документов с фильтрацией"""
+    
+    @abstractmethod
+    def update_document(self, doc_id: int, updated_fields: Dict[str, Any], doc_type: Optional[str] = None) -> bool:
+        """Обновление документа пользователем: поля, при необходимости тип; документ отмечается проверенным"""
+    
+    @abstractmethod
+    def iter_documents(self, chunk_size: int = 500) -> Iterator[List[StoredDocument]]:
+        """Все документы порциями по chunk_size в порядке ID (без долгой транзакции между порциями)"""
+    
+    @abstractmethod
+    def update_classifications(self, updates: Sequence[ClassificationUpdate]) -> int:
+        """Запись результатов переклассификации одной транзакцией, возвращает число обновлённых документов"""
+    
+    def _filter_by_fields(self, documents: List[StoredDocument],
+                          idno: Optional[str] = None,
+                          amount_min: Optional[float] = None,
+                          amount_max: Optional[float] = None) -> List[StoredDocument]:
+        """Фильтрация по IDNO и суммам из полей документа"""
+        if not (idno or amount_min or amount_max):
+            return documents
+        
+        filtered_docs = []
+        for doc in documents:
+            include = True
+            
+            if idno:
+                idno_field = next((f for f in doc.fields if f.name == "idno"), None)
+                if not idno_field or idno not in idno_field.value:
+                    include = False
+            
+            if include and (amount_min or amount_max):
+                amount_fields = [f for f in doc.fields if "amount" in f.name]
+                if amount_fields:
+                    try:
+                        amount = float(amount_fields[0].value.replace(",", ""))
+                        if amount_min and amount < amount_min:
+                            include = False
+                        if amount_max and amount > amount_max:
+                            include = False
+                    except ValueError:
+                        include = False
+            
+            if include:
+                filtered_docs.append(doc)
+        
+        return filtered_docs
+    
+    def _normalize_documents_frame(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """Приведение типов колонок аналитической выгрузки"""
+        for name in self.FRAME_NUMERIC_FIELDS:
+            values = frame[name].astype("string").str.replace(",", "", regex=False)
+            frame[name] = pd.to_numeric(values, errors="coerce").fillna(0.0).astype(float)
+        
+        frame["confidence"] = frame["confidence"].fillna(0.0).astype(float)
+        frame["validation_errors"] = frame["validation_errors"].fillna("[]")
+        frame["is_valid"] = frame["validation_errors"].isin(["[]", ""])
+        frame["upload_date"] = pd.to_datetime(frame["upload_date"], errors="coerce")
+        return frame
+    
+    @staticmethod
+    def _decode_json(value):
+        """Разбор JSON-колонки независимо от драйвера базы"""
+        return json.loads(value) if isinstance(value, (str, bytes)) else value
+    
+    def _row_to_document(self, row) -> StoredDocument:
+        """Преобразует строку БД в объект StoredDocument"""
+        try:
+            # SQLite хранит JSON строкой, PostgreSQL отдаёт JSONB уже разобранным
+            fields_json = self._decode_json(row[3])
+            fields = [DocumentField(**field_data) for field_data in fields_json]
+            
+            validation_errors = self._decode_json(row[8]) if row[8] else []
+            validation_warnings = self._decode_json(row[9]) if row[9] else []
+            
+            # Парсинг даты с обработкой ошибок
+            upload_date = None
+            try:
+                if row[5]:
+                    if isinstance(row[5], str):
+                        # Пробуем разные форматы даты
+                        for fmt in ["%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"]:
+                            try:
+                                upload_date = datetime.strptime(row[5], fmt)
+                                break
+                            except ValueError:
+                                continue
+                        if upload_date is None:
+                            upload_date = datetime.now()
+                    else:
+                        upload_date = row[5]
+                else:
+                    upload_date = datetime.now()
+            except Exception:
+                upload_date = datetime.now()
+            
+            return StoredDocument(
+                id=row[0],
+                filename=row[1],
+                doc_type=row[2],
+                fields=fields,
+                raw_text=row[4],
+                upload_date=upload_date,
+                file_path=row[6],
+                confidence=row[7],
+                validation_errors=validation_errors,
+                validation_warnings=validation_warnings,
+                language=row[10] if len(row) > 10 else None,
+                verified=bool(row[11]) if len(row) > 11 else False
+            )
+        except Exception as e:
+            logger.error(f"Ошибка преобразования строки в документ: {e}")
+            raise
+    
+    def get_document_for_api(self, doc_id: int) -> Optional[Dict[str, Any]]:
+        """Получение документа в формате для API"""
+        try:
+            doc = self.get_document(doc_id)
+            if not doc:
+                return None
+            
+            # Преобразуем в формат для API
+            return {
+                "id": doc.id,
+                "filename": doc.filename,
+                "document_type": doc.doc_type,
+                "processing_date": doc.upload_date.isoformat() if doc.upload_date else "",
+                "confidence": doc.confidence,
+                "extracted_data": {field.name: field.value for field in doc.fields},
+                "is_valid": len(doc.validation_errors or []) == 0,
+                "validation_errors": doc.validation_errors or [],
+                "file_path": doc.file_path,
+                "language": doc.language
+            }
+            
+        except Exception as e:
+            logger.error(f"Ошибка получения документа для API: {e}")
+            return None
+
+class DocumentStorage(BaseDocumentStorage):
     """Хранилище документов с базой данных SQLite"""
     
     def __init__(self, db_path: str = "documents.db"):
         self.db_path = db_path
+        
+        # База в памяти живёт, пока открыто соединение, поэтому оно общее
+        self._memory_conn = None
+        self._memory_lock = threading.RLock()
+        if db_path == ":memory:":
+            self._memory_conn = sqlite3.connect(db_path, check_same_thread=False)
+        
         self.init_database()
     
+    @contextmanager
+    def _connect(self):
+        """Соединение с базой: транзакция фиксируется при выходе из блока"""
+        if self._memory_conn is not None:
+            with self._memory_lock, self._memory_conn:
+                yield self._memory_conn
+            return
+        
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+    
     def init_database(self):
         """Инициализация базы данных"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
                 # Создание таблицы документов
@@ -69,15 +297,27 @@ class DocumentStorage:
                         file_path TEXT NOT NULL,
                         confidence REAL DEFAULT 1.0,
                         validation_errors TEXT,
-                        validation_warnings TEXT
+                        validation_warnings TEXT,
+                        language TEXT,
+                        verified INTEGER DEFAULT 0
                     )
                 """)
                 
+                # Базы, созданные до появления определения языка и проверки пользователем, получают новые колонки
+                columns = {row[1] for row in cursor.execute("PRAGMA table_info(documents)")}
+                if "language" not in columns:
+                    cursor.execute("ALTER TABLE documents ADD COLUMN language TEXT")
+                if "verified" not in columns:
+                    cursor.execute("ALTER TABLE documents ADD COLUMN verified INTEGER DEFAULT 0")
+                
                 # Создание индексов для быстрого поиска
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_doc_type ON documents(doc_type)")
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_upload_date ON documents(upload_date)")
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_filename ON documents(filename)")
                 
+                cursor.executemany("UPDATE documents SET doc_type = ? WHERE doc_type = ?",
+                                   [(new, old) for old, new in RENAMED_DOC_TYPES.items()])
+                
                 conn.commit()
                 logger.info("База данных документов инициализирована")
                 
@@ -89,7 +329,7 @@ class DocumentStorage:
                       validation_result: Dict[str, List[str]] = None) -> int:
         """Сохраняет документ в базу данных"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
                 # Сериализация полей
@@ -101,8 +341,9 @@ class DocumentStorage:
                 
                 cursor.execute("""
                     INSERT INTO documents 
-                    (filename, doc_type, fields, raw_text, file_path, confidence, validation_errors, validation_warnings)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    (filename, doc_type, fields, raw_text, file_path, confidence, validation_errors, validation_warnings,
+                     language)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """, (
                     filename,
                     doc_data.doc_type,
@@ -111,7 +352,8 @@ class DocumentStorage:
                     file_path,
                     doc_data.confidence,
                     validation_errors,
-                    validation_warnings
+                    validation_warnings,
+                    doc_data.language
                 ))
                 
                 doc_id = cursor.lastrowid
@@ -127,7 +369,7 @@ class DocumentStorage:
     def get_document(self, doc_id: int) -> Optional[StoredDocument]:
         """Получает документ по ID"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute("SELECT * FROM documents WHERE id = ?", (doc_id,))
                 row = cursor.fetchone()
@@ -150,7 +392,7 @@ class DocumentStorage:
                         filename: Optional[str] = None) -> List[StoredDocument]:
         """Поиск документов по различным критериям"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
                 query = "SELECT * FROM documents WHERE 1=1"
@@ -188,32 +430,7 @@ class DocumentStorage:
                 documents = [self._row_to_document(row) for row in rows]
                 
                 # Фильтрация по IDNO и суммам (требует парсинга JSON полей)
-                if idno or amount_min or amount_max:
-                    filtered_docs = []
-                    for doc in documents:
-                        include = True
-                        
-                        if idno:
-                            idno_field = next((f for f in doc.fields if f.name == "idno"), None)
-                            if not idno_field or idno not in idno_field.value:
-                                include = False
-                        
-                        if include and (amount_min or amount_max):
-                            amount_fields = [f for f in doc.fields if "amount" in f.name]
-                            if amount_fields:
-                                try:
-                                    amount = float(amount_fields[0].value.replace(",", ""))
-                                    if amount_min and amount < amount_min:
-                                        include = False
-                                    if amount_max and amount > amount_max:
-                                        include = False
-                                except ValueError:
-                                    include = False
-                        
-                        if include:
-                            filtered_docs.append(doc)
-                    
-                    documents = filtered_docs
+                documents = self._filter_by_fields(documents, idno, amount_min, amount_max)
                 
                 logger.info(f"Найдено документов: {len(documents)}")
                 return documents
@@ -222,6 +439,49 @@ class DocumentStorage:
             logger.error(f"Ошибка поиска документов: {e}")
             return []
     
+    def load_documents_frame(self,
+                             date_from: Optional[str] = None,
+                             date_to: Optional[str] = None,
+                             doc_type: Optional[str] = None) -> pd.DataFrame:
+        """Колоночная выгрузка документов для аналитики одним запросом"""
+        # Поля из JSON разворачиваются средствами SQLite (json_each)
+        field_columns = ",\n".join(
+            f"MAX(CASE WHEN json_extract(f.value, '$.name') = '{name}' "
+            f"THEN json_extract(f.value, '$.value') END) AS {name}"
+            for name in self.FRAME_FIELDS
+        )
+        query = f"""
+            SELECT d.id, d.doc_type, d.upload_date, d.confidence, d.validation_errors,
+                   {field_columns}
+            FROM documents d LEFT JOIN json_each(d.fields) f
+            WHERE 1=1
+        """
+        params = []
+        
+        if doc_type:
+            query += " AND d.doc_type = ?"
+            params.append(doc_type)
+        
+        for value, operator in ((date_from, ">="), (date_to, "<=")):
+            if value:
+                try:
+                    date_obj = datetime.strptime(value, "%Y-%m-%d").date()
+                    query += f" AND DATE(d.upload_date) {operator} ?"
+                    params.append(date_obj.isoformat())
+                except ValueError:
+                    logger.warning(f"Неверный формат даты: {value}")
+        
+        query += " GROUP BY d.id ORDER BY d.id"
+        
+        try:
+            with self._connect() as conn:
+                frame = pd.read_sql_query(query, conn, params=params)
+        except Exception as e:
+            logger.error(f"Ошибка колоночной выгрузки документов: {e}")
+            raise
+        
+        return self._normalize_documents_frame(frame)
+    
     def get_statistics(self) -> Dict[str, Any]:
         """Собирает статистику по документам в базе."""
         stats = {
@@ -233,7 +493,7 @@ class DocumentStorage:
             }
         }
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
 
                 # Total documents
@@ -262,7 +522,7 @@ class DocumentStorage:
     def delete_document(self, doc_id: int) -> bool:
         """Удаляет документ по ID"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
                 # Получаем информацию о файле
@@ -290,56 +550,10 @@ class DocumentStorage:
             logger.error(f"Ошибка удаления документа: {e}")
             return False
     
-    def _row_to_document(self, row) -> StoredDocument:
-        """Преобразует строку БД в объект StoredDocument"""
-        try:
-            fields_json = json.loads(row[3])
-            fields = [DocumentField(**field_data) for field_data in fields_json]
-            
-            validation_errors = json.loads(row[8]) if row[8] else []
-            validation_warnings = json.loads(row[9]) if row[9] else []
-            
-            # Парсинг даты с обработкой ошибок
-            upload_date = None
-            try:
-                if row[5]:
-                    if isinstance(row[5], str):
-                        # Пробуем разные форматы даты
-                        for fmt in ["%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"]:
-                            try:
-                                upload_date = datetime.strptime(row[5], fmt)
-                                break
-                            except ValueError:
-                                continue
-                        if upload_date is None:
-                            upload_date = datetime.now()
-                    else:
-                        upload_date = row[5]
-                else:
-                    upload_date = datetime.now()
-            except Exception:
-                upload_date = datetime.now()
-            
-            return StoredDocument(
-                id=row[0],
-                filename=row[1],
-                doc_type=row[2],
-                fields=fields,
-                raw_text=row[4],
-                upload_date=upload_date,
-                file_path=row[6],
-                confidence=row[7],
-                validation_errors=validation_errors,
-                validation_warnings=validation_warnings
-            )
-        except Exception as e:
-            logger.error(f"Ошибка преобразования строки в документ: {e}")
-            raise
-    
     def get_documents(self, filters: Dict[str, Any] = None) -> List[StoredDocument]:
         """Получение документов с фильтрацией"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
                 query = "SELECT * FROM documents WHERE 1=1"
@@ -359,6 +573,9 @@ class DocumentStorage:
                     if filters.get("has_validation_errors"):
                         query += " AND (validation_errors IS NOT NULL AND validation_errors != '[]')"
                     
+                    if filters.get("verified"):
+                        query += " AND verified = 1"
+                    
                     if filters.get("search"):
                         search_term = f"%{filters['search']}%"
                         query += " AND (filename LIKE ? OR raw_text LIKE ?)"
@@ -409,10 +626,10 @@ class DocumentStorage:
             logger.error(f"Ошибка получения документов: {e}")
             return []
     
-    def update_document(self, doc_id: int, updated_fields: Dict[str, Any]) -> bool:
-        """Обновление документа"""
+    def update_document(self, doc_id: int, updated_fields: Dict[str, Any], doc_type: Optional[str] = None) -> bool:
+        """Обновление документа пользователем: поля, при необходимости тип; документ отмечается проверенным"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
                 # Получаем текущий документ
@@ -434,9 +651,9 @@ class DocumentStorage:
                 
                 cursor.execute("""
                     UPDATE documents 
-                    SET fields = ?, validation_errors = NULL
+                    SET fields = ?, validation_errors = NULL, doc_type = COALESCE(?, doc_type), verified = 1
                     WHERE id = ?
-                """, (updated_fields_json, doc_id))
+                """, (updated_fields_json, doc_type, doc_id))
                 
                 conn.commit()
                 logger.info(f"Документ {doc_id} обновлен")
@@ -446,26 +663,69 @@ class DocumentStorage:
             logger.error(f"Ошибка обновления документа: {e}")
             return False
     
-    def get_document_for_api(self, doc_id: int) -> Optional[Dict[str, Any]]:
-        """Получение документа в формате для API"""
+    def iter_documents(self, chunk_size: int = 500) -> Iterator[List[StoredDocument]]:
+        """Все документы порциями по chunk_size в порядке ID (без долгой транзакции между порциями)"""
+        last_id = 0
+        while True:
+            with self._connect() as conn:
+                rows = conn.execute("SELECT * FROM documents WHERE id > ? ORDER BY id LIMIT ?",
+                                    (last_id, chunk_size)).fetchall()
+            if not rows:
+                return
+            yield [self._row_to_document(row) for row in rows]
+            last_id = rows[-1][0]
+    
+    def update_classifications(self, updates: Sequence[ClassificationUpdate]) -> int:
+        """Запись результатов переклассификации одной транзакцией, возвращает число обновлённых документов"""
         try:
-            doc = self.get_document(doc_id)
-            if not doc:
-                return None
-            
-            # Преобразуем в формат для API
-            return {
-                "id": doc.id,
-                "filename": doc.filename,
-                "document_type": doc.doc_type,
-                "processing_date": doc.upload_date.isoformat() if doc.upload_date else "",
-                "confidence": doc.confidence,
-                "extracted_data": {field.name: field.value for field in doc.fields},
-                "is_valid": len(doc.validation_errors or []) == 0,
-                "validation_errors": doc.validation_errors or [],
-                "file_path": doc.file_path
-            }
-            
+            with self._connect() as conn:
+                cursor = conn.executemany("""
+                    UPDATE documents
+                    SET doc_type = ?, confidence = ?, fields = COALESCE(?, fields)
+                    WHERE id = ?
+                """, [(
+                    update.doc_type,
+                    update.confidence,
+                    json.dumps([asdict(field) for field in update.fields]) if update.fields is not None else None,
+                    update.doc_id
+                ) for update in updates])
+                return cursor.rowcount
+                
         except Exception as e:
-            logger.error(f"Ошибка получения документа для API: {e}")
-            return None 
\ No newline at end of file
+            logger.error(f"Ошибка обновления классификации документов: {e}")
+            raise
+
+
+def create_storage(database_url: Optional[str] = None) -> BaseDocumentStorage:
+    """Создание хранилища по DATABASE_URL (sqlite:///путь или postgresql://...)"""
+    database_url = database_url or config.DATABASE_URL
+    
+    if database_url.startswith(("postgresql://", "postgres://")):
+        # Драйвер PostgreSQL нужен только при выборе этого бэкенда
+        from postgres_storage import PostgresDocumentStorage
+        return PostgresDocumentStorage(database_url)
+    
+    if database_url.startswith("sqlite:///"):
+        return DocumentStorage(database_url[len("sqlite:///"):])
+    
+    raise ValueError(f"Неподдерживаемый DATABASE_URL: {database_url}")
+
+
+# Общий экземпляр хранилища, который получают все модули приложения
+_storage: Optional[BaseDocumentStorage] = None
+_storage_lock = threading.Lock()
+
+def get_storage() -> BaseDocumentStorage:
+    """Получение общего хранилища документов (создаётся при первом обращении)"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage()
+    return _storage
+
+def set_storage(storage: BaseDocumentStorage) -> None:
+    """Замена общего хранилища, например на базу в памяти для тестов"""
+    global _storage
+    with _storage_lock:
+        _storage = storage
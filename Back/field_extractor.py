@@ -0,0 +1,122 @@
+"""
+Извлечение полей документа по декларативным правилам из конфигурации
+Правила (config.COMMON_FIELD_RULES и field_rules типов документов) компилируются один раз
+и используются и DocumentProcessor, и MoldovanDocumentClassifier
+"""
+
+import re
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from config import config, FieldRule
+
+logger = logging.getLogger(__name__)
+
+def _parse_number(value: str) -> float:
+    """Сумма из OCR-текста: пробелы убираются, запятая считается десятичным разделителем"""
+    return float(value.replace(' ', '').replace(',', '.'))
+
+def _format_date(day: str, month: str, year: str) -> str:
+    return f"{day.zfill(2)}.{month.zfill(2)}.{year}"
+
+# Нормализаторы значений, на которые ссылаются правила по имени
+NORMALIZERS: Dict[str, Callable[..., Any]] = {
+    "text": lambda value: value.strip(),
+    "number": _parse_number,
+    "date": _format_date,
+    "join": lambda *values: " ".join(value.strip() for value in values),
+}
+
+@dataclass
+class FieldFamily:
+    """Семейство шаблонов одного поля; шаблоны перечислены по убыванию приоритета"""
+    name: str
+    patterns: List[str]
+    convert: Callable[..., Any] = lambda value: value
+    flags: int = re.IGNORECASE
+    regexes: List[re.Pattern] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        # Шаблоны компилируются один раз при создании семейства
+        self.regexes = [re.compile(pattern, self.flags) for pattern in self.patterns]
+
+    @classmethod
+    def from_rule(cls, rule: FieldRule) -> "FieldFamily":
+        """Компиляция декларативного правила из конфигурации"""
+        flags = (re.IGNORECASE if rule.ignore_case else 0) | (re.MULTILINE if rule.multiline else 0)
+        return cls(rule.name, list(rule.patterns), NORMALIZERS[rule.normalizer], flags)
+
+    def extract(self, text: str) -> Optional[Any]:
+        """Значение поля: первое вхождение самого приоритетного шаблона, которое удалось разобрать"""
+        for regex in self.regexes:
+            match = regex.search(text)
+            if match:
+                try:
+                    return self.convert(*match.groups())
+                except ValueError:
+                    continue
+        return None
+
+class FieldExtractor:
+    """Скомпилированные правила извлечения полей по типам документов"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fingerprint: Optional[tuple] = None
+        # Скомпилированные семейства по правилу: при добавлении типа компилируются только его новые правила
+        self._compiled: Dict[FieldRule, FieldFamily] = {}
+        self._common: List[FieldFamily] = []
+        self._by_type: Dict[str, List[FieldFamily]] = {}
+
+    @staticmethod
+    def _config_fingerprint() -> tuple:
+        """Снимок правил из конфигурации для обнаружения изменений"""
+        return (tuple(config.COMMON_FIELD_RULES),
+                tuple((doc_type.type_id, tuple(doc_type.field_rules)) for doc_type in config.MOLDOVAN_DOCUMENT_TYPES))
+
+    def _compile(self, rule: FieldRule) -> FieldFamily:
+        family = self._compiled.get(rule)
+        if family is None:
+            family = self._compiled[rule] = FieldFamily.from_rule(rule)
+        return family
+
+    def _type_families(self, rules: List[FieldRule]) -> List[FieldFamily]:
+        """Общие семейства, затем семейства типа; правило типа с именем общего поля заменяет общее правило"""
+        own = {rule.name: self._compile(rule) for rule in rules}
+        families = [own.pop(family.name, family) for family in self._common]
+        return families + list(own.values())
+
+    def get_families(self, doc_type: Optional[str] = None) -> List[FieldFamily]:
+        """Семейства полей для типа: общие правила, затем правила типа"""
+        fingerprint = self._config_fingerprint()
+        with self._lock:
+            if fingerprint != self._fingerprint:
+                self._common = [self._compile(rule) for rule in config.COMMON_FIELD_RULES]
+                self._by_type = {
+                    doc_type_config.type_id: self._type_families(doc_type_config.field_rules)
+                    for doc_type_config in config.MOLDOVAN_DOCUMENT_TYPES
+                }
+                self._fingerprint = fingerprint
+                logger.info(f"Правила извлечения полей скомпилированы: {len(self._compiled)} семейств")
+            return self._by_type.get(doc_type, self._common)
+
+    def all_families(self) -> List[FieldFamily]:
+        """Семейства полей всех типов без повторов"""
+        families = {id(family): family for family in self.get_families()}
+        for doc_type_config in config.MOLDOVAN_DOCUMENT_TYPES:
+            families.update((id(family), family) for family in self.get_families(doc_type_config.type_id))
+        return list(families.values())
+
+    def extract(self, text: str, doc_type: Optional[str] = None) -> Dict[str, Any]:
+        """Словарь найденных полей для типа документа (без типа — только общие поля)"""
+        data = {}
+        for family in self.get_families(doc_type):
+            value = family.extract(text)
+            if value is not None:
+                data[family.name] = value
+        return data
+
+# Глобальный экземпляр
+field_extractor = FieldExtractor()
@@ -0,0 +1,148 @@
+"""
+Подготовка изображения перед OCR
+Поворот по EXIF, оттенки серого, уменьшение до целевого DPI, выравнивание наклона и адаптивная бинаризация.
+Все шаги — векторные операции NumPy/PIL; набор и порядок шагов задаются в config.OCR_PREPROCESS_STEPS
+"""
+
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from PIL import Image, ImageFilter, ImageOps
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Размер копии страницы для оценки наклона
+_SKEW_SAMPLE_SIDE = 1000
+_SKEW_MAX_POINTS = 20000
+
+def target_scale(image: Image.Image) -> float:
+    """Коэффициент уменьшения до целевого DPI (не больше 1: изображения не увеличиваются)"""
+    dpi = image.info.get("dpi")
+    if dpi and dpi[0] >= 150:
+        # Скан с достоверным разрешением
+        scale = config.OCR_TARGET_DPI / float(dpi[0])
+    else:
+        # Фото с телефона: считаем, что страница A4 заполняет кадр
+        scale = config.OCR_TARGET_DPI * config.OCR_PAGE_LONG_SIDE_INCHES / max(image.size)
+    return min(1.0, scale)
+
+def adaptive_threshold(image: Image.Image, window: int = None, offset: float = None) -> np.ndarray:
+    """Маска тёмных пикселей: пиксель темнее среднего по окну (метод Брэдли; среднее — BoxBlur в PIL)"""
+    window = window or config.OCR_BINARIZE_WINDOW
+    offset = config.OCR_BINARIZE_OFFSET if offset is None else offset
+    gray = image if image.mode == "L" else image.convert("L")
+    local_mean = np.asarray(gray.filter(ImageFilter.BoxBlur(window // 2)), dtype=np.float32)
+    return np.asarray(gray, dtype=np.float32) <= local_mean * (1.0 - offset)
+
+def estimate_skew(image: Image.Image, max_angle: float = None) -> float:
+    """Угол наклона строк в градусах (против часовой стрелки, как в Image.rotate)
+
+    Перебираются углы, при которых проекция тёмных пикселей на вертикаль даёт самые резкие пики строк;
+    все углы оцениваются одной матричной операцией
+    """
+    max_angle = config.OCR_MAX_SKEW_DEGREES if max_angle is None else max_angle
+    sample = image.convert("L")
+    sample.thumbnail((_SKEW_SAMPLE_SIDE, _SKEW_SAMPLE_SIDE))
+    ys, xs = np.nonzero(adaptive_threshold(sample))
+    if len(ys) < 100:
+        return 0.0
+    if len(ys) > _SKEW_MAX_POINTS:
+        step = len(ys) // _SKEW_MAX_POINTS + 1
+        ys, xs = ys[::step], xs[::step]
+    ys = ys.astype(np.float32)
+    xs = xs.astype(np.float32)
+
+    def best_angle(angles: np.ndarray) -> float:
+        # Строка каждого тёмного пикселя при каждом угле: y + x·tg(угол)
+        rows = np.rint(ys[None, :] + xs[None, :] * np.tan(np.radians(angles))[:, None]).astype(np.int64)
+        rows -= rows.min()
+        height = int(rows.max()) + 1
+        histogram = np.bincount((rows + np.arange(len(angles))[:, None] * height).ravel(),
+                                minlength=len(angles) * height).reshape(len(angles), height)
+        scores = (histogram.astype(np.float64) ** 2).sum(axis=1)
+        return float(angles[int(np.argmax(scores))])
+
+    # Грубый перебор с шагом 1°, затем уточнение с шагом 0.1°
+    coarse = best_angle(np.arange(-max_angle, max_angle + 0.5, 1.0))
+    return best_angle(np.arange(coarse - 1.0, coarse + 1.05, 0.1))
+
+class ImagePreprocessor:
+    """Конвейер подготовки изображения перед OCR"""
+
+    def __init__(self, steps: Optional[Sequence[str]] = None):
+        self.steps: List[str] = []
+        for step in (config.OCR_PREPROCESS_STEPS if steps is None else steps):
+            if step in self.STEPS:
+                self.steps.append(step)
+            else:
+                logger.warning(f"Неизвестный шаг подготовки изображения: {step}")
+
+    def exif(self, image: Image.Image) -> Image.Image:
+        """Поворот по EXIF-ориентации камеры"""
+        return ImageOps.exif_transpose(image)
+
+    def grayscale(self, image: Image.Image) -> Image.Image:
+        """Оттенки серого"""
+        return image if image.mode == "L" else image.convert("L")
+
+    def downscale(self, image: Image.Image) -> Image.Image:
+        """Уменьшение до целевого DPI"""
+        scale = target_scale(image)
+        if scale >= 0.95:
+            return image
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+    def deskew(self, image: Image.Image) -> Image.Image:
+        """Выравнивание наклона строк"""
+        angle = estimate_skew(image)
+        if abs(angle) < 0.2:
+            return image
+        logger.info(f"Наклон страницы: {angle:.1f}°")
+        return image.rotate(-angle, resample=Image.Resampling.BILINEAR, expand=True, fillcolor="white")
+
+    def binarize(self, image: Image.Image) -> Image.Image:
+        """Адаптивная бинаризация: устойчива к теням и неравномерному освещению"""
+        mask = adaptive_threshold(image)
+        return Image.fromarray(np.where(mask, 0, 255).astype(np.uint8), mode="L")
+
+    STEPS: Dict[str, Callable[["ImagePreprocessor", Image.Image], Image.Image]] = {
+        "exif": exif,
+        "grayscale": grayscale,
+        "downscale": downscale,
+        "deskew": deskew,
+        "binarize": binarize,
+    }
+
+    def process(self, image: Image.Image) -> Image.Image:
+        """Выполнение всех шагов конвейера"""
+        start = time.perf_counter()
+        source_size = image.size
+        for step in self.steps:
+            image = self.STEPS[step](self, image)
+        logger.info(f"Изображение подготовлено: {source_size} → {image.size} "
+                    f"за {(time.perf_counter() - start) * 1000:.0f} мс")
+        return image
+
+    def open(self, image_path: str) -> Image.Image:
+        """Открытие файла с подготовкой; JPEG уменьшается ещё при декодировании"""
+        image = Image.open(image_path)
+        if image.format == "JPEG" and "downscale" in self.steps:
+            scale = target_scale(image)
+            if scale < 0.5:
+                # Декодер JPEG масштабирует в 2, 4 или 8 раз без полного декодирования
+                mode = "L" if "grayscale" in self.steps else image.mode
+                source_width = image.width
+                image.draft(mode, (round(image.width * scale), round(image.height * scale)))
+                if image.info.get("dpi"):
+                    # Разрешение пересчитывается, чтобы downscale не уменьшал изображение повторно
+                    factor = image.width / source_width
+                    image.info["dpi"] = tuple(value * factor for value in image.info["dpi"])
+        return self.process(image)
+
+# Глобальный экземпляр
+image_preprocessor = ImagePreprocessor()
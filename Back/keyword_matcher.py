@@ -0,0 +1,127 @@
+"""
+Поиск ключевых слов типов документов автоматом Ахо-Корасик
+Все ключевые слова всех типов находятся за один проход по тексту
+"""
+
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import ahocorasick
+import numpy as np
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+class KeywordAutomaton:
+    """Автомат Ахо-Корасик (pyahocorasick) для множества ключевых слов, сгруппированных по меткам"""
+
+    def __init__(self, keywords: Dict[str, List[str]]):
+        # Каждое вхождение слова в список метки учитывается отдельно, как при поиске по списку
+        self.totals = {label: len(words) for label, words in keywords.items()}
+
+        owners: Dict[str, List[str]] = {}
+        for label, words in keywords.items():
+            for word in words:
+                if word:
+                    owners.setdefault(word.lower(), []).append(label)
+
+        self._words: List[Tuple[str, ...]] = []
+        self._automaton = ahocorasick.Automaton()
+        for word, labels in owners.items():
+            self._automaton.add_word(word, len(self._words))
+            self._words.append(tuple(labels))
+        if self._words:
+            self._automaton.make_automaton()
+
+        # Матрица принадлежности слов меткам (слово × метка) для пакетной оценки
+        self.labels = list(keywords)
+        label_index = {label: index for index, label in enumerate(self.labels)}
+        self._membership = np.zeros((len(self._words), len(self.labels)), dtype=np.float32)
+        for word_id, labels in enumerate(self._words):
+            for label in labels:
+                self._membership[word_id, label_index[label]] += 1
+        self._label_totals = np.array([self.totals[label] for label in self.labels], dtype=np.float32)
+
+    def find_words(self, text: str) -> set:
+        """Номера ключевых слов, встретившихся в тексте (без учёта регистра)"""
+        if not self._words:
+            return set()
+        return {word_id for _, word_id in self._automaton.iter(text.lower())}
+
+    def count_matches(self, text: str) -> Dict[str, int]:
+        """Количество найденных ключевых слов каждой метки"""
+        counts = dict.fromkeys(self.totals, 0)
+        for word_id in self.find_words(text):
+            for label in self._words[word_id]:
+                counts[label] += 1
+        return counts
+
+    def score(self, text: str) -> Dict[str, float]:
+        """Доля найденных ключевых слов каждой метки"""
+        counts = self.count_matches(text)
+        return {label: counts[label] / total if total else 0.0 for label, total in self.totals.items()}
+
+    def match_matrix(self, texts: Sequence[str]) -> np.ndarray:
+        """Матрица вхождений (текст × ключевое слово): 1, если слово встретилось в тексте"""
+        matches = np.zeros((len(texts), len(self._words)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            found = self.find_words(text or "")
+            if found:
+                matches[row, list(found)] = 1.0
+        return matches
+
+    def count_batch(self, texts: Sequence[str]) -> np.ndarray:
+        """Количество найденных ключевых слов каждой метки для пакета текстов (столбцы — self.labels)"""
+        return self.match_matrix(texts) @ self._membership
+
+    def score_batch(self, texts: Sequence[str]) -> np.ndarray:
+        """Доли найденных ключевых слов для пакета текстов (строки — тексты, столбцы — self.labels)"""
+        counts = self.count_batch(texts)
+        return np.divide(counts, self._label_totals, out=np.zeros_like(counts), where=self._label_totals > 0)
+
+class DocumentTypeKeywords:
+    """Автоматы ключевых слов типов документов по языкам, пересобираются при изменении конфигурации"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fingerprint: Optional[tuple] = None
+        self._automata: Dict[str, KeywordAutomaton] = {}
+
+    @staticmethod
+    def _config_fingerprint() -> tuple:
+        """Снимок ключевых слов из конфигурации для обнаружения изменений"""
+        return tuple(
+            (doc_type.type_id, tuple(doc_type.keywords_ro), tuple(doc_type.keywords_ru))
+            for doc_type in config.MOLDOVAN_DOCUMENT_TYPES
+        )
+
+    def get_automaton(self, language: str = "ru") -> KeywordAutomaton:
+        """Автомат для языка (ro — румынские ключевые слова, иначе русские)"""
+        language = "ro" if language == "ro" else "ru"
+        fingerprint = self._config_fingerprint()
+        with self._lock:
+            if fingerprint != self._fingerprint:
+                self._automata = {
+                    lang: KeywordAutomaton({
+                        doc_type.type_id: doc_type.keywords_ro if lang == "ro" else doc_type.keywords_ru
+                        for doc_type in config.MOLDOVAN_DOCUMENT_TYPES
+                    })
+                    for lang in ("ro", "ru")
+                }
+                self._fingerprint = fingerprint
+                logger.info("Автоматы ключевых слов типов документов построены")
+            return self._automata[language]
+
+    def score(self, text: str, language: str = "ru") -> Dict[str, float]:
+        """Уверенность для всех типов документов за один проход по тексту"""
+        return self.get_automaton(language).score(text)
+
+    def score_batch(self, texts: Sequence[str], language: str = "ru") -> Tuple[List[str], np.ndarray]:
+        """Типы документов (столбцы) и матрица уверенности для пакета текстов одного языка"""
+        automaton = self.get_automaton(language)
+        return automaton.labels, automaton.score_batch(texts)
+
+# Глобальный экземпляр
+document_type_keywords = DocumentTypeKeywords()
@@ -0,0 +1,35 @@
+"""
+Бюджет времени на обработку запроса
+Крайний срок хранится в контекстной переменной: вызовы OpenAI внутри обработки документа
+получают только оставшееся время и не запускаются, если оно исчерпано
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+# Крайний срок текущего запроса (time.monotonic) или None, если бюджета нет
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("latency_deadline", default=None)
+
+class LatencyBudgetExceeded(TimeoutError):
+    """Бюджет времени запроса исчерпан"""
+
+@contextmanager
+def latency_budget(seconds: Optional[float]) -> Iterator[None]:
+    """Бюджет времени на блок; вложенный бюджет не может продлить внешний"""
+    if not seconds or seconds <= 0:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining_budget() -> Optional[float]:
+    """Оставшееся время в секундах (может быть отрицательным) или None, если бюджета нет"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
@@ -0,0 +1,64 @@
+"""
+OCR по шаблонам документов
+Строки чернового прохода по уменьшенной странице заменяются текстом областей шаблона,
+распознанных в полном разрешении; остальная страница берётся из чернового прохода
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Sequence, Tuple
+
+from config import OcrRegion
+
+@dataclass
+class OcrLine:
+    """Строка OCR; границы — в долях ширины и высоты страницы"""
+    text: str
+    left: float
+    top: float
+    right: float
+    bottom: float
+    confidences: List[float] = field(default_factory=list)
+
+    def inside(self, region: OcrRegion) -> bool:
+        """Центр строки лежит в области"""
+        left, top, right, bottom = region.box
+        return left <= (self.left + self.right) / 2 < right and top <= (self.top + self.bottom) / 2 < bottom
+
+def lines_from_data(data: Dict[str, List[Any]], page_size: Tuple[int, int],
+                    offset: Tuple[int, int] = (0, 0)) -> List[OcrLine]:
+    """Строки из результата pytesseract.image_to_data; offset — левый верхний угол области на странице"""
+    width, height = page_size
+    lines: Dict[Tuple[int, int, int], OcrLine] = {}
+    for index, word in enumerate(data["text"]):
+        word = (word or "").strip()
+        if not word:
+            continue
+        key = (data["block_num"][index], data["par_num"][index], data["line_num"][index])
+        left = (offset[0] + data["left"][index]) / width
+        top = (offset[1] + data["top"][index]) / height
+        right = (offset[0] + data["left"][index] + data["width"][index]) / width
+        bottom = (offset[1] + data["top"][index] + data["height"][index]) / height
+        line = lines.get(key)
+        if line is None:
+            line = lines[key] = OcrLine(word, left, top, right, bottom)
+        else:
+            line.text = f"{line.text} {word}"
+            line.left, line.top = min(line.left, left), min(line.top, top)
+            line.right, line.bottom = max(line.right, right), max(line.bottom, bottom)
+        confidence = float(data["conf"][index])
+        if confidence > 0:
+            line.confidences.append(confidence)
+    return sorted(lines.values(), key=lambda line: (line.top, line.left))
+
+def merge_layout_text(draft_lines: Sequence[OcrLine],
+                      regions: Sequence[Tuple[OcrRegion, Sequence[OcrLine]]]) -> Tuple[str, float]:
+    """Текст страницы: строки областей вместо строк чернового прохода, попавших в эти области.
+    Возвращает текст и среднюю уверенность (0..1)"""
+    lines = [line for line in draft_lines if not any(line.inside(region) for region, _ in regions)]
+    for _, region_lines in regions:
+        lines.extend(region_lines)
+    lines.sort(key=lambda line: (line.top, line.left))
+
+    confidences = [confidence for line in lines for confidence in line.confidences]
+    average = sum(confidences) / len(confidences) / 100.0 if confidences else 0.0
+    return "\n".join(line.text for line in lines), average
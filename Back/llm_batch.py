@@ -0,0 +1,132 @@
+"""
+Пакетная обработка запросов LLM через OpenAI Batch API
+Для ночной переобработки архива задержка не важна: запросы упаковываются в JSONL-файлы
+и отправляются пакетами (дешевле и вне лимитов интерактивных запросов), результаты забираются опросом
+"""
+
+import json
+import logging
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from openai import OpenAI
+from openai.types import Batch
+from openai.types.chat import ChatCompletion
+
+from config import config
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+# Ограничения Batch API на один входной файл
+_MAX_FILE_BYTES = 200 * 1024 * 1024
+
+# Запросы пакета стоят половину цены обычных запросов
+BATCH_PRICE_FACTOR = 0.5
+
+@dataclass
+class BatchRequest:
+    """Запрос пакета: custom_id возвращается вместе с ответом"""
+    custom_id: str
+    body: Dict[str, Any]
+
+    def to_line(self) -> bytes:
+        return (json.dumps({"custom_id": self.custom_id, "method": "POST", "url": BATCH_ENDPOINT,
+                            "body": self.body}, ensure_ascii=False) + "\n").encode("utf-8")
+
+class LLMBatchClient:
+    """Отправка пакетов chat.completions, ожидание и чтение результатов"""
+
+    def __init__(self, client: Optional[OpenAI] = None, model: Optional[str] = None, max_requests: Optional[int] = None,
+                 poll_interval: Optional[float] = None, completion_window: Optional[str] = None,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.client = client or OpenAI(api_key=config.OPENAI_API_KEY, base_url=config.OPENAI_BASE_URL,
+                                       timeout=config.OPENAI_TIMEOUT, max_retries=config.OPENAI_MAX_RETRIES)
+        self.model = model or config.OPENAI_MODEL
+        self.max_requests = max_requests or config.OPENAI_BATCH_MAX_REQUESTS
+        self.poll_interval = config.OPENAI_BATCH_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.completion_window = completion_window or config.OPENAI_BATCH_COMPLETION_WINDOW
+        self.sleep = sleep
+
+    def _write_file(self, requests: Iterator[BatchRequest], pending: Optional[bytes],
+                    f) -> Tuple[int, Optional[bytes]]:
+        """Запись запросов в файл до лимита числа запросов или размера; возвращает число запросов
+        и строку, которая уже не поместилась в этот файл"""
+        count = size = 0
+        while count < self.max_requests:
+            if pending is not None:
+                line, pending = pending, None
+            else:
+                request = next(requests, None)
+                if request is None:
+                    break
+                # Модель по умолчанию, если запрос её не задаёт
+                line = BatchRequest(request.custom_id, {"model": self.model, **request.body}).to_line()
+            if count and size + len(line) > _MAX_FILE_BYTES:
+                return count, line
+            f.write(line)
+            count += 1
+            size += len(line)
+        return count, None
+
+    def submit(self, requests: Iterable[BatchRequest], metadata: Optional[Dict[str, str]] = None) -> List[str]:
+        """Упаковка запросов в JSONL-файлы и создание пакетов; возвращает идентификаторы пакетов"""
+        iterator = iter(requests)
+        batch_ids: List[str] = []
+        pending: Optional[bytes] = None
+        while True:
+            with tempfile.NamedTemporaryFile("wb", suffix=".jsonl", delete=False) as f:
+                count, pending = self._write_file(iterator, pending, f)
+                path = f.name
+            try:
+                if not count:
+                    break
+                with open(path, "rb") as f:
+                    input_file = self.client.files.create(file=f, purpose="batch")
+                batch = self.client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT,
+                                                   completion_window=self.completion_window, metadata=metadata)
+            finally:
+                os.remove(path)
+            metrics.increment("llm_batch_requests", count)
+            logger.info(f"Пакет OpenAI {batch.id} создан: {count} запросов")
+            batch_ids.append(batch.id)
+        return batch_ids
+
+    def wait(self, batch_id: str, timeout: Optional[float] = None) -> Batch:
+        """Опрос пакета до завершения (completed, failed, expired, cancelled) или истечения timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            if batch.status in TERMINAL_STATUSES:
+                logger.info(f"Пакет OpenAI {batch_id}: {batch.status}")
+                return batch
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Пакет OpenAI {batch_id} не завершён: {batch.status}")
+            logger.info(f"Пакет OpenAI {batch_id}: {batch.status}, ожидание {self.poll_interval:.0f} с")
+            self.sleep(self.poll_interval)
+
+    def results(self, batch: Batch) -> Dict[str, Optional[ChatCompletion]]:
+        """Ответы пакета по custom_id; для неудавшихся запросов — None"""
+        results: Dict[str, Optional[ChatCompletion]] = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                if response.get("status_code") == 200:
+                    results[record["custom_id"]] = ChatCompletion.model_validate(response["body"])
+                else:
+                    error = record.get("error") or (response.get("body") or {}).get("error")
+                    logger.warning(f"Запрос пакета {record['custom_id']} не выполнен: {error}")
+                    metrics.increment("llm_batch_failed")
+                    results[record["custom_id"]] = None
+        return results
@@ -0,0 +1,163 @@
+"""
+Дисковый кэш ответов LLM
+Ключ — хэш модели, нормализованного промпта и температуры (а также формата ответа).
+Записи живут LLM_CACHE_TTL_HOURS часов; при превышении LLM_CACHE_MAX_MB удаляются давно не использованные
+"""
+
+import contextvars
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from config import config
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Заголовок запроса, отключающий кэш для отладки
+CACHE_BYPASS_HEADER = "X-LLM-Cache-Bypass"
+
+# Флаг обхода кэша для текущего запроса (устанавливается по заголовку в Flask и FastAPI)
+llm_cache_bypass: contextvars.ContextVar[bool] = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+_WHITESPACE = re.compile(r"\s+")
+
+def bypass_requested(header_value: Optional[str]) -> bool:
+    """Значение заголовка обхода кэша: 1, true, yes"""
+    return (header_value or "").strip().lower() in ("1", "true", "yes")
+
+def normalize_prompt(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Сообщения без различий в пробелах и переносах строк (отступы промптов, повторный OCR)"""
+    normalized = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            content = _WHITESPACE.sub(" ", content).strip()
+        elif isinstance(content, list):
+            content = [{**part, "text": _WHITESPACE.sub(" ", part["text"]).strip()}
+                       if isinstance(part, dict) and isinstance(part.get("text"), str) else part
+                       for part in content]
+        normalized.append({"role": message.get("role"), "content": content})
+    return normalized
+
+def cache_key(model: str, messages: List[Dict[str, Any]], temperature: Optional[float] = None,
+              response_format: Optional[Dict[str, Any]] = None) -> str:
+    """Ключ кэша: модель, нормализованный промпт, температура и формат ответа"""
+    payload = json.dumps([model, normalize_prompt(messages), temperature, response_format],
+                         ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class LLMCache:
+    """Кэш ответов LLM в SQLite"""
+
+    def __init__(self, db_path: Optional[str] = None, ttl_seconds: Optional[float] = None,
+                 max_bytes: Optional[int] = None, clock: Callable[[], float] = time.time):
+        self.db_path = db_path or config.LLM_CACHE_PATH
+        self.ttl_seconds = config.LLM_CACHE_TTL_HOURS * 3600 if ttl_seconds is None else ttl_seconds
+        self.max_bytes = config.LLM_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._initialized = False
+        metrics.register_ratio("llm_cache_hit_rate", "llm_cache_hits", "llm_cache_lookups")
+
+    @contextmanager
+    def _connect(self):
+        """Соединение с базой кэша: транзакция фиксируется при выходе из блока"""
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            if not self._initialized:
+                self._init_database(conn)
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_database(self, conn: sqlite3.Connection) -> None:
+        """Создание таблицы кэша"""
+        with self._lock, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used)")
+            self._initialized = True
+
+    def get(self, key: str) -> Optional[str]:
+        """Ответ из кэша или None; устаревшая запись удаляется"""
+        metrics.increment("llm_cache_lookups")
+        try:
+            now = self.clock()
+            with self._connect() as conn:
+                row = conn.execute("SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row and now - row[1] > self.ttl_seconds:
+                    conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    row = None
+                if row:
+                    conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения кэша LLM: {e}")
+            row = None
+
+        if row:
+            metrics.increment("llm_cache_hits")
+            return row[0]
+        metrics.increment("llm_cache_misses")
+        return None
+
+    def put(self, key: str, model: str, response: str) -> None:
+        """Сохранение ответа; при превышении размера удаляются давно не использованные записи"""
+        try:
+            now = self.clock()
+            size = len(response.encode("utf-8"))
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, model, response, size, created_at, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", (key, model, response, size, now, now))
+                conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+                if total > self.max_bytes:
+                    evicted = self._evict(conn, total - self.max_bytes)
+                    metrics.increment("llm_cache_evictions", evicted)
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка записи кэша LLM: {e}")
+
+    def _evict(self, conn: sqlite3.Connection, excess: int) -> int:
+        """Удаление давно не использованных записей общим размером не меньше excess байт"""
+        keys, freed = [], 0
+        for key, size in conn.execute("SELECT key, size FROM llm_cache ORDER BY last_used"):
+            if freed >= excess:
+                break
+            keys.append((key,))
+            freed += size
+        conn.executemany("DELETE FROM llm_cache WHERE key = ?", keys)
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        """Размер кэша"""
+        try:
+            with self._connect() as conn:
+                entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            return {"entries": entries, "size_bytes": size}
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения кэша LLM: {e}")
+            return {"entries": 0, "size_bytes": 0}
+
+    def clear(self) -> None:
+        """Очистка кэша"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM llm_cache")
+
+# Глобальный экземпляр
+llm_cache = LLMCache()
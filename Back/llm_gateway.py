@@ -0,0 +1,431 @@
+"""
+Шлюз к OpenAI-совместимому API
+Запросы к каждому поставщику (OpenAI, локальный сервер) идут через один AsyncOpenAI с общим пулом HTTP-соединений.
+Параллельность ограничена семафором, частота запросов и токенов — ведрами токенов по лимитам аккаунта,
+повторные запросы отвечаются из дискового кэша (llm_cache), одинаковые одновременные — одним запросом,
+ответы ассистента можно получать потоком (stream) по мере генерации. Токены, стоимость и задержка
+каждого вызова записываются в журнал llm_usage.
+Цикл событий шлюза работает в фоновом потоке, поэтому синхронный код (Flask, DocumentProcessor)
+отправляет запросы и ждёт только результат, а не держит поток на время всего HTTP-обмена.
+Записи в SQLite (журнал и кэш) выполняются отдельным потоком, чтобы не останавливать цикл событий
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import openai
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from openai.types.chat import ChatCompletion
+import httpx
+
+from config import LLMProvider, config
+from llm_cache import LLMCache, cache_key, llm_cache, llm_cache_bypass
+from llm_usage import LLMUsageLog, UsageScope, llm_usage, llm_usage_scope
+from single_flight import SingleFlight
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from latency_budget import LatencyBudgetExceeded, remaining_budget
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Оценка числа токенов без токенизатора: около 4 символов на токен
+_CHARS_PER_TOKEN = 4
+_DEFAULT_MAX_TOKENS = 1000
+
+# Ошибки, которые говорят о недоступности или перегрузке сервиса
+_BREAKER_ERRORS = (asyncio.TimeoutError, openai.APITimeoutError, openai.APIConnectionError,
+                   openai.RateLimitError, openai.InternalServerError)
+
+def estimate_tokens(messages: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> int:
+    """Оценка токенов запроса для лимита TPM: текст сообщений и максимальная длина ответа"""
+    chars = 0
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, str):
+            chars += len(content)
+        else:
+            # Сообщение из частей (текст и изображения): учитывается только текст
+            chars += sum(len(part.get("text", "")) for part in content if isinstance(part, dict))
+    return chars // _CHARS_PER_TOKEN + (max_tokens or _DEFAULT_MAX_TOKENS)
+
+class TokenBucket:
+    """Ведро токенов: в среднем не больше per_minute единиц в минуту, всплеск — до capacity"""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def reserve(self, amount: float) -> float:
+        """Резервирование единиц; возвращает, сколько секунд нужно подождать.
+        Баланс может уйти в минус: следующие запросы ждут своей очереди за уже зарезервированными"""
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= min(amount, self.capacity)
+        return max(0.0, -self.tokens / self.rate)
+
+    async def acquire(self, amount: float = 1) -> None:
+        """Ожидание, пока лимит позволит выполнить запрос"""
+        wait = self.reserve(amount)
+        if wait > 0:
+            logger.debug(f"Лимит OpenAI: ожидание {wait:.2f} с")
+            await asyncio.sleep(wait)
+
+class LLMGateway:
+    """Общий асинхронный клиент OpenAI с ограничением параллельности и частоты запросов"""
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 model: Optional[str] = None, max_concurrency: Optional[int] = None,
+                 requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None,
+                 timeout: Optional[float] = None, max_retries: Optional[int] = None,
+                 cache: Optional[LLMCache] = None, usage: Optional[LLMUsageLog] = None, name: str = "openai"):
+        self.name = name
+        self.api_key = api_key or config.OPENAI_API_KEY
+        self.base_url = base_url or config.OPENAI_BASE_URL
+        self.model = model or config.OPENAI_MODEL
+        self.max_concurrency = max_concurrency or config.OPENAI_MAX_CONCURRENCY
+        self.requests_per_minute = requests_per_minute or config.OPENAI_REQUESTS_PER_MINUTE
+        self.tokens_per_minute = tokens_per_minute or config.OPENAI_TOKENS_PER_MINUTE
+        self.timeout = timeout or config.OPENAI_TIMEOUT
+        self.max_retries = config.OPENAI_MAX_RETRIES if max_retries is None else max_retries
+        self.cache = cache if cache is not None else (llm_cache if config.LLM_CACHE_ENABLED else None)
+        self.usage = usage if usage is not None else (llm_usage if config.LLM_USAGE_ENABLED else None)
+        # Одинаковые одновременные запросы объединяются в один
+        self._single_flight = SingleFlight("llm")
+        # После серии ошибок и таймаутов запросы сразу отклоняются
+        self.breaker = CircuitBreaker(name)
+        # Средняя задержка до первого фрагмента потокового ответа
+        metrics.register_ratio("llm_first_token_avg_ms", "llm_stream_first_token_ms", "llm_streams")
+
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        # Поток записи журнала и кэша: запросы в SQLite не блокируют цикл событий
+        self._writer: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._client: Optional[AsyncOpenAI] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._request_bucket: Optional[TokenBucket] = None
+        self._token_bucket: Optional[TokenBucket] = None
+
+    @classmethod
+    def from_provider(cls, provider: LLMProvider, **kwargs) -> "LLMGateway":
+        """Шлюз к поставщику из config.LLM_PROVIDERS"""
+        return cls(api_key=provider.api_key, base_url=provider.base_url, model=provider.model,
+                   max_concurrency=provider.max_concurrency, requests_per_minute=provider.requests_per_minute,
+                   tokens_per_minute=provider.tokens_per_minute, timeout=provider.timeout, name=provider.name, **kwargs)
+
+    @property
+    def available(self) -> bool:
+        """Ключ API настроен"""
+        return bool(self.api_key)
+
+    def _start(self) -> asyncio.AbstractEventLoop:
+        """Запуск цикла событий шлюза в фоновом потоке при первом запросе"""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="llm-gateway", daemon=True)
+                thread.start()
+                self._writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-gateway-writer")
+                asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+                self._loop, self._thread = loop, thread
+                logger.info(f"Шлюз LLM {self.name} ({self.model}) запущен: до {self.max_concurrency} запросов одновременно, "
+                            f"{self.requests_per_minute} запросов и {self.tokens_per_minute} токенов в минуту")
+            return self._loop
+
+    async def _setup(self) -> None:
+        """Клиент, семафор и ведра создаются внутри цикла шлюза"""
+        limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+        self._client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, timeout=self.timeout,
+                                   max_retries=self.max_retries, http_client=DefaultAsyncHttpxClient(limits=limits))
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._request_bucket = TokenBucket(self.requests_per_minute)
+        self._token_bucket = TokenBucket(self.tokens_per_minute)
+
+    def _rejection(self) -> Optional[Exception]:
+        """Причина быстрого отказа: бюджет запроса исчерпан или OpenAI недавно не отвечал"""
+        remaining = remaining_budget()
+        if remaining is not None and remaining <= 0:
+            metrics.increment("llm_budget_exceeded")
+            return LatencyBudgetExceeded("Бюджет времени запроса исчерпан")
+        if not self.breaker.allow():
+            return CircuitOpenError("OpenAI временно недоступен")
+        return None
+
+    def _call_timeout(self) -> float:
+        """Таймаут вызова: ожидание лимитов тоже расходует бюджет, запрос получает только оставшееся время"""
+        remaining = remaining_budget()
+        if remaining is not None and remaining <= 0:
+            metrics.increment("llm_budget_exceeded")
+            raise LatencyBudgetExceeded("Бюджет времени запроса исчерпан до вызова OpenAI")
+        return self.timeout if remaining is None else min(self.timeout, remaining)
+
+    @contextmanager
+    def _breaker_guard(self, timeout: float) -> Iterator[None]:
+        """Учёт результата вызова в выключателе; timeout — таймаут вызова после ограничения бюджетом"""
+        try:
+            yield
+        except asyncio.TimeoutError as e:
+            if timeout < self.timeout:
+                # Истёк бюджет документа, а не таймаут сервиса: выключатель не размыкается
+                metrics.increment("llm_budget_exceeded")
+                raise LatencyBudgetExceeded("Бюджет времени запроса исчерпан во время вызова OpenAI") from e
+            self.breaker.record_failure()
+            raise
+        except _BREAKER_ERRORS:
+            self.breaker.record_failure()
+            raise
+        except openai.APIStatusError:
+            # Ошибка запроса (4xx), а не сервиса: выключатель не размыкается
+            self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+
+    def _record_usage(self, model: str, usage: Any, status: str = "ok", latency_ms: Optional[float] = None,
+                      wait_ms: Optional[float] = None, scope: Optional[UsageScope] = None) -> None:
+        """Запись вызова в журнал llm_usage; usage — токены из ответа (CompletionUsage или None)"""
+        if self.usage is None:
+            return
+        self.usage.record(self.name, model, usage.prompt_tokens if usage else 0, usage.completion_tokens if usage else 0,
+                          latency_ms=latency_ms, wait_ms=wait_ms, status=status, scope=scope)
+
+    async def _write(self, func: Callable[..., Any], *args, **kwargs) -> None:
+        """Запись в журнал или кэш в потоке записи; цикл событий тем временем обслуживает другие запросы"""
+        await asyncio.get_running_loop().run_in_executor(self._writer, functools.partial(func, *args, **kwargs))
+
+    async def _write_usage(self, model: str, usage: Any, status: str, start: float, queued: float) -> None:
+        """Запись вызова из цикла шлюза: контекст вызывающего (эндпоинт, документ) передаётся явно"""
+        if self.usage is None:
+            return
+        await self._write(self._record_usage, model, usage, status, (time.perf_counter() - start) * 1000,
+                          (start - queued) * 1000, llm_usage_scope.get())
+
+    async def _complete(self, key: Optional[str] = None, **kwargs) -> Any:
+        """Запрос chat.completions с соблюдением лимитов и бюджета времени; ответ сохраняется в кэш по ключу key.
+        Время ожидания лимитов и самого запроса записывается в журнал вместе с токенами"""
+        queued = time.perf_counter()
+        await self._request_bucket.acquire(1)
+        await self._token_bucket.acquire(estimate_tokens(kwargs["messages"], kwargs.get("max_tokens")))
+        async with self._semaphore:
+            timeout = self._call_timeout()
+            start = time.perf_counter()
+            try:
+                with self._breaker_guard(timeout):
+                    # wait_for ограничивает и повторные попытки клиента OpenAI
+                    response = await asyncio.wait_for(self._client.chat.completions.create(**kwargs), timeout)
+            except Exception:
+                await self._write_usage(kwargs["model"], None, "error", start, queued)
+                raise
+        await self._write_usage(kwargs["model"], response.usage, "ok", start, queued)
+        if key:
+            await self._write(self.cache.put, key, kwargs["model"], response.model_dump_json())
+        return response
+
+    async def _stream(self, chunks: "queue.Queue[Any]", **kwargs) -> None:
+        """Потоковый запрос chat.completions: фрагменты текста кладутся в очередь, в конце — None или ошибка"""
+        queued = time.perf_counter()
+        start: Optional[float] = None
+        usage = None
+        try:
+            await self._request_bucket.acquire(1)
+            await self._token_bucket.acquire(estimate_tokens(kwargs["messages"], kwargs.get("max_tokens")))
+            async with self._semaphore:
+                timeout = self._call_timeout()
+                start = time.perf_counter()
+                with self._breaker_guard(timeout):
+                    # Последний фрагмент содержит только расход токенов
+                    stream = await asyncio.wait_for(self._client.chat.completions.create(
+                        stream=True, stream_options={"include_usage": True}, **kwargs), timeout)
+                    async for chunk in stream:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            chunks.put(chunk.choices[0].delta.content)
+                        if chunk.usage:
+                            usage = chunk.usage
+            await self._write_usage(kwargs["model"], usage, "ok", start, queued)
+            chunks.put(None)
+        except BaseException as e:
+            chunks.put(e)
+            if start is not None:
+                # Прерванный поток (ошибка или отключение клиента) тоже расходует токены
+                status = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+                await self._write_usage(kwargs["model"], usage, status, start, queued)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+
+    def submit(self, use_cache: bool = True, **kwargs) -> concurrent.futures.Future:
+        """Отправка запроса chat.completions без ожидания ответа.
+        Ответ из кэша возвращается сразу, одинаковый запрос, который уже выполняется, не отправляется повторно;
+        контекст вызывающего потока (contextvars) переносится в задачу шлюза"""
+        if not self.available:
+            raise RuntimeError("OpenAI API ключ не настроен")
+        kwargs.setdefault("model", self.model)
+        key = cache_key(kwargs["model"], kwargs["messages"], kwargs.get("temperature"), kwargs.get("response_format"))
+
+        cacheable = bool(self.cache) and use_cache and not llm_cache_bypass.get()
+        if cacheable:
+            cached = self.cache.get(key)
+            if cached is not None:
+                response = ChatCompletion.model_validate_json(cached)
+                self._record_usage(kwargs["model"], response.usage, "cached")
+                future: concurrent.futures.Future = concurrent.futures.Future()
+                future.set_result(response)
+                return future
+
+        future, leader = self._single_flight.join(key)
+        if not leader:
+            return future
+
+        rejection = self._rejection()
+        if rejection is not None:
+            self._single_flight.resolve(key, exception=rejection)
+            return future
+
+        try:
+            loop = self._start()
+        except BaseException as e:
+            self._single_flight.resolve(key, exception=e)
+            raise
+        context = contextvars.copy_context()
+
+        def copy_result(task: asyncio.Task) -> None:
+            if task.cancelled():
+                self._single_flight.resolve(key, exception=concurrent.futures.CancelledError())
+            else:
+                self._single_flight.resolve(key, task.result() if task.exception() is None else None,
+                                            task.exception())
+
+        def schedule() -> None:
+            task = loop.create_task(self._complete(key=key if cacheable else None, **kwargs), context=context)
+            task.add_done_callback(copy_result)
+
+        loop.call_soon_threadsafe(schedule)
+        return future
+
+    def stream(self, messages: List[Dict[str, Any]], use_cache: bool = True, **kwargs) -> Iterator[str]:
+        """Потоковый запрос chat.completions: фрагменты ответа по мере генерации.
+        Кэш, выключатель и бюджет проверяются сразу при вызове, чтобы ошибку можно было вернуть до начала потока;
+        задержка до первого фрагмента учитывается в метриках"""
+        if not self.available:
+            raise RuntimeError("OpenAI API ключ не настроен")
+        start = time.perf_counter()
+        kwargs.setdefault("model", self.model)
+        kwargs["messages"] = messages
+        key = cache_key(kwargs["model"], messages, kwargs.get("temperature"), kwargs.get("response_format"))
+
+        cacheable = bool(self.cache) and use_cache and not llm_cache_bypass.get()
+        if cacheable:
+            cached = self.cache.get(key)
+            if cached is not None:
+                response = ChatCompletion.model_validate_json(cached)
+                self._record_usage(kwargs["model"], response.usage, "cached")
+                content = response.choices[0].message.content or ""
+                return iter([content] if content else [])
+
+        rejection = self._rejection()
+        if rejection is not None:
+            raise rejection
+
+        loop = self._start()
+        context = contextvars.copy_context()
+        chunks: "queue.Queue[Any]" = queue.Queue()
+        tasks: List[asyncio.Task] = []
+
+        def schedule() -> None:
+            tasks.append(loop.create_task(self._stream(chunks, **kwargs), context=context))
+
+        loop.call_soon_threadsafe(schedule)
+
+        def iterate() -> Iterator[str]:
+            parts: List[str] = []
+            try:
+                while True:
+                    item = chunks.get()
+                    if item is None:
+                        break
+                    if isinstance(item, BaseException):
+                        raise item
+                    if not parts:
+                        metrics.increment("llm_streams")
+                        metrics.increment("llm_stream_first_token_ms", int((time.perf_counter() - start) * 1000))
+                    parts.append(item)
+                    yield item
+            finally:
+                # Клиент отключился до конца ответа: генерация прекращается
+                if tasks and not tasks[0].done():
+                    loop.call_soon_threadsafe(tasks[0].cancel)
+            if cacheable and parts:
+                self.cache.put(key, kwargs["model"], ChatCompletion.model_validate({
+                    "id": f"chatcmpl-stream-{key[:16]}", "object": "chat.completion", "created": int(time.time()),
+                    "model": kwargs["model"],
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": "".join(parts)}}],
+                }).model_dump_json())
+
+        return iterate()
+
+    def chat_sync(self, messages: List[Dict[str, Any]], **kwargs) -> Any:
+        """Синхронный запрос chat.completions"""
+        return self.submit(messages=messages, **kwargs).result()
+
+    async def chat(self, messages: List[Dict[str, Any]], **kwargs) -> Any:
+        """Асинхронный запрос chat.completions из любого цикла событий"""
+        return await asyncio.wrap_future(self.submit(messages=messages, **kwargs))
+
+    async def _shutdown(self) -> None:
+        """Отмена незавершённых запросов (они успевают записать себя в журнал) и закрытие соединений"""
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._client.close()
+
+    def close(self) -> None:
+        """Закрытие соединений и остановка цикла шлюза"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+            self._writer.shutdown(wait=True)
+            self._loop = self._thread = self._client = self._writer = None
+
+# Глобальный экземпляр
+llm_gateway = LLMGateway()
+
+# Шлюзы остальных поставщиков создаются при первом обращении
+_gateways: Dict[str, LLMGateway] = {}
+_gateways_lock = threading.Lock()
+
+def created_gateways() -> Dict[str, LLMGateway]:
+    """Все созданные шлюзы по именам поставщиков, начиная с общего llm_gateway"""
+    with _gateways_lock:
+        return {llm_gateway.name: llm_gateway, **_gateways}
+
+def get_gateway(provider: Optional[str] = None) -> LLMGateway:
+    """Шлюз поставщика LLM по имени из config.LLM_PROVIDERS (openai — общий llm_gateway)"""
+    name = provider or "openai"
+    if name == "openai":
+        return llm_gateway
+    with _gateways_lock:
+        gateway = _gateways.get(name)
+        if gateway is None:
+            settings = config.LLM_PROVIDERS.get(name)
+            if settings is None:
+                raise ValueError(f"Неизвестный поставщик LLM: {name}")
+            gateway = _gateways[name] = LLMGateway.from_provider(settings)
+        return gateway
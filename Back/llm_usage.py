@@ -0,0 +1,174 @@
+"""
+Учёт расхода и задержки вызовов LLM
+Каждый вызов шлюза записывается в таблицу llm_usage: модель, токены запроса и ответа, стоимость по ценам
+поставщика, время ожидания лимитов и самого запроса. Вызов относится к эндпоинту и документу текущего
+контекста (llm_usage_scope); тип документа и его идентификатор в базе дописываются после обработки,
+чтобы расход можно было сгруппировать по типам документов
+"""
+
+import contextvars
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Поля, по которым группируется сводка расхода
+GROUP_FIELDS = ("doc_type", "endpoint", "model", "provider", "document")
+
+@dataclass(frozen=True)
+class UsageScope:
+    """К чему относятся вызовы LLM: эндпоинт и ключ документа (имя загруженного файла)"""
+    endpoint: Optional[str] = None
+    document: Optional[str] = None
+
+# Контекст текущего запроса или обработки документа (устанавливается во Flask, FastAPI и DocumentProcessor)
+llm_usage_scope: contextvars.ContextVar[UsageScope] = contextvars.ContextVar("llm_usage_scope", default=UsageScope())
+
+@contextmanager
+def usage_scope(endpoint: Optional[str] = None, document: Optional[str] = None) -> Iterator[UsageScope]:
+    """Вызовы LLM внутри блока относятся к эндпоинту и документу; незаданные поля берутся из внешнего контекста"""
+    current = llm_usage_scope.get()
+    scope = replace(current, endpoint=endpoint or current.endpoint, document=document or current.document)
+    token = llm_usage_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        llm_usage_scope.reset(token)
+
+def call_cost(provider: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Стоимость вызова в долларах по ценам поставщика из config.LLM_PROVIDERS"""
+    settings = config.LLM_PROVIDERS.get(provider)
+    if settings is None:
+        return 0.0
+    return (prompt_tokens * settings.input_price + completion_tokens * settings.output_price) / 1_000_000
+
+class LLMUsageLog:
+    """Журнал вызовов LLM в SQLite"""
+
+    def __init__(self, db_path: Optional[str] = None, retention_days: Optional[float] = None,
+                 clock: Callable[[], float] = time.time):
+        self.db_path = db_path or config.LLM_USAGE_PATH
+        self.retention_days = config.LLM_USAGE_RETENTION_DAYS if retention_days is None else retention_days
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    @contextmanager
+    def _connect(self):
+        """Соединение с базой журнала: транзакция фиксируется при выходе из блока"""
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            if not self._initialized:
+                self._init_database(conn)
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_database(self, conn: sqlite3.Connection) -> None:
+        """Создание таблицы журнала и удаление записей старше срока хранения"""
+        with self._lock, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_usage (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at REAL NOT NULL,
+                    endpoint TEXT,
+                    document TEXT,
+                    document_id INTEGER,
+                    doc_type TEXT,
+                    provider TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    prompt_tokens INTEGER NOT NULL,
+                    completion_tokens INTEGER NOT NULL,
+                    cost_usd REAL NOT NULL,
+                    latency_ms REAL,
+                    wait_ms REAL,
+                    status TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_usage_created_at ON llm_usage (created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_usage_document ON llm_usage (document)")
+            if self.retention_days:
+                conn.execute("DELETE FROM llm_usage WHERE created_at < ?",
+                             (self.clock() - self.retention_days * 86400,))
+            self._initialized = True
+
+    def record(self, provider: str, model: str, prompt_tokens: int = 0, completion_tokens: int = 0,
+               latency_ms: Optional[float] = None, wait_ms: Optional[float] = None, status: str = "ok",
+               cost_factor: float = 1.0, scope: Optional[UsageScope] = None, document_id: Optional[int] = None,
+               doc_type: Optional[str] = None) -> None:
+        """Запись вызова; status: ok, error, cancelled (клиент отключился), cached (ответ из кэша, без оплаты)"""
+        scope = scope or llm_usage_scope.get()
+        cost = 0.0 if status == "cached" else call_cost(provider, prompt_tokens, completion_tokens) * cost_factor
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO llm_usage (created_at, endpoint, document, document_id, doc_type, provider, model, "
+                    "prompt_tokens, completion_tokens, cost_usd, latency_ms, wait_ms, status) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (self.clock(), scope.endpoint, scope.document, document_id, doc_type, provider, model,
+                     prompt_tokens, completion_tokens, cost, latency_ms, wait_ms, status))
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка записи журнала LLM: {e}")
+
+    def attribute(self, document: Optional[str], document_id: Optional[int] = None,
+                  doc_type: Optional[str] = None) -> None:
+        """Тип документа и его идентификатор в базе для всех вызовов, сделанных при его обработке"""
+        if not document or (document_id is None and doc_type is None):
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute("UPDATE llm_usage SET document_id = COALESCE(?, document_id), "
+                             "doc_type = COALESCE(?, doc_type) WHERE document = ?", (document_id, doc_type, document))
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка записи журнала LLM: {e}")
+
+    def summary(self, group_by: str = "doc_type", since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Расход и задержка вызовов, сгруппированные по полю group_by, начиная с момента since; дорогие — первыми"""
+        if group_by not in GROUP_FIELDS:
+            raise ValueError(f"Группировка возможна по полям: {', '.join(GROUP_FIELDS)}")
+        query = f"""
+            SELECT {group_by}, COUNT(*), SUM(status = 'cached'), SUM(status = 'error'), COUNT(DISTINCT document),
+                   SUM(prompt_tokens), SUM(completion_tokens), SUM(cost_usd), AVG(latency_ms), MAX(latency_ms),
+                   AVG(wait_ms)
+            FROM llm_usage WHERE created_at >= ? GROUP BY {group_by} ORDER BY SUM(cost_usd) DESC, COUNT(*) DESC
+        """
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(query, (since or 0,)).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения журнала LLM: {e}")
+            return []
+
+        summary = []
+        for key, calls, cached, errors, documents, prompt, completion, cost, avg_latency, max_latency, avg_wait in rows:
+            summary.append({
+                group_by: key,
+                "calls": calls,
+                "cached_calls": cached,
+                "failed_calls": errors,
+                "documents": documents,
+                "prompt_tokens": prompt,
+                "completion_tokens": completion,
+                "cost_usd": round(cost, 8),
+                "cost_per_document_usd": round(cost / documents, 8) if documents else None,
+                "avg_latency_ms": round(avg_latency, 1) if avg_latency is not None else None,
+                "max_latency_ms": round(max_latency, 1) if max_latency is not None else None,
+                "avg_wait_ms": round(avg_wait, 1) if avg_wait is not None else None,
+            })
+        return summary
+
+    def clear(self) -> None:
+        """Очистка журнала"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM llm_usage")
+
+# Глобальный экземпляр
+llm_usage = LLMUsageLog()
@@ -0,0 +1,231 @@
+"""
+Локальный статистический классификатор типов документов
+Хешированные символьные n-граммы с TF-IDF и линейная модель (softmax) на NumPy.
+Работает между ключевыми словами и OpenAI: LLM вызывается только для неоднозначных документов
+"""
+
+import os
+import re
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Константы хеширования n-грамм (64-битная арифметика, переполнение по модулю 2^64)
+_HASH_PRIME = np.uint64(1099511628211)
+_HASH_MIX = np.uint64(0xBF58476D1CE4E5B9)
+
+class HashingFeaturizer:
+    """Хешированные символьные n-граммы: устойчивы к ошибкам OCR и не требуют словаря"""
+
+    def __init__(self, n_features: int = config.LOCAL_CLASSIFIER_FEATURES,
+                 ngram_sizes: Sequence[int] = (3, 4, 5), max_chars: int = 4000):
+        if n_features & (n_features - 1):
+            raise ValueError("Количество признаков должно быть степенью двойки")
+        self.n_features = n_features
+        self.ngram_sizes = tuple(ngram_sizes)
+        self.max_chars = max_chars
+
+    def _hash_ngrams(self, text: str) -> np.ndarray:
+        """Номера признаков всех n-грамм текста"""
+        text = _WHITESPACE.sub(" ", text.lower()).strip()[:self.max_chars]
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        mask = np.uint64(self.n_features - 1)
+        hashes = []
+        for size in self.ngram_sizes:
+            count = len(codes) - size + 1
+            if count <= 0:
+                continue
+            value = np.full(count, size, dtype=np.uint64)
+            for offset in range(size):
+                value = value * _HASH_PRIME + codes[offset:offset + count]
+            value ^= value >> np.uint64(29)
+            value *= _HASH_MIX
+            value ^= value >> np.uint64(32)
+            hashes.append(value & mask)
+        return np.concatenate(hashes) if hashes else np.empty(0, dtype=np.uint64)
+
+    def transform(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Разреженная матрица частот в формате CSR: (границы строк, номера признаков, частоты)"""
+        indptr = [0]
+        indices = []
+        counts = []
+        for text in texts:
+            features, feature_counts = np.unique(self._hash_ngrams(text or ""), return_counts=True)
+            indices.append(features.astype(np.int64))
+            counts.append(feature_counts.astype(np.float32))
+            indptr.append(indptr[-1] + len(features))
+        return (np.asarray(indptr, dtype=np.int64),
+                np.concatenate(indices) if indices else np.empty(0, dtype=np.int64),
+                np.concatenate(counts) if counts else np.empty(0, dtype=np.float32))
+
+def _segment_sum(values: np.ndarray, indptr: np.ndarray) -> np.ndarray:
+    """Суммы строк values по сегментам CSR (пустые сегменты дают ноль)"""
+    n_segments = len(indptr) - 1
+    result = np.zeros((n_segments,) + values.shape[1:], dtype=values.dtype)
+    starts = indptr[:-1]
+    non_empty = indptr[1:] > starts
+    if values.size and non_empty.any():
+        result[non_empty] = np.add.reduceat(values, starts[non_empty], axis=0)
+    return result
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+class LocalDocumentClassifier:
+    """Мультиклассовая логистическая регрессия поверх TF-IDF хешированных n-грамм"""
+
+    def __init__(self, featurizer: Optional[HashingFeaturizer] = None):
+        self.featurizer = featurizer or HashingFeaturizer()
+        self.labels: List[str] = []
+        self.idf: Optional[np.ndarray] = None
+        self.weights: Optional[np.ndarray] = None
+        self.bias: Optional[np.ndarray] = None
+
+    def _tfidf(self, indptr: np.ndarray, indices: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        """Сублинейный TF, умноженный на IDF, с L2-нормировкой каждой строки"""
+        values = (1.0 + np.log(counts)) * self.idf[indices]
+        norms = np.sqrt(_segment_sum(values * values, indptr))
+        row_lengths = np.diff(indptr)
+        return values / np.repeat(np.maximum(norms, 1e-12), row_lengths)
+
+    def fit(self, texts: Sequence[str], labels: Sequence[str], epochs: int = 150,
+            learning_rate: float = 0.05, l2: float = 1e-4) -> "LocalDocumentClassifier":
+        """Обучение полным градиентным спуском (Adam) на всей выборке"""
+        self.labels = sorted(set(labels))
+        label_index = {label: index for index, label in enumerate(self.labels)}
+        targets = np.zeros((len(texts), len(self.labels)), dtype=np.float32)
+        targets[np.arange(len(texts)), [label_index[label] for label in labels]] = 1.0
+
+        indptr, indices, counts = self.featurizer.transform(texts)
+        row_lengths = np.diff(indptr)
+        rows = np.repeat(np.arange(len(texts)), row_lengths)
+
+        # IDF по числу документов, в которых встречается признак
+        document_frequency = np.bincount(indices, minlength=self.featurizer.n_features)
+        self.idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+        values = self._tfidf(indptr, indices, counts)
+
+        # Для градиента по весам ненулевые элементы группируются по признакам
+        order = np.argsort(indices, kind="stable")
+        features, feature_starts = np.unique(indices[order], return_index=True)
+        feature_indptr = np.append(feature_starts, len(order))
+
+        # Обучаются только веса признаков, встретившихся в выборке (компактная матрица)
+        n_classes = len(self.labels)
+        compact_indices = np.searchsorted(features, indices)
+        weights = np.zeros((len(features), n_classes), dtype=np.float32)
+        bias = np.zeros(n_classes, dtype=np.float32)
+        adam = [np.zeros_like(weights), np.zeros_like(weights), np.zeros_like(bias), np.zeros_like(bias)]
+        beta1, beta2 = 0.9, 0.999
+        for step in range(1, epochs + 1):
+            logits = _segment_sum(values[:, None] * weights[compact_indices], indptr) + bias
+            error = (_softmax(logits) - targets) / len(texts)
+            gradient = _segment_sum((values[:, None] * error[rows])[order], feature_indptr) + l2 * weights
+            for param, grad, first, second in ((weights, gradient, adam[0], adam[1]),
+                                               (bias, error.sum(axis=0), adam[2], adam[3])):
+                first *= beta1
+                first += (1 - beta1) * grad
+                second *= beta2
+                second += (1 - beta2) * grad * grad
+                param -= (learning_rate * (first / (1 - beta1 ** step))
+                          / (np.sqrt(second / (1 - beta2 ** step)) + 1e-8))
+
+        self.weights = np.zeros((self.featurizer.n_features, n_classes), dtype=np.float32)
+        self.weights[features] = weights
+        self.bias = bias
+
+        logger.info(f"Локальный классификатор обучен: {len(texts)} документов, {n_classes} типов")
+        return self
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        """Вероятности типов для пакета текстов (строки — тексты, столбцы — self.labels)"""
+        indptr, indices, counts = self.featurizer.transform(texts)
+        values = self._tfidf(indptr, indices, counts)
+        logits = _segment_sum(values[:, None] * self.weights[indices], indptr) + self.bias
+        return _softmax(logits)
+
+    def classify(self, text: str) -> Tuple[str, float]:
+        """Тип документа и вероятность"""
+        probabilities = self.predict_proba([text])[0]
+        best = int(np.argmax(probabilities))
+        return self.labels[best], float(probabilities[best])
+
+    def save(self, path: Path):
+        """Сохранение модели в .npz: файл пишется рядом и подменяется целиком, чтобы работающий
+        сервер не прочитал недописанную модель"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(
+                    f, weights=self.weights, bias=self.bias, idf=self.idf, labels=np.array(self.labels),
+                    n_features=self.featurizer.n_features, ngram_sizes=np.array(self.featurizer.ngram_sizes),
+                    max_chars=self.featurizer.max_chars,
+                )
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        logger.info(f"Локальный классификатор сохранён: {path}")
+
+    @classmethod
+    def load(cls, path: Path) -> "LocalDocumentClassifier":
+        """Загрузка модели из .npz"""
+        with np.load(path) as data:
+            model = cls(HashingFeaturizer(int(data["n_features"]), tuple(int(size) for size in data["ngram_sizes"]),
+                                          int(data["max_chars"])))
+            model.weights = data["weights"]
+            model.bias = data["bias"]
+            model.idf = data["idf"]
+            model.labels = [str(label) for label in data["labels"]]
+        return model
+
+def load_training_data(storage) -> Tuple[List[str], List[str]]:
+    """Обучающая выборка из хранилища: только документы, подтверждённые или исправленные пользователем.
+    Тип остальных документов назначил сам классификатор, и обучение на них закрепляло бы его ошибки"""
+    documents = storage.get_documents({"verified": True})
+    pairs = [(doc.raw_text, doc.doc_type) for doc in documents
+             if doc.raw_text and doc.raw_text.strip() and doc.doc_type != "unknown"]
+    return [text for text, _ in pairs], [label for _, label in pairs]
+
+class LocalClassifierProvider:
+    """Модель с диска; перечитывается, когда файл модели меняется после переобучения"""
+
+    def __init__(self, path: Path = config.LOCAL_CLASSIFIER_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._model: Optional[LocalDocumentClassifier] = None
+
+    def get(self) -> Optional[LocalDocumentClassifier]:
+        """Текущая модель или None, если модель ещё не обучена"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if mtime != self._mtime:
+                try:
+                    self._model = LocalDocumentClassifier.load(self.path)
+                    logger.info(f"Локальный классификатор загружен: {self.path}")
+                except Exception as e:
+                    logger.error(f"Ошибка загрузки локального классификатора: {e}")
+                    self._model = None
+                self._mtime = mtime
+            return self._model
+
+# Глобальный экземпляр
+local_classifier = LocalClassifierProvider()
@@ -13,6 +13,7 @@ from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Depends, Re
 from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import json
 import pandas as pd
@@ -22,12 +23,18 @@ import io
 from config import config
 from i18n import i18n
 from document_processor import document_processor
-from document_storage import DocumentStorage
+from async_storage import AsyncDocumentStorage, get_async_storage, shutdown_async_storage
 from data_models import (
     DocumentData, DocumentResponse, UploadResponse, ReportRequest, LanguageRequest
 )
 from report_generator_v2 import report_generator_v2
+from report_scheduler import fiscal_report_scheduler
 from conversion_tools import conversion_tools
+from metrics import metrics
+from llm_gateway import LLMGateway, created_gateways, llm_gateway
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN
+from llm_cache import CACHE_BYPASS_HEADER, bypass_requested, llm_cache, llm_cache_bypass
+from llm_usage import UsageScope, llm_usage, llm_usage_scope, usage_scope
 
 # Настройка логирования
 logging.basicConfig(
@@ -63,12 +70,25 @@ app.add_middleware(
 )
 
 # Инициализация компонентов
-storage = DocumentStorage()
+# Хранилище документов общее для всех модулей; обработчики получают его асинхронный фасад
+# через Depends(get_async_storage), чтобы запросы к базе не блокировали цикл событий
 # report_gen = ReportGenerator(storage) # Удалено, используется report_generator_v2
 
 # Модели данных
 # Перенесены в data_models.py
 
+@app.on_event("startup")
+async def start_background_jobs():
+    """Запуск фоновых задач приложения"""
+    if config.FISCAL_PRECOMPUTE_ENABLED:
+        fiscal_report_scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    """Остановка фоновых задач приложения"""
+    fiscal_report_scheduler.stop()
+    shutdown_async_storage()
+
 # Функции зависимостей
 def get_language(lang: str = Query("ru", description="Язык интерфейса")):
     """Получение языка из query параметра"""
@@ -96,10 +116,41 @@ async def health_check():
         "tesseract_available": bool(config.TESSERACT_PATH)
     }
 
+@app.middleware("http")
+async def set_llm_cache_bypass(request: Request, call_next):
+    """Обход кэша ответов LLM по заголовку X-LLM-Cache-Bypass (для отладки)"""
+    llm_cache_bypass.set(bypass_requested(request.headers.get(CACHE_BYPASS_HEADER)))
+    return await call_next(request)
+
+@app.middleware("http")
+async def set_llm_usage_scope(request: Request, call_next):
+    """Вызовы LLM во время запроса относятся в журнале llm_usage к его эндпоинту"""
+    llm_usage_scope.set(UsageScope(endpoint=request.url.path))
+    return await call_next(request)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Счётчики обработки документов и размер кэша LLM"""
+    return {**metrics.snapshot(), "llm_cache": llm_cache.stats() if config.LLM_CACHE_ENABLED else None}
+
+@app.get("/metrics/llm-usage")
+async def get_llm_usage(
+    group_by: str = Query("doc_type", description="Группировка: doc_type, endpoint, model, provider, document"),
+    days: float = Query(30, gt=0, description="За сколько последних дней")
+):
+    """Токены, стоимость и задержка вызовов LLM, сгруппированные по типам документов или эндпоинтам"""
+    try:
+        since = datetime.now().timestamp() - days * 86400
+        usage = await run_in_threadpool(llm_usage.summary, group_by, since)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"group_by": group_by, "days": days, "usage": usage}
+
 @app.post("/upload", response_model=UploadResponse)
 async def upload_document(
     file: UploadFile = File(...),
-    language: str = Query("ru", description="Язык документа")
+    language: str = Query("ru", description="Язык интерфейса; язык документа определяется автоматически"),
+    storage: AsyncDocumentStorage = Depends(get_async_storage)
 ):
     """Загрузка и обработка документа"""
     try:
@@ -126,7 +177,10 @@ async def upload_document(
         logger.info(f"Файл сохранен: {file_path}, размер: {len(content)} байт")
         
         # Обработка документа
-        doc_data, validation_result = document_processor.process_document(str(file_path), language)
+        # OCR и запросы к OpenAI выполняются в пуле потоков, цикл событий принимает другие загрузки
+        with usage_scope(document=unique_filename):
+            doc_data, validation_result = await run_in_threadpool(
+                document_processor.process_document, str(file_path), language)
         
         if not doc_data:
             os.remove(file_path) # Удаляем файл, если обработка не удалась
@@ -134,13 +188,20 @@ async def upload_document(
             raise HTTPException(status_code=400, detail=error_message)
 
         # Сохранение документа в базу данных
-        doc_id = storage.store_document(
+        doc_id = await storage.store_document(
             doc_data,
             file.filename, # Сохраняем оригинальное имя файла
             str(file_path),
             validation_result
         )
         
+        # Расход LLM на обработку относится к сохранённому документу
+        if config.LLM_USAGE_ENABLED:
+            await run_in_threadpool(llm_usage.attribute, unique_filename, doc_id)
+        
+        # Поздние документы сразу попадают в подготовленные фискальные отчёты
+        await run_in_threadpool(fiscal_report_scheduler.on_document_stored, doc_id)
+        
         # Файл не удаляется сразу, а сохраняется для скачивания
         # os.remove(file_path) 
         
@@ -152,7 +213,8 @@ async def upload_document(
             document_type=doc_data.doc_type,
             confidence=doc_data.confidence,
             extracted_data=extracted_data_dict,
-            language=language
+            language=language,
+            detected_language=doc_data.language
         )
         
     except HTTPException:
@@ -173,7 +235,8 @@ async def get_documents(
     search: Optional[str] = Query(None, description="Поиск по тексту"),
     date_from: Optional[str] = Query(None, description="Дата от (YYYY-MM-DD)"),
     date_to: Optional[str] = Query(None, description="Дата до (YYYY-MM-DD)"),
-    language: str = Depends(get_language)
+    language: str = Depends(get_language),
+    storage: AsyncDocumentStorage = Depends(get_async_storage)
 ):
     """Получение списка документов с фильтрацией"""
     try:
@@ -196,7 +259,7 @@ async def get_documents(
         if date_to:
             filters["date_to"] = date_to
         
-        documents = storage.get_documents(filters)
+        documents = await storage.get_documents(filters)
         
         # Преобразование в формат ответа
         response_docs = []
@@ -210,7 +273,8 @@ async def get_documents(
                 extracted_data=doc.extracted_data,
                 is_valid=doc.is_valid,
                 validation_errors=doc.validation_errors or [],
-                status="pending" if doc.validation_errors else "processed"
+                status="pending" if doc.validation_errors else "processed",
+                language=doc.language
             ))
         
         return response_docs
@@ -220,18 +284,21 @@ async def get_documents(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/documents/pending", response_model=List[DocumentResponse])
-async def get_pending_documents(language: str = Depends(get_language)):
+async def get_pending_documents(
+    language: str = Depends(get_language),
+    storage: AsyncDocumentStorage = Depends(get_async_storage)
+):
     """Получение документов для проверки и исправления"""
     try:
         i18n.set_language(language)
         
         # Получаем документы со статусом "pending" или с ошибками валидации
         filters = {"status": "pending"}
-        documents = storage.get_documents(filters)
+        documents = await storage.get_documents(filters)
         
         # Также добавляем документы с ошибками валидации
         error_filters = {"has_validation_errors": True}
-        error_documents = storage.get_documents(error_filters)
+        error_documents = await storage.get_documents(error_filters)
         
         # Объединяем и убираем дубликаты
         all_docs = documents + error_documents
@@ -248,7 +315,8 @@ async def get_pending_documents(language: str = Depends(get_language)):
                 extracted_data=doc.extracted_data,
                 is_valid=doc.is_valid,
                 validation_errors=doc.validation_errors or [],
-                status="pending" if doc.validation_errors else "processed"
+                status="pending" if doc.validation_errors else "processed",
+                language=doc.language
             ))
         
         return response_docs
@@ -261,7 +329,8 @@ async def get_pending_documents(language: str = Depends(get_language)):
 async def edit_document(
     doc_id: int,
     request: Request,
-    language: str = Depends(get_language)
+    language: str = Depends(get_language),
+    storage: AsyncDocumentStorage = Depends(get_async_storage)
 ):
     """Редактирование документа"""
     try:
@@ -270,13 +339,19 @@ async def edit_document(
         # Получаем данные для редактирования
         data = await request.json()
         updated_fields = data.get("fields", {})
+        # Исправленный тип документа (необязательно); сохранение без изменений подтверждает тип
+        doc_type = data.get("doc_type")
+        if doc_type is not None and not config.get_document_type_config(doc_type):
+            raise HTTPException(status_code=400, detail=f"Неизвестный тип документа: {doc_type}")
         
-        # Обновляем документ в базе данных
-        success = storage.update_document(doc_id, updated_fields)
+        # Обновляем документ в базе данных; документ отмечается проверенным пользователем
+        success = await storage.update_document(doc_id, updated_fields, doc_type)
         
         if not success:
             raise HTTPException(status_code=404, detail="Документ не найден")
         
+        await run_in_threadpool(fiscal_report_scheduler.invalidate_document, doc_id)
+        
         return {"success": True, "message": "Документ успешно обновлен"}
         
     except HTTPException:
@@ -286,11 +361,11 @@ async def edit_document(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/documents/{doc_id}/download")
-async def download_document(doc_id: int):
+async def download_document(doc_id: int, storage: AsyncDocumentStorage = Depends(get_async_storage)):
     """Скачивание документа"""
     try:
         # Получаем информацию о документе
-        doc = storage.get_document(doc_id)
+        doc = await storage.get_document(doc_id)
         if not doc:
             raise HTTPException(status_code=404, detail="Документ не найден")
         
@@ -312,13 +387,17 @@ async def download_document(doc_id: int):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/documents/{doc_id}/preview")
-async def preview_document(doc_id: int, language: str = Depends(get_language)):
+async def preview_document(
+    doc_id: int,
+    language: str = Depends(get_language),
+    storage: AsyncDocumentStorage = Depends(get_async_storage)
+):
     """Предварительный просмотр документа"""
     try:
         i18n.set_language(language)
         
         # Получаем документ в формате для API
-        doc_api_format = storage.get_document_for_api(doc_id)
+        doc_api_format = await storage.get_document_for_api(doc_id)
         
         if not doc_api_format:
             raise HTTPException(status_code=404, detail="Документ не найден")
@@ -337,9 +416,11 @@ async def generate_report(request: ReportRequest):
     try:
         i18n.set_language(request.language)
         
+        # Отчёты строятся в общем пуле потоков: генератор сам читает хранилище, и долгая сборка
+        # отчёта не должна занимать поток базы, через который идут загрузки и правки документов
         if request.report_type == "summary":
-            report = report_generator_v2.generate_summary_report(
-                request.start_date, request.end_date, request.language
+            report = await run_in_threadpool(
+                report_generator_v2.generate_summary_report, request.start_date, request.end_date, request.language
             )
         elif request.report_type == "fiscal":
             # Извлечение месяца и года из даты
@@ -350,10 +431,10 @@ async def generate_report(request: ReportRequest):
                 now = datetime.now()
                 month, year = now.month, now.year
             
-            report = report_generator_v2.generate_fiscal_report(month, year, request.language)
+            report = await run_in_threadpool(fiscal_report_scheduler.get_fiscal_report, month, year, request.language)
         elif request.report_type == "detailed":
-            report = report_generator_v2.generate_detailed_report(
-                request.start_date, request.end_date, None, request.language
+            report = await run_in_threadpool(
+                report_generator_v2.generate_detailed_report, request.start_date, request.end_date, None, request.language
             )
         else:
             raise HTTPException(status_code=400, detail="Неизвестный тип отчёта")
@@ -363,7 +444,7 @@ async def generate_report(request: ReportRequest):
         
         # Экспорт отчёта
         filename = f"report_{request.report_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{request.format}"
-        file_path = report_generator_v2.export_report(report, request.format, filename)
+        file_path = await run_in_threadpool(report_generator_v2.export_report, report, request.format, filename)
         
         return {
             "success": True,
@@ -387,10 +468,13 @@ async def download_report(filename: str):
     return FileResponse(str(report_path), media_type='application/octet-stream', filename=filename)
 
 @app.get("/statistics")
-async def get_statistics(language: str = Depends(get_language)):
+async def get_statistics(
+    language: str = Depends(get_language),
+    storage: AsyncDocumentStorage = Depends(get_async_storage)
+):
     """Получение статистики по документам для графиков"""
     try:
-        stats = storage.get_statistics()
+        stats = await storage.get_statistics()
         return stats
     except Exception as e:
         logger.error(f"Ошибка при получении статистики: {e}", exc_info=True)
@@ -793,6 +877,18 @@ async def create_automation_rule(request: Request, language: str = Depends(get_l
         logger.error(f"Ошибка создания правила автоматизации: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def gateway_status(gateway: LLMGateway) -> str:
+    """Состояние поставщика LLM по выключателю шлюза (с учётом истёкшего охлаждения)"""
+    if not gateway.available:
+        return "unavailable"
+    return {CLOSED: "healthy", HALF_OPEN: "degraded", OPEN: "unavailable"}[gateway.breaker.snapshot()["state"]]
+
+def openai_status() -> str:
+    """Состояние OpenAI по выключателю шлюза"""
+    if not config.OPENAI_API_KEY:
+        return "unavailable"
+    return gateway_status(llm_gateway)
+
 @app.get("/api-status")
 async def get_api_status():
     """Статус API и внешних сервисов"""
@@ -800,7 +896,12 @@ async def get_api_status():
         status = {
             "api": "healthy",
             "database": "healthy",
-            "openai": "healthy" if config.OPENAI_API_KEY else "unavailable",
+            "openai": openai_status(),
+            "openai_breaker": llm_gateway.breaker.snapshot(),
+            "llm_providers": {
+                name: {"status": gateway_status(gateway), "model": gateway.model, "breaker": gateway.breaker.snapshot()}
+                for name, gateway in created_gateways().items()
+            },
             "tesseract": "healthy" if config.TESSERACT_PATH else "unavailable",
             "storage": "healthy",
             "timestamp": datetime.now().isoformat()
@@ -0,0 +1,50 @@
+"""
+Метрики работы сервиса
+Счётчики событий в памяти процесса и производные доли (например, доля документов,
+для которых быстрый OCR пришлось повторить полным распознаванием)
+"""
+
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Tuple
+
+class Metrics:
+    """Потокобезопасный реестр счётчиков"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._ratios: Dict[str, Tuple[str, str]] = {}
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """Увеличение счётчика"""
+        with self._lock:
+            self._counters[name] += value
+
+    def get(self, name: str) -> int:
+        """Текущее значение счётчика"""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def register_ratio(self, name: str, numerator: str, denominator: str) -> None:
+        """Производная метрика: отношение двух счётчиков"""
+        with self._lock:
+            self._ratios[name] = (numerator, denominator)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Все счётчики и производные доли"""
+        with self._lock:
+            counters = dict(self._counters)
+            ratios = {
+                name: (counters.get(numerator, 0) / counters[denominator] if counters.get(denominator) else 0.0)
+                for name, (numerator, denominator) in self._ratios.items()
+            }
+        return {"counters": counters, "ratios": ratios}
+
+    def reset(self) -> None:
+        """Обнуление счётчиков (производные метрики сохраняются)"""
+        with self._lock:
+            self._counters.clear()
+
+# Глобальный экземпляр
+metrics = Metrics()
@@ -0,0 +1,99 @@
+"""
+Определение языка страницы перед OCR
+Письменность определяется Tesseract OSD или быстрым распознаванием уменьшенной копии страницы,
+после чего страница распознаётся только нужной языковой моделью вместо rus+ron+eng
+"""
+
+import re
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+import pytesseract
+from PIL import Image
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Письменность OSD → язык документа; латиница в документах Молдовы — румынский
+SCRIPT_LANGUAGES = {"Cyrillic": "ru", "Latin": "ro"}
+TESSERACT_MODELS = {"ru": "rus", "ro": "ron"}
+
+_CYRILLIC = re.compile(r"[а-яё]", re.IGNORECASE)
+_LATIN = re.compile(r"[a-zăâîșşțţ]", re.IGNORECASE)
+
+@dataclass(frozen=True)
+class OcrLanguage:
+    """Язык страницы и модели Tesseract для её распознавания"""
+    language: str   # ro / ru
+    tesseract: str  # ron, rus или обе модели для смешанного текста
+    method: str     # osd, probe, text или hint
+
+def tesseract_models(language: str, mixed: bool = False) -> str:
+    """Модели Tesseract: основная, для смешанного текста — вместе со второй"""
+    other = "ro" if language == "ru" else "ru"
+    return f"{TESSERACT_MODELS[language]}+{TESSERACT_MODELS[other]}" if mixed else TESSERACT_MODELS[language]
+
+def detect_text_language(text: str, method: str = "text") -> Optional[OcrLanguage]:
+    """Язык по соотношению кириллицы и латиницы в тексте (None, если букв слишком мало)"""
+    cyrillic = len(_CYRILLIC.findall(text or ""))
+    latin = len(_LATIN.findall(text or ""))
+    letters = cyrillic + latin
+    if letters < config.OCR_LANGUAGE_MIN_LETTERS:
+        return None
+    language = "ru" if cyrillic >= latin else "ro"
+    mixed = max(cyrillic, latin) / letters < config.OCR_LANGUAGE_MIXED_SHARE
+    return OcrLanguage(language, tesseract_models(language, mixed), method)
+
+class OcrLanguageDetector:
+    """Выбор модели Tesseract для страницы: OSD, затем пробное распознавание, затем язык из запроса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._osd_available: Optional[bool] = None
+
+    def detect_osd(self, image: Image.Image) -> Optional[OcrLanguage]:
+        """Письменность по Tesseract OSD (нужен osd.traineddata)"""
+        if self._osd_available is False:
+            return None
+        try:
+            osd = pytesseract.image_to_osd(image, config="--psm 0", output_type=pytesseract.Output.DICT)
+        except pytesseract.TesseractError as e:
+            if "osd.traineddata" in str(e):
+                with self._lock:
+                    self._osd_available = False
+                logger.warning("Tesseract OSD недоступен, язык определяется пробным распознаванием")
+            else:
+                # Например, слишком мало текста для OSD
+                logger.debug(f"OSD не определил письменность: {e}")
+            return None
+        self._osd_available = True
+
+        language = SCRIPT_LANGUAGES.get(osd.get("script"))
+        if language and float(osd.get("script_conf", 0)) >= config.OCR_OSD_MIN_SCRIPT_CONFIDENCE:
+            return OcrLanguage(language, tesseract_models(language), "osd")
+        return None
+
+    def probe(self, image: Image.Image) -> Optional[OcrLanguage]:
+        """Быстрое распознавание уменьшенной копии страницы и подсчёт кириллицы и латиницы"""
+        small = image.copy()
+        small.thumbnail((config.OCR_PROBE_MAX_SIDE, config.OCR_PROBE_MAX_SIDE))
+        text = pytesseract.image_to_string(small, config=f"--oem 3 --psm 6 -l {tesseract_models('ru', mixed=True)}")
+        return detect_text_language(text, method="probe")
+
+    def detect(self, image: Image.Image, hint: Optional[str] = None) -> OcrLanguage:
+        """Язык страницы; если определить не удалось — язык из запроса"""
+        try:
+            result = self.detect_osd(image) or self.probe(image)
+            if result:
+                return result
+        except Exception as e:
+            logger.error(f"Ошибка определения языка страницы: {e}")
+        if hint in TESSERACT_MODELS:
+            return OcrLanguage(hint, tesseract_models(hint), "hint")
+        return OcrLanguage(config.DEFAULT_LANGUAGE, tesseract_models(config.DEFAULT_LANGUAGE, mixed=True), "hint")
+
+# Глобальный экземпляр
+ocr_language_detector = OcrLanguageDetector()
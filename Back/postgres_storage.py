@@ -0,0 +1,399 @@
+"""
+Хранилище документов на PostgreSQL
+Пул соединений, поля документа в JSONB с GIN-индексом, серверные курсоры для больших выборок
+"""
+
+import os
+import logging
+from dataclasses import asdict
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Any
+
+import pandas as pd
+
+try:
+    from psycopg.types.json import Jsonb
+    from psycopg_pool import ConnectionPool
+except ImportError:  # драйвер нужен только при DATABASE_URL=postgresql://...
+    Jsonb = None
+    ConnectionPool = None
+
+from config import config
+from data_models import DocumentData
+from document_storage import RENAMED_DOC_TYPES, BaseDocumentStorage, ClassificationUpdate, StoredDocument
+
+logger = logging.getLogger(__name__)
+
+# Порядок колонок совпадает с SQLite, чтобы строки разбирались общим _row_to_document
+DOCUMENT_COLUMNS = ("id, filename, doc_type, fields, raw_text, upload_date, file_path, "
+                    "confidence, validation_errors, validation_warnings, language, verified")
+
+# Документ считается проблемным, если список ошибок валидации не пуст
+HAS_ERRORS_SQL = "(validation_errors IS NOT NULL AND validation_errors <> '[]'::jsonb)"
+
+class PostgresDocumentStorage(BaseDocumentStorage):
+    """Хранилище документов с базой данных PostgreSQL"""
+
+    def __init__(self, database_url: str,
+                 min_size: int = config.DB_POOL_MIN_SIZE,
+                 max_size: int = config.DB_POOL_MAX_SIZE):
+        if ConnectionPool is None:
+            raise RuntimeError("Для PostgreSQL установите зависимости: pip install 'psycopg[binary]' psycopg_pool")
+
+        self.database_url = database_url
+        self.itersize = config.DB_CURSOR_ITERSIZE
+        self.pool = ConnectionPool(database_url, min_size=min_size, max_size=max_size,
+                                   open=True, name="documents")
+        self.init_database()
+
+    def close(self):
+        """Закрытие пула соединений"""
+        self.pool.close()
+
+    def init_database(self):
+        """Инициализация базы данных"""
+        try:
+            with self.pool.connection() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS documents (
+                        id BIGSERIAL PRIMARY KEY,
+                        filename TEXT NOT NULL,
+                        doc_type TEXT NOT NULL,
+                        fields JSONB NOT NULL,
+                        raw_text TEXT,
+                        upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        file_path TEXT NOT NULL,
+                        confidence DOUBLE PRECISION DEFAULT 1.0,
+                        validation_errors JSONB,
+                        validation_warnings JSONB,
+                        language TEXT,
+                        verified BOOLEAN NOT NULL DEFAULT FALSE
+                    )
+                """)
+                # Базы, созданные до появления определения языка и проверки пользователем, получают новые колонки
+                conn.execute("ALTER TABLE documents ADD COLUMN IF NOT EXISTS language TEXT")
+                conn.execute("ALTER TABLE documents ADD COLUMN IF NOT EXISTS verified BOOLEAN NOT NULL DEFAULT FALSE")
+
+                # Индексы для фильтров и GIN-индекс для поиска по полям документа
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_doc_type ON documents(doc_type)")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_upload_date ON documents(upload_date)")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_filename ON documents(filename)")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_fields_gin ON documents USING GIN (fields jsonb_path_ops)")
+                for old, new in RENAMED_DOC_TYPES.items():
+                    conn.execute("UPDATE documents SET doc_type = %s WHERE doc_type = %s", (new, old))
+                logger.info("База данных документов PostgreSQL инициализирована")
+
+        except Exception as e:
+            logger.error(f"Ошибка инициализации базы данных: {e}")
+            raise
+
+    def store_document(self, doc_data: DocumentData, filename: str, file_path: str,
+                      validation_result: Dict[str, List[str]] = None) -> int:
+        """Сохраняет документ в базу данных"""
+        try:
+            with self.pool.connection() as conn:
+                row = conn.execute("""
+                    INSERT INTO documents
+                    (filename, doc_type, fields, raw_text, file_path, confidence, validation_errors, validation_warnings,
+                     language)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id
+                """, (
+                    filename,
+                    doc_data.doc_type,
+                    Jsonb([asdict(field) for field in doc_data.fields]),
+                    doc_data.raw_text,
+                    file_path,
+                    doc_data.confidence,
+                    Jsonb(validation_result.get("errors", [])) if validation_result else None,
+                    Jsonb(validation_result.get("warnings", [])) if validation_result else None,
+                    doc_data.language
+                )).fetchone()
+
+                doc_id = row[0]
+                logger.info(f"Документ сохранен с ID: {doc_id}")
+                return doc_id
+
+        except Exception as e:
+            logger.error(f"Ошибка сохранения документа: {e}")
+            raise
+
+    def get_document(self, doc_id: int) -> Optional[StoredDocument]:
+        """Получает документ по ID"""
+        try:
+            with self.pool.connection() as conn:
+                row = conn.execute(f"SELECT {DOCUMENT_COLUMNS} FROM documents WHERE id = %s",
+                                   (doc_id,)).fetchone()
+                return self._row_to_document(row) if row else None
+
+        except Exception as e:
+            logger.error(f"Ошибка получения документа: {e}")
+            return None
+
+    def _fetch_documents(self, query: str, params: List[Any]) -> List[StoredDocument]:
+        """Чтение документов через серверный курсор порциями по itersize строк"""
+        with self.pool.connection() as conn:
+            with conn.cursor(name="documents_scan") as cursor:
+                cursor.itersize = self.itersize
+                cursor.execute(query, params)
+                return [self._row_to_document(row) for row in cursor]
+
+    @staticmethod
+    def _add_date_filter(query: str, params: List[Any], value: Optional[str], operator: str) -> str:
+        """Добавление фильтра по дате загрузки (YYYY-MM-DD)"""
+        if not value:
+            return query
+        try:
+            params.append(datetime.strptime(value, "%Y-%m-%d").date())
+            return query + f" AND upload_date::date {operator} %s"
+        except ValueError:
+            logger.warning(f"Неверный формат даты: {value}")
+            return query
+
+    @classmethod
+    def _search_query(cls,
+                      doc_type: Optional[str] = None,
+                      idno: Optional[str] = None,
+                      date_from: Optional[str] = None,
+                      date_to: Optional[str] = None,
+                      filename: Optional[str] = None) -> Tuple[str, List[Any]]:
+        """SQL и параметры поиска документов; IDNO и суммы дофильтровываются по полям документа"""
+        query = f"SELECT {DOCUMENT_COLUMNS} FROM documents WHERE 1=1"
+        params: List[Any] = []
+
+        if doc_type:
+            query += " AND doc_type = %s"
+            params.append(doc_type)
+
+        if filename:
+            query += " AND filename ILIKE %s"
+            params.append(f"%{filename}%")
+
+        # GIN-индекс отсекает документы без поля IDNO ещё в базе
+        if idno:
+            query += " AND fields @> %s"
+            params.append(Jsonb([{"name": "idno"}]))
+
+        query = cls._add_date_filter(query, params, date_from, ">=")
+        query = cls._add_date_filter(query, params, date_to, "<=")
+        return query, params
+
+    @classmethod
+    def _documents_query(cls, filters: Optional[Dict[str, Any]] = None) -> Tuple[str, List[Any]]:
+        """SQL и параметры выборки документов с фильтрами get_documents"""
+        query = f"SELECT {DOCUMENT_COLUMNS} FROM documents WHERE 1=1"
+        params: List[Any] = []
+
+        if filters:
+            if filters.get("doc_type"):
+                query += " AND doc_type = %s"
+                params.append(filters["doc_type"])
+
+            if filters.get("status") == "pending" or filters.get("has_validation_errors"):
+                query += f" AND {HAS_ERRORS_SQL}"
+            elif filters.get("status") == "processed":
+                query += f" AND NOT {HAS_ERRORS_SQL}"
+
+            if filters.get("verified"):
+                query += " AND verified"
+
+            if filters.get("search"):
+                search_term = f"%{filters['search']}%"
+                query += " AND (filename ILIKE %s OR raw_text ILIKE %s)"
+                params.extend([search_term, search_term])
+
+            for key, operator in (("date_from", ">="), ("date_to", "<="),
+                                  ("start_date", ">="), ("end_date", "<=")):
+                query = cls._add_date_filter(query, params, filters.get(key), operator)
+
+        query += " ORDER BY upload_date DESC"
+        return query, params
+
+    @classmethod
+    def _frame_query(cls,
+                     date_from: Optional[str] = None,
+                     date_to: Optional[str] = None,
+                     doc_type: Optional[str] = None) -> Tuple[str, List[Any]]:
+        """SQL и параметры колоночной выгрузки: поля документа извлекаются из JSONB по имени"""
+        field_columns = ",\n".join(
+            f"(SELECT f->>'value' FROM jsonb_array_elements(d.fields) f "
+            f"WHERE f->>'name' = '{name}' LIMIT 1) AS {name}"
+            for name in cls.FRAME_FIELDS
+        )
+        query = f"""
+            SELECT d.id, d.doc_type, d.upload_date, d.confidence,
+                   COALESCE(d.validation_errors, '[]'::jsonb)::text AS validation_errors,
+                   {field_columns}
+            FROM documents d
+            WHERE 1=1
+        """
+        params: List[Any] = []
+
+        if doc_type:
+            query += " AND d.doc_type = %s"
+            params.append(doc_type)
+
+        query = cls._add_date_filter(query, params, date_from, ">=")
+        query = cls._add_date_filter(query, params, date_to, "<=")
+        query += " ORDER BY d.id"
+        return query, params
+
+    def search_documents(self,
+                        doc_type: Optional[str] = None,
+                        idno: Optional[str] = None,
+                        date_from: Optional[str] = None,
+                        date_to: Optional[str] = None,
+                        amount_min: Optional[float] = None,
+                        amount_max: Optional[float] = None,
+                        filename: Optional[str] = None) -> List[StoredDocument]:
+        """Поиск документов по различным критериям"""
+        try:
+            query, params = self._search_query(doc_type, idno, date_from, date_to, filename)
+            documents = self._fetch_documents(query, params)
+            documents = self._filter_by_fields(documents, idno, amount_min, amount_max)
+
+            logger.info(f"Найдено документов: {len(documents)}")
+            return documents
+
+        except Exception as e:
+            logger.error(f"Ошибка поиска документов: {e}")
+            return []
+
+    def load_documents_frame(self,
+                             date_from: Optional[str] = None,
+                             date_to: Optional[str] = None,
+                             doc_type: Optional[str] = None) -> pd.DataFrame:
+        """Колоночная выгрузка документов для аналитики одним запросом"""
+        query, params = self._frame_query(date_from, date_to, doc_type)
+
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.execute(query, params)
+                columns = [column.name for column in cursor.description]
+                frame = pd.DataFrame(cursor.fetchall(), columns=columns)
+        except Exception as e:
+            logger.error(f"Ошибка колоночной выгрузки документов: {e}")
+            raise
+
+        return self._normalize_documents_frame(frame)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Собирает статистику по документам в базе."""
+        stats = {
+            "total_documents": 0,
+            "by_type": {},
+            "by_status": {
+                "valid": 0,
+                "invalid": 0
+            }
+        }
+        try:
+            with self.pool.connection() as conn:
+                total, invalid = conn.execute(
+                    f"SELECT COUNT(*), COUNT(*) FILTER (WHERE {HAS_ERRORS_SQL}) FROM documents"
+                ).fetchone()
+                stats["total_documents"] = total
+                stats["by_status"]["invalid"] = invalid
+                stats["by_status"]["valid"] = total - invalid
+
+                rows = conn.execute("SELECT doc_type, COUNT(*) FROM documents GROUP BY doc_type").fetchall()
+                stats["by_type"] = dict(rows)
+
+                return stats
+        except Exception as e:
+            logger.error(f"Ошибка при сборе статистики: {e}")
+            return stats
+
+    def delete_document(self, doc_id: int) -> bool:
+        """Удаляет документ по ID"""
+        try:
+            with self.pool.connection() as conn:
+                row = conn.execute("DELETE FROM documents WHERE id = %s RETURNING file_path",
+                                   (doc_id,)).fetchone()
+                if not row:
+                    return False
+
+            # Удаляем физический файл после фиксации удаления записи
+            file_path = row[0]
+            if os.path.exists(file_path):
+                os.remove(file_path)
+                logger.info(f"Файл удален: {file_path}")
+
+            logger.info(f"Документ с ID {doc_id} удален")
+            return True
+
+        except Exception as e:
+            logger.error(f"Ошибка удаления документа: {e}")
+            return False
+
+    def get_documents(self, filters: Dict[str, Any] = None) -> List[StoredDocument]:
+        """Получение документов с фильтрацией"""
+        try:
+            query, params = self._documents_query(filters)
+            documents = self._fetch_documents(query, params)
+            logger.info(f"Найдено документов: {len(documents)}")
+            return documents
+
+        except Exception as e:
+            logger.error(f"Ошибка получения документов: {e}")
+            return []
+
+    def update_document(self, doc_id: int, updated_fields: Dict[str, Any], doc_type: Optional[str] = None) -> bool:
+        """Обновление документа пользователем: поля, при необходимости тип; документ отмечается проверенным"""
+        try:
+            with self.pool.connection() as conn:
+                row = conn.execute("SELECT fields FROM documents WHERE id = %s FOR UPDATE",
+                                   (doc_id,)).fetchone()
+                if not row:
+                    return False
+
+                current_fields = row[0]
+                for field in current_fields:
+                    if field["name"] in updated_fields:
+                        field["value"] = str(updated_fields[field["name"]])
+
+                conn.execute("""
+                    UPDATE documents
+                    SET fields = %s, validation_errors = NULL, doc_type = COALESCE(%s, doc_type), verified = TRUE
+                    WHERE id = %s
+                """, (Jsonb(current_fields), doc_type, doc_id))
+
+                logger.info(f"Документ {doc_id} обновлен")
+                return True
+
+        except Exception as e:
+            logger.error(f"Ошибка обновления документа: {e}")
+            return False
+
+    def iter_documents(self, chunk_size: int = 500) -> Iterator[List[StoredDocument]]:
+        """Все документы порциями по chunk_size в порядке ID (без долгой транзакции между порциями)"""
+        last_id = 0
+        while True:
+            with self.pool.connection() as conn:
+                rows = conn.execute(f"SELECT {DOCUMENT_COLUMNS} FROM documents WHERE id > %s ORDER BY id LIMIT %s",
+                                    (last_id, chunk_size)).fetchall()
+            if not rows:
+                return
+            yield [self._row_to_document(row) for row in rows]
+            last_id = rows[-1][0]
+
+    def update_classifications(self, updates: Sequence[ClassificationUpdate]) -> int:
+        """Запись результатов переклассификации одной транзакцией, возвращает число обновлённых документов"""
+        try:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.executemany("""
+                        UPDATE documents
+                        SET doc_type = %s, confidence = %s, fields = COALESCE(%s, fields)
+                        WHERE id = %s
+                    """, [(
+                        update.doc_type,
+                        update.confidence,
+                        Jsonb([asdict(field) for field in update.fields]) if update.fields is not None else None,
+                        update.doc_id
+                    ) for update in updates])
+                    return cursor.rowcount
+
+        except Exception as e:
+            logger.error(f"Ошибка обновления классификации документов: {e}")
+            raise
@@ -0,0 +1,124 @@
+"""
+Сжатие текста OCR для промптов LLM
+Пробелы схлопываются, строки-мусор OCR отбрасываются, в бюджет токенов в первую очередь попадают
+строки с ключевыми словами типов и полями (номера, даты, суммы) — даже если они в конце документа
+"""
+
+import logging
+import math
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional
+
+try:
+    import tiktoken  # точный подсчёт токенов; без него — оценка по числу символов
+except ImportError:
+    tiktoken = None
+
+from config import config
+from field_extractor import field_extractor
+from keyword_matcher import document_type_keywords
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Оценка числа токенов без токенизатора: около 4 символов на токен
+_CHARS_PER_TOKEN = 4
+_WHITESPACE = re.compile(r"\s+")
+
+# Приоритеты строк: ключевое слово или поле, строка сразу после неё (значение под заголовком), остальные
+_PRIORITY_HIT = 2
+_PRIORITY_NEXT = 1
+
+metrics.register_ratio("llm_prompt_compaction_ratio", "llm_prompt_tokens_sent", "llm_prompt_tokens_original")
+
+@dataclass
+class CompactedText:
+    """Сжатый текст документа и число токенов до и после сжатия"""
+    text: str
+    original_tokens: int
+    tokens: int
+    dropped_lines: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.original_tokens - self.tokens
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    """Кодировка tiktoken для модели или None, если токенизатор недоступен"""
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            # Модель неизвестна tiktoken (например, локальная): кодировка моделей gpt-4o
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"Токенизатор tiktoken недоступен, токены оцениваются по числу символов: {e}")
+        return None
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Число токенов текста: tiktoken, если установлен, иначе около 4 символов на токен"""
+    encoding = _encoding(model or config.OPENAI_MODEL)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / _CHARS_PER_TOKEN)
+
+def line_quality(line: str) -> float:
+    """Доля букв и цифр среди непробельных символов; строки меньше чем из двух букв или цифр — мусор"""
+    chars = [char for char in line if not char.isspace()]
+    alnum = sum(char.isalnum() for char in chars)
+    if alnum < 2:
+        return 0.0
+    return alnum / len(chars)
+
+def line_priorities(lines: List[str], language: str = "ru") -> List[int]:
+    """Приоритеты строк: ключевые слова типов и поля выше остальных"""
+    automata = {document_type_keywords.get_automaton(language), document_type_keywords.get_automaton("ro"),
+                document_type_keywords.get_automaton("ru")}
+    families = field_extractor.all_families()
+    priorities = [0] * len(lines)
+    for index, line in enumerate(lines):
+        if (any(automaton.find_words(line) for automaton in automata)
+                or any(regex.search(line) for family in families for regex in family.regexes)):
+            priorities[index] = _PRIORITY_HIT
+            if index + 1 < len(lines):
+                priorities[index + 1] = max(priorities[index + 1], _PRIORITY_NEXT)
+    return priorities
+
+def compact_text(text: str, budget: int, language: str = "ru", model: Optional[str] = None) -> CompactedText:
+    """Текст документа в пределах budget токенов; строки сохраняют исходный порядок"""
+    original_tokens = count_tokens(text, model)
+    lines = [_WHITESPACE.sub(" ", line).strip() for line in text.splitlines()]
+    lines = [line for line in lines if line]
+    kept = [line for line in lines if line_quality(line) >= config.PROMPT_MIN_LINE_QUALITY]
+    dropped = len(lines) - len(kept)
+
+    compacted = "\n".join(kept)
+    tokens = count_tokens(compacted, model)
+    if tokens > budget:
+        # Строки отбираются по приоритету, при равном — по порядку в документе
+        costs = [count_tokens(line, model) + 1 for line in kept]
+        priorities = line_priorities(kept, language)
+        selected, used = [], 0
+        for index in sorted(range(len(kept)), key=lambda index: (-priorities[index], index)):
+            if used + costs[index] <= budget:
+                selected.append(index)
+                used += costs[index]
+        dropped += len(kept) - len(selected)
+        compacted = "\n".join(kept[index] for index in sorted(selected))
+        if not compacted:
+            # Ни одна строка не помещается целиком (например, текст без переносов)
+            compacted = "\n".join(kept)[:budget * _CHARS_PER_TOKEN]
+        tokens = count_tokens(compacted, model)
+
+    result = CompactedText(compacted, original_tokens, tokens, dropped)
+    metrics.increment("llm_prompt_tokens_original", original_tokens)
+    metrics.increment("llm_prompt_tokens_sent", tokens)
+    metrics.increment("llm_prompt_tokens_saved", max(0, result.tokens_saved))
+    logger.info(f"Текст для LLM: {tokens} токенов из {original_tokens} (сэкономлено {result.tokens_saved}, "
+                f"отброшено строк: {dropped})")
+    return result
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Переклассификация всех сохранённых документов после изменения конфигурации типов или переобучения модели.
+Документы читаются порциями, классифицируются пакетно, изменения записываются обратно по мере обработки.
+С --batch документы, сохранённые с неизвестным типом или уверенностью ниже порога, отправляются
+в OpenAI Batch API; результаты применяются после завершения пакета (или позже, через --batch-id)
+"""
+
+import argparse
+import time
+from typing import Iterator, List, Optional, Tuple
+
+from config import config
+from data_models import DocumentField
+from document_processor import DocumentProcessor
+from document_storage import BaseDocumentStorage, ClassificationUpdate, StoredDocument, get_storage
+from llm_batch import BATCH_PRICE_FACTOR, BatchRequest, LLMBatchClient
+from llm_usage import UsageScope, llm_usage, usage_scope
+from report_scheduler import fiscal_report_scheduler
+
+def classification_update(doc: StoredDocument, result: Tuple, threshold: float) -> Optional[ClassificationUpdate]:
+    """Изменение классификации документа или None, если новый результат не лучше сохранённого:
+    неизвестный тип, уверенность ниже порога или ниже сохранённой не записываются.
+    Документы, проверенные пользователем, не переклассифицируются"""
+    doc_type, confidence, extracted_data = result
+    if doc.verified:
+        return None
+    if doc_type == "unknown" or confidence < threshold:
+        return None
+    if doc_type == doc.doc_type and abs(confidence - (doc.confidence or 0.0)) < 1e-6:
+        return None
+    # Уверенность сохранённого неизвестного типа ничего не говорит о документе
+    stored_confidence = 0.0 if doc.doc_type == "unknown" else (doc.confidence or 0.0)
+    if confidence < stored_confidence:
+        return None
+    # Поля заменяются только при смене типа и только непустыми, чтобы не потерять ручные исправления
+    fields = None
+    if doc_type != doc.doc_type:
+        if extracted_data:
+            fields = [DocumentField(name=name, value=str(value)) for name, value in extracted_data.items()]
+        print(f"  {doc.id}: {doc.doc_type} → {doc_type} ({confidence:.2f})")
+    return ClassificationUpdate(doc.id, doc_type, confidence, fields)
+
+def is_uncertain(processor: DocumentProcessor, doc: StoredDocument) -> bool:
+    """Сохранённая классификация документа не уверена: в режиме --batch документ отправляется в OpenAI.
+    Тип документа, проверенного пользователем, считается верным"""
+    if doc.verified:
+        return False
+    return doc.doc_type == "unknown" or (doc.confidence or 0.0) < processor.classification_threshold
+
+def apply_batch(storage: BaseDocumentStorage, processor: DocumentProcessor, batch_client: LLMBatchClient,
+                batch_id: str, dry_run: bool = False) -> Tuple[int, int]:
+    """Ожидание пакета и запись его результатов; возвращает число ответов и изменённых документов.
+    Расход пакета записывается в журнал llm_usage по документам (кроме --dry-run)"""
+    batch = batch_client.wait(batch_id)
+    if batch.status != "completed":
+        print(f"✗ Пакет {batch_id} завершился со статусом {batch.status}")
+        return 0, 0
+
+    updates: List[ClassificationUpdate] = []
+    responses = batch_client.results(batch)
+    for custom_id, response in responses.items():
+        doc_id, language = custom_id.split(":", 1)
+        doc = storage.get_document(int(doc_id))
+        if doc is None or response is None:
+            continue
+        ai_result = processor.parse_classification_response(response)
+        if not isinstance(ai_result, dict):
+            ai_result = None
+        result = processor.classify_batch([doc.raw_text or ""], [language], use_openai=False, ai_results=[ai_result])[0]
+        if config.LLM_USAGE_ENABLED and not dry_run and response.usage:
+            llm_usage.record("openai", response.model, response.usage.prompt_tokens, response.usage.completion_tokens,
+                             cost_factor=BATCH_PRICE_FACTOR, document_id=doc.id, doc_type=result[0],
+                             scope=UsageScope(endpoint=f"batch:{batch_id}", document=custom_id))
+        update = classification_update(doc, result, processor.classification_threshold)
+        if update:
+            updates.append(update)
+
+    if updates and not dry_run:
+        storage.update_classifications(updates)
+        fiscal_report_scheduler.invalidate_documents(update.doc_id for update in updates)
+    print(f"✓ Пакет {batch_id}: ответов {len(responses)}, изменено документов: {len(updates)}")
+    return len(responses), len(updates)
+
+def main():
+    """Основная функция переклассификации"""
+    parser = argparse.ArgumentParser(description='Переклассификация сохранённых документов')
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=500,
+        help='Документов в одной порции (по умолчанию: 500)'
+    )
+    parser.add_argument(
+        '--language',
+        choices=list(config.SUPPORTED_LANGUAGES),
+        help='Язык ключевых слов (по умолчанию: определённый при загрузке документа, '
+             f'для старых документов — {config.DEFAULT_LANGUAGE})'
+    )
+    parser.add_argument(
+        '--use-openai',
+        action='store_true',
+        help='Отправлять в OpenAI документы, которые не удалось классифицировать локально'
+    )
+    parser.add_argument(
+        '--batch',
+        action='store_true',
+        help='Отправить документы с неизвестным типом или низкой уверенностью в OpenAI Batch API и применить результаты'
+    )
+    parser.add_argument(
+        '--batch-id',
+        action='append',
+        default=[],
+        help='Дождаться уже отправленного пакета и применить его результаты (можно указать несколько раз)'
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='Только показать изменения, не записывая их в базу'
+    )
+    args = parser.parse_args()
+
+    # Вызовы OpenAI при переклассификации относятся в журнале llm_usage к этому скрипту
+    with usage_scope(endpoint="reclassify_documents"):
+        storage = get_storage()
+        processor = DocumentProcessor()
+        start = time.perf_counter()
+        batch_client = LLMBatchClient() if args.batch or args.batch_id else None
+
+        if args.batch_id:
+            for batch_id in args.batch_id:
+                apply_batch(storage, processor, batch_client, batch_id, args.dry_run)
+        else:
+            totals = {"processed": 0, "changed": 0, "batched": 0}
+            requests = reclassify_locally(storage, processor, args, totals)
+            if args.batch and not args.dry_run:
+                batch_ids = batch_client.submit(requests, metadata={"source": "reclassify_documents"})
+                print(f"✓ Отправлено в OpenAI Batch API: {totals['batched']} документов, пакеты: {', '.join(batch_ids)}")
+                for batch_id in batch_ids:
+                    apply_batch(storage, processor, batch_client, batch_id)
+            else:
+                for _ in requests:
+                    pass
+                if args.batch:
+                    print(f"✓ В OpenAI Batch API было бы отправлено документов: {totals['batched']}")
+
+        elapsed = time.perf_counter() - start
+        print(f"✓ Переклассификация завершена за {elapsed:.1f} с"
+              f"{' (без записи в базу)' if args.dry_run else ''}")
+
+def reclassify_locally(storage: BaseDocumentStorage, processor: DocumentProcessor, args,
+                       totals: dict) -> Iterator[BatchRequest]:
+    """Переклассификация порциями с записью изменений; в режиме --batch выдаёт запросы пакета
+    для документов архива с неуверенной сохранённой классификацией по мере чтения архива"""
+    for chunk in storage.iter_documents(args.chunk_size):
+        languages = [args.language or doc.language or config.DEFAULT_LANGUAGE for doc in chunk]
+        results = processor.classify_batch([doc.raw_text or "" for doc in chunk], languages,
+                                           use_openai=args.use_openai and not args.batch)
+        updates = []
+        batch_requests = []
+        for doc, language, result in zip(chunk, languages, results):
+            # Документ из пакета классифицируется по ответу OpenAI, локальный результат не записывается
+            if args.batch and doc.raw_text and is_uncertain(processor, doc):
+                batch_requests.append(BatchRequest(f"{doc.id}:{language}",
+                                                   processor.classification_request(doc.raw_text, language)))
+                continue
+            update = classification_update(doc, result, processor.classification_threshold)
+            if update:
+                updates.append(update)
+
+        if updates and not args.dry_run:
+            storage.update_classifications(updates)
+            fiscal_report_scheduler.invalidate_documents(update.doc_id for update in updates)
+        totals["processed"] += len(chunk)
+        totals["changed"] += len(updates)
+        totals["batched"] += len(batch_requests)
+        print(f"✓ Обработано документов: {totals['processed']}, изменено: {totals['changed']}")
+        yield from batch_requests
+
+if __name__ == "__main__":
+    main()
@@ -270,7 +270,7 @@ class ReportGenerator:
             "bon_fiscal": "Bon fiscal",
             "stat_plata": "Stat de plată",
             "act_achizitie": "Act de achiziție",
-            "ordin_plata": "Ordin de plată",
+            "ordine_plata": "Ordin de plată",
             "raport_avans": "Raport de avans",
             "unknown": "Неизвестный тип"
         }
@@ -8,23 +8,24 @@ import json
 import csv
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from pathlib import Path
+import numpy as np
 import pandas as pd
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.utils.dataframe import dataframe_to_rows
 from config import config
 from i18n import i18n
-from document_storage import DocumentStorage
+from document_storage import BaseDocumentStorage, get_storage
 
 logger = logging.getLogger(__name__)
 
 class ReportGeneratorV2:
     """Улучшенный генератор отчётов для Молдовы"""
     
-    def __init__(self):
-        self.storage = DocumentStorage()
+    def __init__(self, storage: Optional[BaseDocumentStorage] = None):
+        self.storage = storage or get_storage()
         self.reports_dir = config.REPORTS_DIR
         self.reports_dir.mkdir(parents=True, exist_ok=True)
         
@@ -120,64 +121,14 @@ class ReportGeneratorV2:
         """Генерация фискального отчёта для FISC"""
         try:
             # Определение периода
-            start_date = datetime(year, month, 1).strftime("%Y-%m-%d")
-            if month == 12:
-                end_date = datetime(year + 1, 1, 1) - timedelta(days=1)
-            else:
-                end_date = datetime(year, month + 1, 1) - timedelta(days=1)
-            end_date = end_date.strftime("%Y-%m-%d")
+            start_date, end_date = self._get_month_period(month, year)
             
-            # Получение документов
-            documents = self.storage.search_documents(
-                date_from=start_date,
-                date_to=end_date
-            )
-            
-            # Фильтрация фискальных документов
-            fiscal_docs = [doc for doc in documents 
-                          if doc.doc_type in ['factura_fiscala', 'bon_fiscal']]
-            
-            # Группировка по компаниям
-            companies = {}
-            total_sales = 0.0
-            total_vat = 0.0
-            
-            for doc in fiscal_docs:
-                # Извлекаем данные из полей документа
-                company = "Неизвестная компания"
-                amount = 0.0
-                vat = 0.0
-                idno = ""
-                
-                for field in doc.fields:
-                    if "company" in field.name.lower() or "companie" in field.name.lower():
-                        company = field.value
-                    elif "amount" in field.name.lower() or "suma" in field.name.lower():
-                        try:
-                            amount = float(field.value.replace(",", ""))
-                        except (ValueError, AttributeError):
-                            pass
-                    elif "vat" in field.name.lower():
-                        try:
-                            vat = float(field.value.replace(",", ""))
-                        except (ValueError, AttributeError):
-                            pass
-                    elif "idno" in field.name.lower():
-                        idno = field.value
-                
-                if company not in companies:
-                    companies[company] = {
-                        'documents': [],
-                        'total_amount': 0.0,
-                        'total_vat': 0.0,
-                        'idno': idno
-                    }
-                
-                companies[company]['documents'].append(doc)
-                companies[company]['total_amount'] += amount
-                companies[company]['total_vat'] += vat
-                total_sales += amount
-                total_vat += vat
+            # Документы месяца по их собственной дате: поздний документ загружается после конца месяца,
+            # но раньше начала месяца документ загрузить нельзя
+            documents = [
+                doc for doc in self.storage.search_documents(date_from=start_date)
+                if start_date <= self.report_day(doc) <= end_date
+            ]
             
             # Формирование отчёта
             report = {
@@ -191,10 +142,10 @@ class ReportGeneratorV2:
                     "end_date": end_date
                 },
                 "fiscal_data": {
-                    "total_documents": len(fiscal_docs),
-                    "total_sales": total_sales,
-                    "total_vat": total_vat,
-                    "companies": companies
+                    "total_documents": 0,
+                    "total_sales": 0.0,
+                    "total_vat": 0.0,
+                    "companies": {}
                 },
                 "fisc_format": {
                     "report_code": "FISC_001",
@@ -203,13 +154,75 @@ class ReportGeneratorV2:
                 }
             }
             
-            logger.info(f"Фискальный отчёт сгенерирован: {len(fiscal_docs)} документов")
+            for doc in documents:
+                self.add_document_to_fiscal_report(report, doc)
+            
+            logger.info(f"Фискальный отчёт сгенерирован: {report['fiscal_data']['total_documents']} документов")
             return report
             
         except Exception as e:
             logger.error(f"Ошибка генерации фискального отчёта: {e}")
             return {"error": str(e)}
     
+    @staticmethod
+    def report_day(doc) -> str:
+        """День документа (YYYY-MM-DD) для отчётного периода: дата из полей документа, иначе дата загрузки"""
+        for field in doc.fields:
+            if field.name == "date" and field.value:
+                try:
+                    return datetime.strptime(field.value.strip(), "%d.%m.%Y").date().isoformat()
+                except ValueError:
+                    break
+        return doc.upload_date.date().isoformat() if doc.upload_date else ""
+    
+    def add_document_to_fiscal_report(self, report: Dict[str, Any], doc) -> bool:
+        """Добавление одного документа в уже сформированный фискальный отчёт"""
+        # Учитываются только фискальные документы
+        if doc.doc_type not in ['factura_fiscala', 'bon_fiscal']:
+            return False
+        
+        fiscal_data = report["fiscal_data"]
+        companies = fiscal_data["companies"]
+        
+        # Извлекаем данные из полей документа
+        company = "Неизвестная компания"
+        amount = 0.0
+        vat = 0.0
+        idno = ""
+        
+        for field in doc.fields:
+            if "company" in field.name.lower() or "companie" in field.name.lower():
+                company = field.value
+            elif "vat" in field.name.lower():
+                # Проверяется раньше сумм: "vat_amount" тоже содержит "amount"
+                try:
+                    vat = float(field.value.replace(",", ""))
+                except (ValueError, AttributeError):
+                    pass
+            elif "amount" in field.name.lower() or "suma" in field.name.lower():
+                try:
+                    amount = float(field.value.replace(",", ""))
+                except (ValueError, AttributeError):
+                    pass
+            elif "idno" in field.name.lower():
+                idno = field.value
+        
+        if company not in companies:
+            companies[company] = {
+                'documents': [],
+                'total_amount': 0.0,
+                'total_vat': 0.0,
+                'idno': idno
+            }
+        
+        companies[company]['documents'].append(doc)
+        companies[company]['total_amount'] += amount
+        companies[company]['total_vat'] += vat
+        fiscal_data["total_documents"] += 1
+        fiscal_data["total_sales"] += amount
+        fiscal_data["total_vat"] += vat
+        return True
+    
     def generate_detailed_report(self, start_date: Optional[str] = None,
                                end_date: Optional[str] = None,
                                doc_types: Optional[List[str]] = None,
@@ -490,6 +503,15 @@ class ReportGeneratorV2:
         with open(file_path.with_suffix('.json'), 'w', encoding='utf-8') as f:
             json.dump(report, f, ensure_ascii=False, indent=2)
     
+    def _get_month_period(self, month: int, year: int) -> Tuple[str, str]:
+        """Получение первого и последнего дня месяца в формате YYYY-MM-DD"""
+        start_date = datetime(year, month, 1)
+        if month == 12:
+            end_date = datetime(year + 1, 1, 1) - timedelta(days=1)
+        else:
+            end_date = datetime(year, month + 1, 1) - timedelta(days=1)
+        return start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")
+    
     def _get_fisc_deadline(self, month: int, year: int) -> str:
         """Получение срока подачи отчёта в FISC"""
         # Обычно до 25 числа следующего месяца
@@ -504,13 +526,7 @@ class ReportGeneratorV2:
         month = parameters.get("month", datetime.now().month)
         year = parameters.get("year", datetime.now().year)
         
-        start_date = datetime(year, month, 1).strftime("%Y-%m-%d")
-        if month == 12:
-            end_date = datetime(year + 1, 1, 1) - timedelta(days=1)
-        else:
-            end_date = datetime(year, month + 1, 1) - timedelta(days=1)
-        end_date = end_date.strftime("%Y-%m-%d")
-        
+        start_date, end_date = self._get_month_period(month, year)
         return self.generate_summary_report(start_date, end_date, language)
     
     def _generate_company_analysis(self, parameters: Dict[str, Any], language: str) -> Dict[str, Any]:
@@ -519,37 +535,29 @@ class ReportGeneratorV2:
         start_date = parameters.get("start_date")
         end_date = parameters.get("end_date")
         
-        documents = self.storage.search_documents(
-            date_from=start_date,
-            date_to=end_date
-        )
+        frame = self.storage.load_documents_frame(date_from=start_date, date_to=end_date)
+        frame["company"] = frame["company"].fillna("Неизвестная компания")
         
         if company:
-            documents = [doc for doc in documents 
-                        if doc.get('extracted_data', {}).get('company') == company]
+            frame = frame[frame["company"] == company]
         
         # Группировка по компаниям
+        totals = frame.groupby("company").agg(
+            total_amount=("total_amount", "sum"),
+            total_vat=("vat_amount", "sum"),
+            document_ids=("id", list)
+        )
+        type_counts = frame.groupby(["company", "doc_type"]).size()
+        
         companies = {}
-        for doc in documents:
-            doc_company = doc.get('extracted_data', {}).get('company', 'Неизвестная компания')
-            if doc_company not in companies:
-                companies[doc_company] = {
-                    'documents': [],
-                    'total_amount': 0.0,
-                    'total_vat': 0.0,
-                    'document_types': {}
-                }
-            
-            companies[doc_company]['documents'].append(doc)
-            amount = doc.get('extracted_data', {}).get('total_amount', 0)
-            vat = doc.get('extracted_data', {}).get('vat_amount', 0)
-            companies[doc_company]['total_amount'] += amount
-            companies[doc_company]['total_vat'] += vat
-            
-            doc_type = doc.get('document_type', 'unknown')
-            if doc_type not in companies[doc_company]['document_types']:
-                companies[doc_company]['document_types'][doc_type] = 0
-            companies[doc_company]['document_types'][doc_type] += 1
+        for doc_company, row in totals.iterrows():
+            companies[doc_company] = {
+                'document_ids': [int(doc_id) for doc_id in row["document_ids"]],
+                'total_amount': float(row["total_amount"]),
+                'total_vat': float(row["total_vat"]),
+                'document_types': {doc_type: int(count)
+                                   for doc_type, count in type_counts.loc[doc_company].items()}
+            }
         
         return {
             "report_type": "company_analysis",
@@ -564,34 +572,18 @@ class ReportGeneratorV2:
         start_date = parameters.get("start_date")
         end_date = parameters.get("end_date")
         
-        documents = self.storage.search_documents(
-            date_from=start_date,
-            date_to=end_date
-        )
+        frame = self.storage.load_documents_frame(date_from=start_date, date_to=end_date)
+        frame["company"] = frame["company"].fillna("Неизвестная компания")
         
-        # Анализ НДС
         vat_data = {
-            "total_vat": 0.0,
-            "vat_by_type": {},
-            "vat_by_company": {},
-            "vat_rate_analysis": {}
+            "total_vat": float(frame["vat_amount"].sum()),
+            "vat_by_type": {k: float(v) for k, v in frame.groupby("doc_type")["vat_amount"].sum().items()},
+            "vat_by_company": {k: float(v) for k, v in frame.groupby("company")["vat_amount"].sum().items()},
+            "vat_rate_analysis": self._analyze_vat_rates(
+                frame["total_amount"].to_numpy(), frame["vat_amount"].to_numpy()
+            )
         }
         
-        for doc in documents:
-            vat_amount = doc.get('extracted_data', {}).get('vat_amount', 0)
-            doc_type = doc.get('document_type', 'unknown')
-            company = doc.get('extracted_data', {}).get('company', 'Неизвестная компания')
-            
-            vat_data["total_vat"] += vat_amount
-            
-            if doc_type not in vat_data["vat_by_type"]:
-                vat_data["vat_by_type"][doc_type] = 0.0
-            vat_data["vat_by_type"][doc_type] += vat_amount
-            
-            if company not in vat_data["vat_by_company"]:
-                vat_data["vat_by_company"][company] = 0.0
-            vat_data["vat_by_company"][company] += vat_amount
-        
         return {
             "report_type": "vat_analysis",
             "language": language,
@@ -600,37 +592,51 @@ class ReportGeneratorV2:
             "vat_data": vat_data
         }
     
+    def _analyze_vat_rates(self, totals: np.ndarray, vats: np.ndarray) -> Dict[str, int]:
+        """Распределение документов по ставкам НДС (сумма итого включает НДС)"""
+        rates = np.asarray(config.VAT_RATES, dtype=float)
+        analysis = {f"{rate:.0%}": 0 for rate in rates}
+        
+        has_vat = (vats > 0) & (totals > vats)
+        analysis["no_vat"] = int((~has_vat).sum())
+        
+        # Эффективная ставка к сумме без НДС, сопоставляется со всеми ставками сразу
+        effective = vats[has_vat] / (totals[has_vat] - vats[has_vat])
+        matches = np.abs(effective[:, None] - rates[None, :]) <= config.VAT_RATE_TOLERANCE
+        matched_rate = np.where(matches.any(axis=1), matches.argmax(axis=1), -1)
+        
+        for index, count in zip(*np.unique(matched_rate[matched_rate >= 0], return_counts=True)):
+            analysis[f"{rates[index]:.0%}"] = int(count)
+        analysis["nonstandard"] = int((matched_rate < 0).sum())
+        return analysis
+    
     def _generate_quality_report(self, parameters: Dict[str, Any], language: str) -> Dict[str, Any]:
         """Генерация отчёта о качестве обработки"""
         start_date = parameters.get("start_date")
         end_date = parameters.get("end_date")
         
-        documents = self.storage.search_documents(
-            date_from=start_date,
-            date_to=end_date
-        )
+        frame = self.storage.load_documents_frame(date_from=start_date, date_to=end_date)
+        confidence = frame["confidence"].to_numpy()
+        
+        # Гистограмма уверенности: low < 0.5 <= medium < 0.8 <= high
+        low, medium, high = np.histogram(confidence, bins=[-np.inf, 0.5, 0.8, np.inf])[0]
+        
+        # Анализ ошибок валидации
+        errors = frame.loc[~frame["is_valid"], "validation_errors"].map(json.loads).explode().dropna()
         
         quality_stats = {
-            "total_documents": len(documents),
-            "valid_documents": len([doc for doc in documents if doc.get('is_valid', False)]),
-            "invalid_documents": len([doc for doc in documents if not doc.get('is_valid', False)]),
-            "average_confidence": sum(doc.get('type_confidence', 0) for doc in documents) / len(documents) if documents else 0,
+            "total_documents": int(len(frame)),
+            "valid_documents": int(frame["is_valid"].sum()),
+            "invalid_documents": int((~frame["is_valid"]).sum()),
+            "average_confidence": float(confidence.mean()) if len(confidence) else 0,
             "confidence_distribution": {
-                "high": len([doc for doc in documents if doc.get('type_confidence', 0) >= 0.8]),
-                "medium": len([doc for doc in documents if 0.5 <= doc.get('type_confidence', 0) < 0.8]),
-                "low": len([doc for doc in documents if doc.get('type_confidence', 0) < 0.5])
+                "high": int(high),
+                "medium": int(medium),
+                "low": int(low)
             },
-            "validation_errors": {}
+            "validation_errors": {error: int(count) for error, count in errors.value_counts().items()}
         }
         
-        # Анализ ошибок валидации
-        for doc in documents:
-            errors = doc.get('validation_errors', [])
-            for error in errors:
-                if error not in quality_stats["validation_errors"]:
-                    quality_stats["validation_errors"][error] = 0
-                quality_stats["validation_errors"][error] += 1
-        
         return {
             "report_type": "quality_report",
             "language": language,
@@ -0,0 +1,167 @@
+"""
+Планировщик предварительной генерации фискальных отчётов
+Каждую ночь готовит отчёт FISC за закрытый месяц и поддерживает его актуальным.
+Документ относится к месяцу по своей дате (поле date), а не по дате загрузки
+"""
+
+import copy
+import logging
+import threading
+from datetime import datetime, date, timedelta
+from typing import Dict, Iterable, Optional, Any, Tuple
+
+from config import config
+from report_generator_v2 import report_generator_v2, ReportGeneratorV2
+
+logger = logging.getLogger(__name__)
+
+class FiscalReportScheduler:
+    """Ночной прогон и кэш фискальных отчётов"""
+
+    def __init__(self, generator: Optional[ReportGeneratorV2] = None,
+                 run_hour: int = config.FISCAL_PRECOMPUTE_HOUR):
+        self.generator = generator or report_generator_v2
+        self.run_hour = run_hour
+
+        # Кэш отчётов: (месяц, год, язык) -> отчёт
+        self._cache: Dict[Tuple[int, int, str], Dict[str, Any]] = {}
+        # Номер изменения документов: отчёт, во время генерации которого документы менялись, не кэшируется
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Запуск фонового потока планировщика"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run_loop, name="fiscal-report-scheduler", daemon=True)
+        self._thread.start()
+        logger.info(f"Планировщик фискальных отчётов запущен (ежедневно в {self.run_hour:02d}:00)")
+
+    def stop(self):
+        """Остановка фонового потока планировщика"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run_loop(self):
+        """Основной цикл: прогрев при старте, затем раз в сутки"""
+        while not self._stop_event.is_set():
+            try:
+                self.precompute_closed_month()
+            except Exception as e:
+                logger.error(f"Ошибка предварительной генерации фискального отчёта: {e}")
+
+            wait_seconds = (self._next_run_time() - datetime.now()).total_seconds()
+            self._stop_event.wait(max(wait_seconds, 1.0))
+
+    def _next_run_time(self, now: Optional[datetime] = None) -> datetime:
+        """Время следующего ночного прогона"""
+        now = now or datetime.now()
+        next_run = now.replace(hour=self.run_hour, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        return next_run
+
+    def precompute_closed_month(self, today: Optional[date] = None):
+        """Генерация отчётов за только что закрытый месяц для всех языков"""
+        today = today or date.today()
+        last_month_day = today.replace(day=1) - timedelta(days=1)
+        month, year = last_month_day.month, last_month_day.year
+
+        for language in config.SUPPORTED_LANGUAGES:
+            self._generate(month, year, language)
+
+        logger.info(f"Фискальные отчёты за {month:02d}/{year} подготовлены заранее")
+
+    def get_fiscal_report(self, month: int, year: int, language: str = "ru") -> Dict[str, Any]:
+        """Отчёт из кэша или генерация при промахе"""
+        key = (month, year, language)
+        with self._lock:
+            report = self._cache.get(key)
+            if report is not None:
+                logger.info(f"Фискальный отчёт за {month:02d}/{year} выдан из кэша")
+                return copy.deepcopy(report)
+
+        report = self._generate(month, year, language)
+        return copy.deepcopy(report) if "error" not in report else report
+
+    def _generate(self, month: int, year: int, language: str) -> Dict[str, Any]:
+        """Генерация отчёта вне блокировки; в кэш он попадает, только если документы за это время не менялись"""
+        with self._lock:
+            generation = self._generation
+        report = self.generator.generate_fiscal_report(month, year, language)
+        if "error" not in report:
+            with self._lock:
+                if self._generation == generation:
+                    self._cache[(month, year, language)] = report
+                else:
+                    logger.info(f"Документы изменились во время генерации отчёта за {month:02d}/{year}, "
+                                f"отчёт не кэшируется")
+        return report
+
+    @staticmethod
+    def _contains(report: Dict[str, Any], doc_ids: Iterable[int]) -> bool:
+        """Входит ли в отчёт хотя бы один из документов"""
+        doc_ids = set(doc_ids)
+        return any(doc.id in doc_ids
+                   for company in report["fiscal_data"]["companies"].values()
+                   for doc in company["documents"])
+
+    def on_document_stored(self, doc_id: int):
+        """Инкрементальное обновление закэшированных отчётов новым документом.
+        Отчётный период определяется датой документа, поэтому поздний документ попадает в отчёт закрытого месяца"""
+        with self._lock:
+            self._generation += 1
+            if not self._cache:
+                return
+
+        doc = self.generator.storage.get_document(doc_id)
+        if not doc:
+            return
+
+        doc_day = self.generator.report_day(doc)
+        with self._lock:
+            for report in self._cache.values():
+                period = report["period"]
+                # Отчёт, сгенерированный уже после сохранения документа, содержит его
+                if period["start_date"] <= doc_day <= period["end_date"] and not self._contains(report, [doc_id]):
+                    self.generator.add_document_to_fiscal_report(report, doc)
+
+    def invalidate_document(self, doc_id: int):
+        """Сброс отчётов, на которые может повлиять изменённый или удалённый документ"""
+        self.invalidate_documents([doc_id])
+
+    def invalidate_documents(self, doc_ids: Iterable[int]):
+        """Сброс отчётов за периоды изменённых документов и отчётов, в которые они уже входят.
+        Период определяется датой документа: документ, ставший фискальным после правки или
+        переклассификации, ещё не входит в отчёт, но должен в него попасть; отчёт прежней даты его содержит"""
+        doc_ids = set(doc_ids)
+        with self._lock:
+            self._generation += 1
+            if not self._cache or not doc_ids:
+                return
+
+        doc_days = set()
+        for doc_id in doc_ids:
+            doc = self.generator.storage.get_document(doc_id)
+            if doc:
+                doc_days.add(self.generator.report_day(doc))
+
+        with self._lock:
+            stale_keys = [
+                key for key, report in self._cache.items()
+                if any(report["period"]["start_date"] <= day <= report["period"]["end_date"] for day in doc_days)
+                or self._contains(report, doc_ids)
+            ]
+            for key in stale_keys:
+                del self._cache[key]
+
+        if stale_keys:
+            logger.info(f"Сброшено фискальных отчётов из кэша: {len(stale_keys)} (документов изменено: {len(doc_ids)})")
+
+# Создание глобального экземпляра
+fiscal_report_scheduler = FiscalReportScheduler()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Переобучение локального классификатора типов документов на документах из хранилища,
+подтверждённых или исправленных пользователем
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from config import config
+from document_storage import get_storage
+from local_classifier import LocalDocumentClassifier, load_training_data
+
+def main():
+    """Основная функция переобучения"""
+    parser = argparse.ArgumentParser(description='Переобучение локального классификатора документов')
+    parser.add_argument(
+        '--output',
+        default=str(config.LOCAL_CLASSIFIER_PATH),
+        help=f'Файл модели (по умолчанию: {config.LOCAL_CLASSIFIER_PATH})'
+    )
+    parser.add_argument(
+        '--holdout',
+        type=float,
+        default=0.2,
+        help='Доля документов для проверки точности перед обучением на всей выборке (по умолчанию: 0.2)'
+    )
+    parser.add_argument(
+        '--epochs',
+        type=int,
+        default=150,
+        help='Количество эпох обучения (по умолчанию: 150)'
+    )
+    args = parser.parse_args()
+
+    texts, labels = load_training_data(get_storage())
+    if len(set(labels)) < 2:
+        print(f"✗ Недостаточно данных: нужны проверенные пользователем документы хотя бы двух типов "
+              f"(найдено документов: {len(texts)})")
+        sys.exit(1)
+    print(f"✓ Загружено проверенных документов: {len(texts)}, типов: {len(set(labels))}")
+
+    # Проверка точности на отложенной части выборки
+    indices = list(range(len(texts)))
+    random.Random(42).shuffle(indices)
+    holdout_size = int(len(indices) * args.holdout)
+    if holdout_size:
+        test, train = indices[:holdout_size], indices[holdout_size:]
+        model = LocalDocumentClassifier().fit([texts[i] for i in train], [labels[i] for i in train],
+                                              epochs=args.epochs)
+        probabilities = model.predict_proba([texts[i] for i in test])
+        predicted = [model.labels[index] for index in np.argmax(probabilities, axis=1)]
+        accuracy = np.mean([predicted[k] == labels[i] for k, i in enumerate(test)])
+        confident = np.max(probabilities, axis=1) >= config.LOCAL_CLASSIFIER_THRESHOLD
+        print(f"✓ Точность на отложенной выборке ({holdout_size} док.): {accuracy:.1%}, "
+              f"уверенных ответов: {confident.mean():.1%}")
+
+    start = time.perf_counter()
+    model = LocalDocumentClassifier().fit(texts, labels, epochs=args.epochs)
+    print(f"✓ Модель обучена на всей выборке за {time.perf_counter() - start:.1f} с")
+
+    model.save(Path(args.output))
+    print(f"✓ Модель сохранена: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Объединение одновременных одинаковых заданий (single-flight)
+Пока задание с ключом выполняется, повторные вызовы с тем же ключом не запускают работу заново,
+а ждут результат первого. После завершения ключ освобождается: результаты не кэшируются
+"""
+
+import concurrent.futures
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Реестр выполняющихся заданий по ключу"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[str, concurrent.futures.Future] = {}
+
+    def join(self, key: str) -> Tuple[concurrent.futures.Future, bool]:
+        """Future задания и признак того, что задание выполняет вызывающий (ведущий)"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                metrics.increment(f"{self.name}_coalesced")
+                logger.info(f"{self.name}: ожидание уже выполняющегося задания {key[:16]}")
+                return future, False
+            future = self._calls[key] = concurrent.futures.Future()
+            return future, True
+
+    def resolve(self, key: str, result: Any = None, exception: Optional[BaseException] = None) -> None:
+        """Завершение задания ведущим: ключ освобождается, ожидающие получают результат или ошибку"""
+        with self._lock:
+            future = self._calls.pop(key, None)
+        if future is None or future.done():
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def do(self, key: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Выполнение функции; одновременные вызовы с тем же ключом получают тот же результат"""
+        future, leader = self.join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            self.resolve(key, exception=e)
+            raise
+        self.resolve(key, result)
+        return result
+
+    def in_flight(self) -> int:
+        """Число выполняющихся заданий"""
+        with self._lock:
+            return len(self._calls)
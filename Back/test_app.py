@@ -0,0 +1,110 @@
+"""
+Тесты для ответов ИИ-ассистента и учёта вызовов LLM во Flask-приложении
+"""
+
+import io
+import json
+
+import pytest
+
+import app as flask_app
+from benchmarks.mock_openai import MockOpenAIServer
+from llm_cache import LLMCache
+from llm_gateway import LLMGateway
+from llm_usage import LLMUsageLog
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    with MockOpenAIServer(responder=lambda body: "Răspuns despre TVA") as server:
+        usage = LLMUsageLog(str(tmp_path / "llm_usage.db"))
+        gateway = LLMGateway(api_key="test", base_url=server.base_url, model="mock-model",
+                             cache=LLMCache(str(tmp_path / "llm_cache.db")), usage=usage)
+        monkeypatch.setattr(flask_app, "client", gateway)
+        monkeypatch.setattr(flask_app, "llm_usage", usage)
+        flask_app.app.config["TESTING"] = True
+        with flask_app.app.test_client() as test_client:
+            test_client.server = server
+            yield test_client
+        gateway.close()
+
+
+def _events(body):
+    """События SSE: список пар (тип, данные)"""
+    events = []
+    for raw in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in raw.split("\n"))
+        events.append((lines.get("event", "message"), json.loads(lines["data"])))
+    return events
+
+
+class TestAssistantStreaming:
+    """Тесты для /ask_ai и /assistant"""
+
+    @pytest.mark.parametrize("route", ["/ask_ai", "/assistant"])
+    def test_stream(self, client, route):
+        """С "stream": true ответ приходит событиями SSE по мере генерации"""
+        response = client.post(route, json={"question": "Ce este TVA?", "stream": True})
+
+        assert response.status_code == 200
+        assert response.mimetype == "text/event-stream"
+        events = _events(response.get_data(as_text=True))
+        assert events[-1] == ("done", {})
+        assert "".join(data["delta"] for event, data in events[:-1]) == "Răspuns despre TVA"
+        assert len(events) == 4
+
+    def test_stream_by_accept_header(self, client):
+        """Поток можно запросить заголовком Accept"""
+        response = client.post("/ask_ai", json={"question": "q"}, headers={"Accept": "text/event-stream"})
+
+        assert response.mimetype == "text/event-stream"
+
+    @pytest.mark.parametrize("route", ["/ask_ai", "/assistant"])
+    def test_json_answer(self, client, route):
+        """Без stream ответ возвращается целиком, как раньше"""
+        response = client.post(route, json={"question": "Ce este TVA?"})
+
+        assert response.get_json() == {"answer": "Răspuns despre TVA"}
+
+    def test_system_prompt_loaded_once(self, client, monkeypatch, tmp_path):
+        """Системный промпт читается при запуске, а не из текущего каталога при каждом запросе"""
+        monkeypatch.chdir(tmp_path)
+
+        client.post("/ask_ai", json={"question": "Ce este TVA?"})
+
+        system_prompt = client.server.requests[0]["messages"][0]
+        assert system_prompt["role"] == "system"
+        assert system_prompt["content"] == flask_app.SYSTEM_PROMPT_TEMPLATE.format(
+            current_language=system_prompt["content"].split("Отвечай на языке ")[1].split(".")[0])
+
+    def test_stream_error_event(self, client):
+        """Ошибка во время генерации передаётся событием error"""
+        client.server.status = 400
+
+        response = client.post("/ask_ai", json={"question": "q", "stream": True})
+
+        assert _events(response.get_data(as_text=True))[-1][0] == "error"
+
+
+class TestLLMUsage:
+    """Тесты для учёта вызовов LLM"""
+
+    def test_vision_call_attributed_to_document_type(self, client, monkeypatch, tmp_path):
+        """Вызов /classify записывается с эндпоинтом и типом документа из ответа"""
+        monkeypatch.setitem(flask_app.app.config, "UPLOAD_FOLDER", str(tmp_path))
+        client.server.responder = lambda body: json.dumps(
+            {"document_type": "factura", "document_number": "15", "document_date": "01.03.2025"})
+
+        response = client.post("/classify", data={"file": (io.BytesIO(b"\xff\xd8 image"), "scan.jpg")},
+                               content_type="multipart/form-data")
+        assert response.status_code == 200
+
+        by_type = client.get("/metrics/llm-usage").get_json()["usage"]
+        by_endpoint = client.get("/metrics/llm-usage?group_by=endpoint").get_json()["usage"]
+
+        assert [(row["doc_type"], row["calls"], row["prompt_tokens"]) for row in by_type] == [("factura", 1, 10)]
+        assert by_endpoint[0]["endpoint"] == "/classify"
+
+    def test_invalid_group(self, client):
+        """Неизвестное поле группировки — ошибка 400"""
+        assert client.get("/metrics/llm-usage?group_by=cost").status_code == 400
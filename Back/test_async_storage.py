@@ -0,0 +1,80 @@
+"""
+Тесты для асинхронного фасада хранилища
+"""
+
+import asyncio
+import threading
+import time
+
+from async_storage import AsyncDocumentStorage, get_async_storage
+from data_models import DocumentData, DocumentField
+from document_storage import DocumentStorage, get_storage, set_storage
+
+
+def _document():
+    return DocumentData(
+        doc_type="bon_fiscal",
+        fields=[DocumentField(name="total_amount", value="50")],
+        raw_text="BON FISCAL",
+    )
+
+
+class TestAsyncDocumentStorage:
+    """Тесты для выполнения запросов к базе вне цикла событий"""
+
+    def test_calls_run_in_db_thread(self):
+        """Запросы выполняются в отдельном потоке базы данных"""
+        storage = AsyncDocumentStorage(DocumentStorage(":memory:"))
+
+        async def scenario():
+            doc_id = await storage.store_document(_document(), "bon.jpg", "/tmp/bon.jpg")
+            thread_name = await storage.run(lambda: threading.current_thread().name)
+            return doc_id, await storage.get_document(doc_id), thread_name
+
+        doc_id, document, thread_name = asyncio.run(scenario())
+        storage.shutdown()
+
+        assert document.id == doc_id
+        assert thread_name.startswith("db")
+
+    def test_slow_query_does_not_block_loop(self):
+        """Медленный запрос не останавливает другие корутины"""
+        backend = DocumentStorage(":memory:")
+        backend.get_documents = lambda filters=None: time.sleep(0.3) or []
+        storage = AsyncDocumentStorage(backend)
+
+        async def scenario():
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.01)
+
+            task = asyncio.create_task(ticker())
+            await storage.get_documents()
+            task.cancel()
+            return ticks
+
+        ticks = asyncio.run(scenario())
+        storage.shutdown()
+
+        assert ticks > 10
+
+    def test_sqlite_uses_single_thread(self):
+        """Для SQLite все запросы идут через один поток"""
+        storage = AsyncDocumentStorage(DocumentStorage(":memory:"))
+        assert storage.executor._max_workers == 1
+        storage.shutdown()
+
+    def test_follows_shared_storage(self):
+        """Фасад пересоздаётся при замене общего хранилища"""
+        previous = get_storage()
+        replacement = DocumentStorage(":memory:")
+        try:
+            set_storage(replacement)
+            assert get_async_storage().storage is replacement
+        finally:
+            set_storage(previous)
+        assert get_async_storage().storage is previous
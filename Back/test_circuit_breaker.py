@@ -0,0 +1,102 @@
+"""
+Тесты для выключателя OpenAI и бюджета времени запроса
+"""
+
+import time
+
+import pytest
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from latency_budget import latency_budget, remaining_budget
+
+
+@pytest.fixture
+def clock():
+    return [100.0]
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker("test", failure_threshold=3, cooldown=60, clock=lambda: clock[0])
+
+
+class TestCircuitBreaker:
+    """Тесты для CircuitBreaker"""
+
+    def test_opens_after_consecutive_failures(self, breaker):
+        """Выключатель размыкается после failure_threshold ошибок подряд"""
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        assert breaker.state == CLOSED
+
+        breaker.record_failure()
+
+        assert breaker.state == OPEN
+        assert not breaker.allow()
+        assert breaker.snapshot() == {"state": OPEN, "consecutive_failures": 3, "retry_in": 60.0}
+
+    def test_single_probe_after_cooldown(self, breaker, clock):
+        """После охлаждения пропускается один пробный вызов, успех замыкает выключатель"""
+        for _ in range(3):
+            breaker.record_failure()
+        clock[0] += 61
+
+        assert breaker.allow()
+        assert breaker.state == HALF_OPEN
+        assert not breaker.allow()
+
+        breaker.record_success()
+        assert breaker.state == CLOSED and breaker.allow()
+
+    def test_snapshot_after_cooldown(self, breaker, clock):
+        """После охлаждения снимок показывает half_open, даже если вызовов ещё не было"""
+        for _ in range(3):
+            breaker.record_failure()
+        clock[0] += 30
+        assert breaker.snapshot() == {"state": OPEN, "consecutive_failures": 3, "retry_in": 30.0}
+
+        clock[0] += 31
+
+        assert breaker.snapshot() == {"state": HALF_OPEN, "consecutive_failures": 3, "retry_in": 0.0}
+
+    def test_failed_probe_reopens(self, breaker, clock):
+        """Ошибка пробного вызова снова размыкает выключатель на период охлаждения"""
+        for _ in range(3):
+            breaker.record_failure()
+        clock[0] += 61
+        assert breaker.allow()
+
+        breaker.record_failure()
+
+        assert breaker.state == OPEN
+        clock[0] += 30
+        assert not breaker.allow()
+
+
+class TestLatencyBudget:
+    """Тесты для бюджета времени"""
+
+    def test_without_budget(self):
+        """Без бюджета оставшееся время не ограничено"""
+        assert remaining_budget() is None
+        with latency_budget(0):
+            assert remaining_budget() is None
+
+    def test_nested_budget_cannot_extend(self):
+        """Вложенный бюджет не продлевает внешний и восстанавливается после выхода"""
+        with latency_budget(1):
+            with latency_budget(10):
+                assert remaining_budget() <= 1
+            with latency_budget(0.5):
+                assert remaining_budget() <= 0.5
+            assert 0.5 < remaining_budget() <= 1
+        assert remaining_budget() is None
+
+    def test_budget_runs_out(self):
+        """Оставшееся время уменьшается и становится отрицательным"""
+        with latency_budget(0.01):
+            time.sleep(0.02)
+            assert remaining_budget() < 0
@@ -0,0 +1,272 @@
+"""
+Тесты для классификации документов в DocumentProcessor
+"""
+
+import cProfile
+import pstats
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import json
+
+import fitz
+import pytest
+from PIL import Image
+
+from benchmarks.corpus import OCR_CORPUS
+from benchmarks.mock_openai import MockOpenAIServer
+from config import config
+from data_models import DocumentData
+from document_classifier import MoldovanDocumentClassifier
+from document_processor import DocumentProcessor
+from llm_gateway import LLMGateway
+from llm_usage import LLMUsageLog
+from metrics import metrics
+
+# Текст набирает очки сразу у нескольких типов: factura_fiscala, bon_fiscal, declaratie_tva
+RECEIPT_TEXT = "BON FISCAL Nr. 1042\nCasă 3\nData 12.03.2025\nTVA 20%\nTotal 150,00 L"
+
+
+@pytest.fixture
+def processor(monkeypatch):
+    monkeypatch.setattr(config, "LOCAL_CLASSIFIER_ENABLED", False)
+    processor = DocumentProcessor()
+    processor.client = processor.enhancement_client = None
+    return processor
+
+
+def _extraction_calls(profile: cProfile.Profile) -> int:
+    """Количество вызовов extract_document_data по данным профилировщика"""
+    stats = pstats.Stats(profile).stats
+    return sum(
+        call_count
+        for (filename, _, function), (_, call_count, *_) in stats.items()
+        if function == "extract_document_data" and filename.endswith("document_processor.py")
+    )
+
+
+class TestClassifyDocument:
+    """Тесты для двухэтапной классификации: оценка типов, затем извлечение"""
+
+    def test_single_extraction_pass(self, processor):
+        """Данные извлекаются один раз, даже если лучший тип менялся при оценке"""
+        profile = cProfile.Profile()
+        profile.enable()
+        doc_type, confidence, data = processor.classify_document(RECEIPT_TEXT, "ro")
+        profile.disable()
+
+        assert doc_type == "bon_fiscal"
+        assert confidence == 0.75
+        assert data["date"] == "12.03.2025"
+        assert _extraction_calls(profile) == 1
+
+    def test_no_keywords_skips_extraction(self, processor):
+        """Без совпадений тип неизвестен и извлечение не запускается"""
+        profile = cProfile.Profile()
+        profile.enable()
+        result = processor.classify_document("lorem ipsum", "ro")
+        profile.disable()
+
+        assert result == ("unknown", 1.0, {})
+        assert _extraction_calls(profile) == 0
+
+
+class TestClassifyBatch:
+    """Тесты для пакетной классификации"""
+
+    def test_batch_matches_single(self, processor):
+        """Пакет с текстами разных языков классифицируется так же, как по одному"""
+        texts = [document.text for document in OCR_CORPUS] + ["lorem ipsum", ""]
+        languages = [document.language for document in OCR_CORPUS] + ["ro", "ru"]
+
+        results = processor.classify_batch(texts, languages)
+
+        assert results == [processor.classify_document(text, language) for text, language in zip(texts, languages)]
+
+    def test_batch_skips_openai_when_disabled(self, processor, monkeypatch):
+        """При use_openai=False неуверенные документы не отправляются в OpenAI"""
+        processor.client = LLMGateway(api_key="test")
+        monkeypatch.setattr(processor, "classify_with_openai_batch",
+                            lambda *args: pytest.fail("OpenAI не должен вызываться"))
+
+        assert processor.classify_batch([RECEIPT_TEXT], "ro", use_openai=False)[0][0] == "bon_fiscal"
+
+    def test_malformed_ai_results_stay_per_row(self, processor):
+        """Некорректный ответ OpenAI портит только свою строку, уверенные результаты пакета сохраняются"""
+        texts = [RECEIPT_TEXT, "lorem ipsum", "dolor sit", "amet"]
+        ai_results = [
+            None,
+            {"type": "contract", "confidence": "0.9", "data": None},
+            {"type": "invoice_xyz", "confidence": 0.99, "data": {"number": "1"}},
+            {"type": "chitanta", "confidence": "high", "data": {"amount": "10"}},
+        ]
+
+        results = processor.classify_batch(texts, "ro", use_openai=False, ai_results=ai_results)
+
+        assert results[0][:2] == ("bon_fiscal", 0.75)
+        assert results[1] == ("contract", 0.9, {})
+        assert results[2] == ("unknown", 1.0, {})
+        assert results[3] == ("chitanta", 0.0, {"amount": "10"})
+
+    def test_classifier_batch_matches_single(self):
+        """MoldovanDocumentClassifier: пакетный результат совпадает с поштучным подсчётом"""
+        classifier = MoldovanDocumentClassifier()
+        texts = [document.text for document in OCR_CORPUS] + ["lorem ipsum"]
+
+        def naive(text):
+            scores = {doc_type: sum(keyword.lower() in text.lower() for keyword in keywords)
+                      for doc_type, keywords in classifier.doc_type_keywords.items()}
+            best = max(scores, key=scores.get)
+            return best if scores[best] > 0 else "unknown"
+
+        assert classifier.classify_batch(texts) == [naive(text) for text in texts]
+
+
+def test_process_document_records_detected_language(processor, monkeypatch, tmp_path):
+    """Язык документа определяется по тексту, а не по языку интерфейса"""
+    monkeypatch.setattr(config, "USE_OPENAI_FOR_ENHANCEMENT", False)
+    path = tmp_path / "bon.pdf"
+    pdf = fitz.open()
+    pdf.new_page().insert_text((72, 72), "BON FISCAL Nr. 1042\nCasa 3 Casier Elena\nData 12.03.2025\n"
+                                         "TVA 20%\nTotal 150,00 L\nVa multumim pentru cumparaturi")
+    pdf.save(str(path))
+    pdf.close()
+
+    doc_data, _ = processor.process_document(str(path), "ru")
+
+    assert doc_data.language == "ro"
+    assert doc_data.doc_type == "bon_fiscal"
+
+
+class TestProgressiveOcr:
+    """Тесты для прогрессивного OCR изображений"""
+
+    FACTURA = ('FACTURĂ FISCALĂ\nSeria MD AAA Nr. 0458213\nData eliberării: 14.03.2025\n'
+               'Furnizor: SRL "Agro Lux Trade"\nCod fiscal: 1003600045123\nCumpărător: SA "Moldtelecom"\n'
+               'IDNO: 1002600001234\nTotal fără TVA: 1 858,33 L\nTVA 20%: 371,67 L\nTotal: 2 230,00 L')
+
+    @pytest.fixture
+    def image_path(self, processor, monkeypatch, tmp_path):
+        monkeypatch.setattr(config, "USE_OPENAI_FOR_ENHANCEMENT", False)
+        monkeypatch.setattr(config, "OCR_PROGRESSIVE", True)
+        monkeypatch.setattr(processor, "classification_threshold", 0.5)
+        path = tmp_path / "factura.png"
+        Image.new("L", (600, 800), 255).save(path)
+        return str(path)
+
+    def _fake_ocr(self, processor, monkeypatch, fast_text):
+        """Быстрый и полный проходы возвращают заданный текст"""
+        full_calls = []
+        monkeypatch.setattr(processor, "ocr_fast", lambda image, language: (fast_text, 0.7))
+
+        def ocr_page(image, language, multilingual=False):
+            full_calls.append(multilingual)
+            return self.FACTURA, 0.9
+
+        monkeypatch.setattr(processor, "ocr_page", ocr_page)
+        return full_calls
+
+    def test_fast_pass_accepted(self, processor, monkeypatch, image_path):
+        """Полный документ из быстрого прохода не распознаётся повторно"""
+        full_calls = self._fake_ocr(processor, monkeypatch, self.FACTURA)
+        escalated = metrics.get("ocr_progressive_escalated")
+
+        doc_data, validation = processor.process_document(image_path, "ro")
+
+        assert doc_data.doc_type == "factura_fiscala" and not validation["errors"]
+        assert full_calls == []
+        assert metrics.get("ocr_progressive_escalated") == escalated
+
+    def test_fields_without_rules_do_not_escalate(self, processor, monkeypatch, image_path):
+        """Обязательные поля без правил извлечения (стороны и условия договора) не вызывают полный OCR"""
+        contract = ("CONTRACT Nr. 15 (acord de prestare servicii)\nData 01.03.2025\n"
+                    "Obiectul contractului: servicii IT\nValoarea contractului constituie 36 000,00 L")
+        full_calls = self._fake_ocr(processor, monkeypatch, contract)
+        escalated = metrics.get("ocr_progressive_escalated")
+
+        doc_data, validation = processor.process_document(image_path, "ro")
+
+        assert doc_data.doc_type == "contract" and doc_data.raw_text == contract
+        # Поля без правил по-прежнему отмечаются при валидации, но полный OCR их не добавит
+        assert validation["errors"] and not processor.missing_extractable_fields(doc_data)
+        assert full_calls == []
+        assert metrics.get("ocr_progressive_escalated") == escalated
+
+    def test_missing_fields_escalate(self, processor, monkeypatch, image_path):
+        """Без обязательных полей страница распознаётся полностью, тем же путём, что и без прогрессивного OCR"""
+        full_calls = self._fake_ocr(processor, monkeypatch, "FACTURĂ FISCALĂ\nTotal: 2 23O,OO L")
+        documents = metrics.get("ocr_progressive_documents")
+        escalated = metrics.get("ocr_progressive_escalated")
+
+        doc_data, validation = processor.process_document(image_path, "ro")
+
+        assert full_calls == [False]
+        assert doc_data.raw_text == self.FACTURA and not validation["errors"]
+        assert metrics.get("ocr_progressive_documents") == documents + 1
+        assert metrics.get("ocr_progressive_escalated") == escalated + 1
+        assert 0 < metrics.snapshot()["ratios"]["ocr_escalation_rate"] <= 1
+
+    @pytest.mark.parametrize("fast_text", [FACTURA, "FACTURĂ FISCALĂ\nTotal: 2 23O,OO L"])
+    def test_single_llm_call(self, processor, monkeypatch, image_path, tmp_path, fast_text):
+        """С исправлением через LLM быстрый проход оценивается локально: один запрос на документ"""
+        monkeypatch.setattr(config, "USE_OPENAI_FOR_ENHANCEMENT", True)
+        self._fake_ocr(processor, monkeypatch, fast_text)
+        answer = json.dumps({"type": "factura_fiscala", "confidence": 0.9})
+        with MockOpenAIServer(responder=lambda body: answer) as server:
+            gateway = LLMGateway(api_key="test", base_url=server.base_url, model="mock-model")
+            gateway.cache = None  # повторные прогоны не должны отвечаться из кэша
+            processor.enhancement_client = gateway
+            try:
+                doc_data, _ = processor.process_document(image_path, "ro")
+            finally:
+                gateway.close()
+
+        assert doc_data.doc_type == "factura_fiscala"
+        assert len(server.requests) == 1
+        assert self.FACTURA.split("\n")[1] in server.requests[0]["messages"][-1]["content"]
+
+
+def test_duplicate_uploads_processed_once(processor, monkeypatch, tmp_path):
+    """Один и тот же файл, загруженный дважды одновременно, обрабатывается один раз"""
+    calls = []
+    started = threading.Event()
+
+    def process(file_path, language):
+        calls.append(file_path)
+        started.set()
+        time.sleep(0.1)
+        return DocumentData(doc_type="factura", fields=[], raw_text=""), {"errors": [], "warnings": []}
+
+    monkeypatch.setattr(processor, "_process_document", process)
+    first_path, second_path = tmp_path / "a.png", tmp_path / "b.png"
+    first_path.write_bytes(b"same content")
+    second_path.write_bytes(b"same content")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        first = executor.submit(processor.process_document, str(first_path), "ro")
+        started.wait()
+        second = executor.submit(processor.process_document, str(second_path), "ro")
+        assert first.result() == second.result()
+
+    assert calls == [str(first_path)]
+
+
+def test_llm_usage_attributed_to_document(processor, monkeypatch, tmp_path):
+    """Вызовы LLM при обработке файла записываются с его именем и итоговым типом документа"""
+    usage = LLMUsageLog(str(tmp_path / "llm_usage.db"))
+    monkeypatch.setattr("document_processor.llm_usage", usage)
+
+    def process(file_path, language):
+        usage.record("openai", "mock-model", 10, 5)
+        return DocumentData(doc_type="bon_fiscal", fields=[], raw_text=""), {"errors": [], "warnings": []}
+
+    monkeypatch.setattr(processor, "_process_document", process)
+    path = tmp_path / "scan.png"
+    path.write_bytes(b"receipt")
+
+    processor.process_document(str(path), "ro")
+
+    [row] = usage.summary("document")
+    assert row["document"] == "scan.png"
+    assert usage.summary("doc_type")[0]["doc_type"] == "bon_fiscal"
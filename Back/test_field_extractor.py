@@ -0,0 +1,123 @@
+"""
+Тесты для извлечения полей предкомпилированными шаблонами
+"""
+
+import random
+import time
+
+import pytest
+
+from benchmarks.corpus import OCR_CORPUS
+from benchmarks.field_extraction import legacy_extract
+from config import config, DocumentTypeConfig, FieldRule
+from document_classifier import MoldovanDocumentClassifier
+from document_processor import DocumentProcessor
+from field_extractor import FieldExtractor, FieldFamily, field_extractor
+
+CORPUS = {document.name: document for document in OCR_CORPUS}
+
+
+class TestFieldExtractor:
+    """Тесты для совместимости с прежним поиском по спискам шаблонов"""
+
+    @pytest.mark.parametrize("document", OCR_CORPUS, ids=lambda document: document.name)
+    def test_matches_legacy_on_corpus(self, document):
+        """На OCR-корпусе результат совпадает с прежним извлечением"""
+        assert field_extractor.extract(document.text) == legacy_extract(document.text)
+
+    def test_matches_legacy_on_noise(self):
+        """Шаблоны с ретроспективной проверкой находят те же значения на случайном шуме"""
+        rnd = random.Random(7)
+        alphabet = "0123456789 ,.\n%Ll№TVA"
+        for _ in range(2000):
+            text = "".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 60)))
+            assert field_extractor.extract(text) == legacy_extract(text), text
+
+    def test_invoice_fields(self):
+        """Поля счёта-фактуры"""
+        data = field_extractor.extract(OCR_CORPUS[0].text)
+
+        assert data["number"] == "0458213"
+        assert data["date"] == "14.03.2025"
+        assert data["total_amount"] == 2230.0
+        assert data["idno"] == "1002600001234"
+        assert data["company"] == "Agro Lux Trade"
+
+    def test_priority_and_fallback(self):
+        """Берётся самый приоритетный шаблон, при ошибке разбора — следующий"""
+        family = FieldFamily("amount", [r'Total\s*([\d.]+)', r'Suma\s*([\d.]+)'], convert=float)
+
+        assert family.extract("Suma 5 Total 7") == 7.0
+        assert family.extract("Total 1.2.3 Suma 5") == 5.0
+        assert family.extract("nimic") is None
+
+
+class TestFieldRuleRegistry:
+    """Тесты для общих правил извлечения по типам документов"""
+
+    def test_type_specific_fields(self):
+        """Правила типа дополняют общие поля"""
+        data = field_extractor.extract(CORPUS["ordin_ro_1"].text, "ordine_plata")
+
+        assert data["number"] == "512"
+        assert data["amount"] == 18450.0
+        assert data["payer"] == 'SRL "IT Hub"  IDNO 1015600077777'
+        assert data["purpose"] == "transfer TVA pentru 04.2025"
+        assert "seller" not in data
+
+    def test_processor_and_classifier_share_rules(self):
+        """DocumentProcessor и MoldovanDocumentClassifier извлекают одинаковые поля"""
+        text = CORPUS["factura_ro_1"].text
+        doc_type_config = config.get_document_type_config("factura_fiscala")
+
+        processor_data = DocumentProcessor().extract_document_data(text, doc_type_config)
+        classifier_fields = MoldovanDocumentClassifier().extract_fields(text, "factura_fiscala")
+
+        assert processor_data["seller"] == 'SRL "Agro Lux Trade"'
+        assert {field.name: field.value for field in classifier_fields} == {
+            name: str(value) for name, value in processor_data.items()
+        }
+
+    def test_new_type_compiles_only_its_rules(self, monkeypatch):
+        """Новый тип компилирует только свои правила, повторные вызовы ничего не компилируют"""
+        extractor = FieldExtractor()
+        extractor.extract("", "factura_fiscala")
+        compiled = dict(extractor._compiled)
+
+        new_type = DocumentTypeConfig(
+            type_id="proces_verbal", name_ro="Proces-verbal", name_ru="Протокол",
+            keywords_ro=["proces-verbal"], keywords_ru=["протокол"], required_fields=["number"],
+            field_rules=[FieldRule("commission", (r'comisia[\s:]*([^\n]+)',))],
+        )
+        monkeypatch.setattr(config, "MOLDOVAN_DOCUMENT_TYPES", config.MOLDOVAN_DOCUMENT_TYPES + [new_type])
+
+        assert extractor.extract("Comisia: Popa, Rusu", "proces_verbal")["commission"] == "Popa, Rusu"
+        assert set(extractor._compiled) - set(compiled) == {new_type.field_rules[0]}
+        assert all(extractor._compiled[rule] is family for rule, family in compiled.items())
+
+        families = extractor.get_families("proces_verbal")
+        assert extractor.get_families("proces_verbal") is families
+
+    def test_items_line_by_line(self):
+        """Строки товаров чека ищутся в пределах строки, длинная строка без товаров не замедляет поиск"""
+        assert field_extractor.extract(CORPUS["bon_ro_1"].text, "bon_fiscal")["items"] == \
+            "Paine alba            1 x 6,50 6,50"
+
+        start = time.perf_counter()
+        assert "items" not in field_extractor.extract("Casa 3 " * 5000, "bon_fiscal")
+        assert time.perf_counter() - start < 0.5
+
+    def test_type_rule_overrides_common_field(self, monkeypatch):
+        """Правило типа с именем общего поля заменяет общее правило только для этого типа"""
+        extractor = FieldExtractor()
+        new_type = DocumentTypeConfig(
+            type_id="proces_verbal", name_ro="Proces-verbal", name_ru="Протокол",
+            keywords_ro=["proces-verbal"], keywords_ru=["протокол"], required_fields=["number"],
+            field_rules=[FieldRule("number", (r'PV-(\d+)',))],
+        )
+        monkeypatch.setattr(config, "MOLDOVAN_DOCUMENT_TYPES", config.MOLDOVAN_DOCUMENT_TYPES + [new_type])
+
+        assert extractor.extract("Nr. 15 PV-42", "proces_verbal")["number"] == "42"
+        assert extractor.extract("Nr. 15 PV-42")["number"] == "15"
+        assert [family.name for family in extractor.get_families("proces_verbal")] == \
+            [family.name for family in extractor.get_families()]
@@ -0,0 +1,111 @@
+"""
+Тесты для подготовки изображений перед OCR
+"""
+
+import io
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+from config import config
+from image_preprocessing import ImagePreprocessor, adaptive_threshold, estimate_skew, target_scale
+
+LINES = ["FACTURA FISCALA Nr. 0458213", "Data 14.03.2025", "Furnizor: SRL Agro Lux Trade",
+         "IDNO 1002600001234", "Total fara TVA 1 858,33 L", "TVA 20%: 371,67 L", "Total: 2 230,00 L"]
+
+
+def _page(size=(1200, 1600)) -> Image.Image:
+    """Страница с несколькими строками текста"""
+    page = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(page)
+    font = ImageFont.load_default(size=36)
+    for index, line in enumerate(LINES * 3):
+        draw.text((100, 100 + index * 60), line, fill=0, font=font)
+    return page
+
+
+class TestEstimateSkew:
+    """Тесты для оценки наклона строк"""
+
+    @pytest.mark.parametrize("angle", [0.0, 3.0, -5.5, 8.0])
+    def test_detects_angle(self, angle):
+        """Угол поворота страницы определяется с точностью до 0.2°"""
+        page = _page().rotate(angle, resample=Image.Resampling.BILINEAR, expand=True, fillcolor=255)
+
+        assert estimate_skew(page) == pytest.approx(angle, abs=0.2)
+
+    def test_blank_page(self):
+        """На пустой странице наклон не определяется"""
+        assert estimate_skew(Image.new("L", (800, 600), 255)) == 0.0
+
+
+class TestImagePreprocessor:
+    """Тесты для шагов конвейера"""
+
+    def test_deskew(self):
+        """После выравнивания наклон пропадает"""
+        page = _page().rotate(4.0, resample=Image.Resampling.BILINEAR, expand=True, fillcolor=255)
+
+        deskewed = ImagePreprocessor(["deskew"]).process(page)
+
+        assert estimate_skew(deskewed) == pytest.approx(0.0, abs=0.2)
+
+    def test_binarize_uneven_lighting(self):
+        """Текст в тени остаётся чёрным, фон в тени становится белым"""
+        page = np.asarray(_page(), dtype=np.float32)
+        shade = np.linspace(0.35, 1.0, page.shape[1])[None, :]
+        shaded = Image.fromarray((page * 0.5 * shade + 110 * shade).astype(np.uint8), mode="L")
+
+        binary = np.asarray(ImagePreprocessor(["binarize"]).process(shaded))
+        text_mask = np.asarray(_page()) < 128
+
+        assert set(np.unique(binary)) <= {0, 255}
+        assert (binary[text_mask] == 0).mean() > 0.8
+        assert (binary[~text_mask] == 255).mean() > 0.98
+
+    def test_downscale_photo_and_scan(self, monkeypatch):
+        """Фото уменьшается по длинной стороне A4, скан — по своему DPI, маленькие не увеличиваются"""
+        monkeypatch.setattr(config, "OCR_TARGET_DPI", 100)
+        preprocessor = ImagePreprocessor(["downscale"])
+
+        photo = Image.new("L", (3000, 4000), 255)
+        assert preprocessor.process(photo).size == (877, 1169)
+
+        scan = Image.new("L", (2480, 3508), 255)
+        scan.info["dpi"] = (300, 300)
+        assert target_scale(scan) == pytest.approx(1 / 3)
+        assert preprocessor.process(scan).size == (827, 1169)
+
+        small = Image.new("L", (400, 500), 255)
+        assert preprocessor.process(small) is small
+
+    def test_exif_orientation(self):
+        """Фото, снятое боком, поворачивается по EXIF"""
+        image = Image.new("RGB", (400, 300), "white")
+        exif = image.getexif()
+        exif[0x0112] = 6  # повёрнуто на 90° по часовой стрелке
+
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", exif=exif)
+
+        rotated = ImagePreprocessor(["exif", "grayscale"]).process(Image.open(buffer))
+
+        assert rotated.size == (300, 400)
+        assert rotated.mode == "L"
+
+    def test_jpeg_draft_keeps_target_size(self, monkeypatch, tmp_path):
+        """JPEG уменьшается при декодировании и доводится до того же размера, что и без этого"""
+        monkeypatch.setattr(config, "OCR_TARGET_DPI", 50)
+        path = tmp_path / "scan.jpg"
+        Image.new("RGB", (2480, 3508), "white").save(path, dpi=(300, 300))
+        preprocessor = ImagePreprocessor(["grayscale", "downscale"])
+
+        drafted = preprocessor.open(str(path)).size
+        decoded = preprocessor.process(Image.open(path)).size
+        assert drafted[0] == pytest.approx(decoded[0], abs=1) and drafted[1] == pytest.approx(decoded[1], abs=1)
+
+    def test_unknown_step_ignored(self):
+        """Неизвестный шаг из конфигурации пропускается"""
+        assert ImagePreprocessor(["grayscale", "sharpen"]).steps == ["grayscale"]
+
@@ -0,0 +1,85 @@
+"""
+Тесты для автомата ключевых слов типов документов
+"""
+
+import dataclasses
+
+import pytest
+
+from config import config
+from keyword_matcher import DocumentTypeKeywords, KeywordAutomaton
+
+SAMPLE_TEXTS = [
+    "FACTURĂ FISCALĂ Nr. 125\nSRL \"Alfa\" IDNO 1003600012345\nTVA 20%: 200,00 L\nTotal: 1200,00 L",
+    "BON FISCAL\nCasă de marcat 0042\nTotal 50,00 L\nChitanță",
+    "Счет-фактура № 77 от 01.02.2025\nНДС 20%\nИтого 1 200 л",
+    "Договор № 5 (контракт, соглашение сторон)",
+    "",
+]
+
+
+def _naive_counts(text, language):
+    """Подсчёт ключевых слов прежним способом — поиском подстроки по каждому слову"""
+    text_lower = text.lower()
+    return {
+        doc_type.type_id: sum(
+            1 for keyword in (doc_type.keywords_ro if language == "ro" else doc_type.keywords_ru)
+            if keyword.lower() in text_lower
+        )
+        for doc_type in config.MOLDOVAN_DOCUMENT_TYPES
+    }
+
+
+class TestKeywordAutomaton:
+    """Тесты для поиска всех ключевых слов за один проход"""
+
+    @pytest.mark.parametrize("text", SAMPLE_TEXTS)
+    @pytest.mark.parametrize("language", ["ro", "ru"])
+    def test_matches_substring_search(self, text, language):
+        """Результат совпадает с поиском подстроки для каждого ключевого слова"""
+        counts = DocumentTypeKeywords().get_automaton(language).count_matches(text)
+        assert counts == _naive_counts(text, language)
+
+    def test_overlapping_keywords(self):
+        """Вложенные и перекрывающиеся слова находятся все, повтор считается один раз"""
+        automaton = KeywordAutomaton({"bon": ["bon fiscal", "bon", "fiscal"], "fisc": ["fiscal", "sc"]})
+        assert automaton.count_matches("BON FISCAL, bon fiscal") == {"bon": 3, "fisc": 2}
+        assert automaton.score("fiscal") == {"bon": pytest.approx(1 / 3), "fisc": 1.0}
+
+    def test_without_keywords(self):
+        """Метки без ключевых слов ничего не находят"""
+        automaton = KeywordAutomaton({"bon": [], "fisc": [""]})
+
+        assert automaton.count_matches("bon fiscal") == {"bon": 0, "fisc": 0}
+        assert automaton.score_batch(["bon"]).tolist() == [[0.0, 0.0]]
+
+    @pytest.mark.parametrize("language", ["ro", "ru"])
+    def test_score_batch_matches_single(self, language):
+        """Пакетная оценка совпадает с поштучной по каждому тексту"""
+        labels, scores = DocumentTypeKeywords().score_batch(SAMPLE_TEXTS, language)
+        automaton = DocumentTypeKeywords().get_automaton(language)
+
+        assert labels == [doc_type.type_id for doc_type in config.MOLDOVAN_DOCUMENT_TYPES]
+        for text, row in zip(SAMPLE_TEXTS, scores):
+            assert dict(zip(labels, row)) == pytest.approx(automaton.score(text))
+
+
+class TestDocumentTypeKeywords:
+    """Тесты для пересборки автоматов при изменении конфигурации"""
+
+    def test_rebuild_only_on_config_change(self, monkeypatch):
+        """Автомат переиспользуется, пока ключевые слова в конфигурации не изменились"""
+        index = DocumentTypeKeywords()
+        automaton = index.get_automaton("ro")
+        assert index.get_automaton("ro") is automaton
+
+        changed = [
+            dataclasses.replace(doc_type, keywords_ro=doc_type.keywords_ro + ["declarație"])
+            if doc_type.type_id == "declaratie_tva" else doc_type
+            for doc_type in config.MOLDOVAN_DOCUMENT_TYPES
+        ]
+        monkeypatch.setattr(config, "MOLDOVAN_DOCUMENT_TYPES", changed)
+
+        rebuilt = index.get_automaton("ro")
+        assert rebuilt is not automaton
+        assert rebuilt.count_matches("Declarație")["declaratie_tva"] == 1
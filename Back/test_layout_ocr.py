@@ -0,0 +1,129 @@
+"""
+Тесты для OCR по шаблонам документов
+"""
+
+import pytest
+from PIL import Image
+
+from config import config, OcrRegion
+from document_processor import DocumentProcessor
+from layout_ocr import OcrLine, lines_from_data, merge_layout_text
+from metrics import metrics
+
+HEADER = ['FACTURĂ FISCALĂ', 'Seria MD AAA Nr. 0458213', 'Data eliberării: 14.03.2025',
+          'Furnizor: SRL "Agro Lux Trade"', 'Cod fiscal: 1003600045123', 'Cumpărător: SA "Moldtelecom"',
+          'IDNO: 1002600001234']
+ITEMS = ['1  Hârtie A4 80g  10  95,00  950,00', '2  Toner HP 85A  2  640,00  1 280,00']
+TOTALS = ['Total fără TVA: 1 858,33 L', 'TVA 20%: 371,67 L', 'Total: 2 230,00 L']
+
+
+def _lines(texts, top, step=0.03, confidence=90.0):
+    """Строки одна под другой, начиная с доли высоты top"""
+    return [OcrLine(text, 0.1, top + index * step, 0.9, top + index * step + 0.02, [confidence])
+            for index, text in enumerate(texts)]
+
+
+@pytest.fixture
+def processor(monkeypatch):
+    monkeypatch.setattr(config, "LOCAL_CLASSIFIER_ENABLED", False)
+    processor = DocumentProcessor()
+    processor.client = processor.enhancement_client = None
+    return processor
+
+
+class TestLinesFromData:
+    """Тесты для сборки строк из image_to_data"""
+
+    def test_groups_words_into_lines(self):
+        """Слова одной строки объединяются, координаты пересчитываются в доли страницы"""
+        data = {
+            "text": ["Total:", "2 230,00", "", "TVA"],
+            "block_num": [1, 1, 1, 1], "par_num": [1, 1, 1, 1], "line_num": [2, 2, 2, 1],
+            "left": [10, 80, 0, 10], "top": [50, 52, 0, 20], "width": [60, 90, 0, 40], "height": [20, 18, 0, 20],
+            "conf": ["91", "87", "-1", "95"],
+        }
+
+        lines = lines_from_data(data, (200, 100), offset=(0, 100))
+
+        assert [line.text for line in lines] == ["TVA", "Total: 2 230,00"]
+        total = lines[1]
+        assert (total.left, total.top, total.right, total.bottom) == pytest.approx((0.05, 1.5, 0.85, 1.7))
+        assert total.confidences == [91.0, 87.0]
+
+
+class TestMergeLayoutText:
+    """Тесты для объединения чернового текста и текста областей"""
+
+    def test_region_lines_replace_draft(self):
+        """Черновые строки внутри области заменяются, остальные сохраняются по порядку"""
+        region = OcrRegion("totals", (0.0, 0.7, 1.0, 1.0))
+        draft = _lines(["Factura", "Hartie A4"], 0.1, step=0.3, confidence=50.0) + _lines(["T0tal 2 23O"], 0.8)
+        region_lines = _lines(["Total: 2 230,00 L"], 0.8, confidence=90.0)
+
+        text, confidence = merge_layout_text(draft, [(region, region_lines)])
+
+        assert text == "Factura\nHartie A4\nTotal: 2 230,00 L"
+        assert confidence == pytest.approx((50 + 50 + 90) / 3 / 100)
+
+    def test_pixel_box(self):
+        """Область переводится в пиксели страницы"""
+        assert OcrRegion("header", (0.0, 0.25, 0.5, 1.0)).pixel_box((1000, 2000)) == (0, 500, 500, 2000)
+
+
+class TestExtractTextByLayout:
+    """Тесты для OCR по шаблону типа документа"""
+
+    def _fake_ocr(self, processor, monkeypatch, header, totals):
+        """Черновой проход и области шаблона возвращают заданные строки"""
+        calls = []
+
+        def ocr_lines(image, ocr_lang, psm=6, page_size=None, offset=(0, 0)):
+            calls.append((image.size, psm))
+            if page_size is None:
+                return (_lines(["FACTURĂ FISCALĂ", "Seria MD AAA Nr. 0458Z13", "IDN0: 10026OOOO1234"], 0.05, confidence=40.0)
+                        + _lines(ITEMS, 0.45) + _lines(["T0tal: 2 23O,OO L"], 0.8, confidence=40.0))
+            return _lines(header, 0.02) if offset[1] == 0 else _lines(totals, 0.75)
+
+        monkeypatch.setattr(processor, "ocr_lines", ocr_lines)
+        return calls
+
+    def test_known_layout_ocrs_regions(self, processor, monkeypatch):
+        """Для счёта-фактуры в полном разрешении распознаются только шапка и итоги"""
+        calls = self._fake_ocr(processor, monkeypatch, HEADER, TOTALS)
+        page = Image.new("L", (2400, 3400), 255)
+
+        text, confidence = processor.extract_text_by_layout(page, "ron", "ro")
+
+        assert calls[0][0] == (847, 1200)
+        assert [psm for _, psm in calls[1:]] == [6, 6]
+        assert [size for size, _ in calls[1:]] == [(2400, 1190), (2400, 1020)]
+        assert "IDNO: 1002600001234" in text and "IDN0" not in text
+        assert "Total: 2 230,00 L" in text and ITEMS[0] in text
+        assert 0.8 < confidence < 0.91
+
+    def test_missing_fields_fall_back(self, processor, monkeypatch):
+        """Если обязательное поле есть в черновике, но не в областях, шаблон не применяется"""
+        self._fake_ocr(processor, monkeypatch, HEADER[:1], TOTALS)
+        pages, fallbacks = metrics.get("ocr_layout_pages"), metrics.get("ocr_layout_fallbacks")
+
+        assert processor.extract_text_by_layout(Image.new("L", (2400, 3400), 255), "ron", "ro") is None
+        assert metrics.get("ocr_layout_pages") == pages + 1
+        assert metrics.get("ocr_layout_fallbacks") == fallbacks + 1
+
+    def test_fields_absent_from_page_keep_layout(self, processor, monkeypatch):
+        """Поле, которого нет и в черновике, не приводит к OCR всей страницы"""
+        header = [line for line in HEADER if not line.startswith("Cumpărător")]
+        self._fake_ocr(processor, monkeypatch, header, TOTALS)
+        fallbacks = metrics.get("ocr_layout_fallbacks")
+
+        text, _ = processor.extract_text_by_layout(Image.new("L", (2400, 3400), 255), "ron", "ro")
+
+        assert "Cumpărător" not in text and "Total: 2 230,00 L" in text
+        assert metrics.get("ocr_layout_fallbacks") == fallbacks
+
+    def test_type_without_layout(self, processor, monkeypatch):
+        """Для типа без шаблона распознаётся вся страница"""
+        monkeypatch.setattr(processor, "ocr_lines", lambda *args, **kwargs: _lines(
+            ["CONTRACT Nr. 15", "Părțile: SRL Alfa și SRL Beta", "Obiectul contractului: servicii"], 0.1))
+
+        assert processor.extract_text_by_layout(Image.new("L", (1200, 1700), 255), "ron", "ro") is None
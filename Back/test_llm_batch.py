@@ -0,0 +1,86 @@
+"""
+Тесты для пакетной обработки запросов через OpenAI Batch API на локальном сервере
+"""
+
+import json
+
+import pytest
+from openai import OpenAI
+
+from benchmarks.mock_openai import MockOpenAIServer
+from llm_batch import BatchRequest, LLMBatchClient
+from metrics import metrics
+
+
+@pytest.fixture
+def server():
+    with MockOpenAIServer(responder=lambda body: body["messages"][-1]["content"].upper()) as server:
+        yield server
+
+
+@pytest.fixture
+def batch_client(server):
+    sleeps = []
+    client = LLMBatchClient(client=OpenAI(api_key="test", base_url=server.base_url, max_retries=0),
+                            poll_interval=5, sleep=sleeps.append)
+    client.sleeps = sleeps
+    return client
+
+
+def _requests(count):
+    return [BatchRequest(f"doc-{index}", {"model": "mock-model", "messages": [{"role": "user", "content": f"q{index}"}]})
+            for index in range(count)]
+
+
+class TestLLMBatchClient:
+    """Тесты для LLMBatchClient"""
+
+    def test_submit_wait_results(self, server, batch_client):
+        """Запросы уходят одним JSONL-файлом, результаты сопоставляются по custom_id после опроса"""
+        batch_ids = batch_client.submit(_requests(3))
+
+        batch = batch_client.wait(batch_ids[0])
+        results = batch_client.results(batch)
+
+        assert len(batch_ids) == 1
+        assert batch.status == "completed"
+        assert batch_client.sleeps == [5]
+        assert {custom_id: response.choices[0].message.content for custom_id, response in results.items()} == {
+            "doc-0": "Q0", "doc-1": "Q1", "doc-2": "Q2"}
+        assert server.requests == [request.body for request in _requests(3)]
+
+    def test_split_by_max_requests(self, server, batch_client):
+        """Запросы сверх лимита одного файла уходят в следующие пакеты"""
+        batch_client.max_requests = 2
+
+        batch_ids = batch_client.submit(iter(_requests(5)))
+
+        assert len(batch_ids) == 3
+        assert [server.batches[batch_id]["input_file_id"] for batch_id in batch_ids] == ["file-1", "file-2", "file-3"]
+
+    def test_nothing_to_submit(self, server, batch_client):
+        """Пустой набор запросов не создаёт пакетов"""
+        assert batch_client.submit([]) == []
+        assert server.batches == {}
+
+    def test_failed_requests(self, server, batch_client):
+        """Неудавшиеся запросы пакета возвращаются как None"""
+        metrics.reset()
+        server.status = 500
+        batch = batch_client.wait(batch_client.submit(_requests(2))[0])
+
+        assert batch_client.results(batch) == {"doc-0": None, "doc-1": None}
+        assert metrics.get("llm_batch_failed") == 2
+
+    def test_wait_timeout(self, server, batch_client):
+        """Незавершённый пакет не ждут дольше timeout"""
+        server.batch_polls = 100
+
+        with pytest.raises(TimeoutError):
+            batch_client.wait(batch_client.submit(_requests(1))[0], timeout=0)
+
+    def test_request_line_format(self):
+        """Строка JSONL содержит метод, адрес и тело запроса"""
+        line = json.loads(BatchRequest("doc-1", {"model": "m"}).to_line())
+
+        assert line == {"custom_id": "doc-1", "method": "POST", "url": "/v1/chat/completions", "body": {"model": "m"}}
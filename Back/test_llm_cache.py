@@ -0,0 +1,82 @@
+"""
+Тесты для дискового кэша ответов LLM
+"""
+
+import time
+
+import pytest
+
+from llm_cache import LLMCache, bypass_requested, cache_key
+from metrics import metrics
+
+MESSAGES = [{"role": "system", "content": "Ты эксперт."},
+            {"role": "user", "content": "\n            Текст документа:\n            FACTURA  Nr. 15\n            "}]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return LLMCache(str(tmp_path / "llm_cache.db"), ttl_seconds=3600, max_bytes=1000)
+
+
+class TestCacheKey:
+    """Тесты для ключа кэша"""
+
+    def test_whitespace_is_normalized(self):
+        """Промпты, отличающиеся только пробелами и переносами, дают один ключ"""
+        compact = [MESSAGES[0], {"role": "user", "content": "Текст документа: FACTURA Nr. 15"}]
+
+        assert cache_key("gpt-4o", MESSAGES, 0.1) == cache_key("gpt-4o", compact, 0.1)
+
+    def test_model_and_temperature_matter(self):
+        """Модель, температура и формат ответа входят в ключ"""
+        key = cache_key("gpt-4o", MESSAGES, 0.1)
+
+        assert key != cache_key("gpt-4o-mini", MESSAGES, 0.1)
+        assert key != cache_key("gpt-4o", MESSAGES, 0.5)
+        assert key != cache_key("gpt-4o", MESSAGES, 0.1, {"type": "json_object"})
+
+    def test_bypass_header_values(self):
+        """Обход кэша включается значениями 1, true, yes"""
+        assert bypass_requested("1") and bypass_requested("True") and bypass_requested(" yes ")
+        assert not bypass_requested(None) and not bypass_requested("0")
+
+
+class TestLLMCache:
+    """Тесты для хранилища кэша"""
+
+    def test_hit_and_miss_counters(self, cache):
+        """Попадания и промахи считаются в метриках"""
+        hits, misses = metrics.get("llm_cache_hits"), metrics.get("llm_cache_misses")
+
+        assert cache.get("a") is None
+        cache.put("a", "gpt-4o", '{"answer": 1}')
+        assert cache.get("a") == '{"answer": 1}'
+
+        assert metrics.get("llm_cache_hits") == hits + 1
+        assert metrics.get("llm_cache_misses") == misses + 1
+
+    def test_ttl(self, cache):
+        """Устаревшая запись не возвращается и удаляется"""
+        cache.put("a", "gpt-4o", "old")
+        now = time.time()
+        cache.clock = lambda: now + 7200
+
+        assert cache.get("a") is None
+        assert cache.stats()["entries"] == 0
+
+    def test_size_eviction_keeps_recent(self, cache):
+        """При превышении размера удаляются давно не использованные записи"""
+        clock = [1000.0]
+        cache.clock = lambda: clock[0]
+        for key in "abc":
+            clock[0] += 1
+            cache.put(key, "gpt-4o", "x" * 300)
+        clock[0] += 1
+        assert cache.get("a")  # «a» использована недавно
+
+        clock[0] += 1
+        cache.put("d", "gpt-4o", "x" * 300)
+
+        assert cache.stats() == {"entries": 3, "size_bytes": 900}
+        assert cache.get("b") is None
+        assert cache.get("a") and cache.get("c") and cache.get("d")
@@ -0,0 +1,402 @@
+"""
+Тесты для шлюза OpenAI на локальном OpenAI-совместимом сервере
+"""
+
+import asyncio
+import contextvars
+import json
+import time
+
+import openai
+import pytest
+
+from benchmarks.mock_openai import MockOpenAIServer
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from config import LLMProvider, config
+from document_processor import DocumentProcessor
+from latency_budget import LatencyBudgetExceeded, latency_budget
+from llm_cache import LLMCache, llm_cache_bypass
+from llm_gateway import LLMGateway, TokenBucket, created_gateways, estimate_tokens, get_gateway, llm_gateway
+from metrics import metrics
+
+request_source = contextvars.ContextVar("request_source", default=None)
+
+
+@pytest.fixture
+def server():
+    with MockOpenAIServer(responder=lambda body: body["messages"][-1]["content"].upper()) as server:
+        yield server
+
+
+@pytest.fixture
+def gateway(server, tmp_path):
+    gateway = LLMGateway(api_key="test", base_url=server.base_url, model="mock-model", max_concurrency=3,
+                         cache=LLMCache(str(tmp_path / "llm_cache.db")))
+    yield gateway
+    gateway.close()
+
+
+class TestTokenBucket:
+    """Тесты для ведра токенов"""
+
+    def test_burst_then_wait(self):
+        """Всплеск до ёмкости проходит сразу, дальше запросы ждут по очереди"""
+        now = [0.0]
+        bucket = TokenBucket(per_minute=60, capacity=2, clock=lambda: now[0])
+
+        assert [bucket.reserve(1) for _ in range(4)] == pytest.approx([0.0, 0.0, 1.0, 2.0])
+
+        now[0] = 10.0
+        assert bucket.reserve(1) == 0.0
+
+    def test_large_request_fits_capacity(self):
+        """Запрос больше ёмкости ведра не блокируется навсегда"""
+        bucket = TokenBucket(per_minute=600, capacity=100, clock=lambda: 0.0)
+
+        assert bucket.reserve(1000) == 0.0
+        assert bucket.reserve(100) == pytest.approx(10.0)
+
+    def test_estimate_tokens(self):
+        """Оценка учитывает текст сообщений и длину ответа"""
+        messages = [{"role": "system", "content": "x" * 40},
+                    {"role": "user", "content": [{"type": "text", "text": "y" * 80}, {"type": "image_url"}]}]
+
+        assert estimate_tokens(messages, max_tokens=100) == 130
+
+
+class TestLLMGateway:
+    """Тесты для шлюза OpenAI"""
+
+    def test_chat_sync(self, server, gateway):
+        """Синхронный запрос возвращает ответ сервера, модель по умолчанию подставляется"""
+        response = gateway.chat_sync([{"role": "user", "content": "factura"}], max_tokens=10)
+
+        assert response.choices[0].message.content == "FACTURA"
+        assert server.requests[0]["model"] == "mock-model"
+
+    def test_concurrency_cap_and_connection_reuse(self, server, gateway):
+        """Одновременно выполняется не больше max_concurrency запросов через столько же соединений"""
+        server.delay = 0.05
+        futures = [gateway.submit(messages=[{"role": "user", "content": f"doc {index}"}]) for index in range(12)]
+
+        contents = [future.result().choices[0].message.content for future in futures]
+
+        assert contents == [f"DOC {index}" for index in range(12)]
+        assert server.max_in_flight == 3
+        assert len(server.client_ports) <= 3
+
+    def test_async_chat_from_other_loop(self, gateway):
+        """Асинхронный вызов работает из цикла событий приложения"""
+        async def ask_all():
+            return await asyncio.gather(*[gateway.chat([{"role": "user", "content": f"q{index}"}])
+                                          for index in range(4)])
+
+        responses = asyncio.run(ask_all())
+
+        assert [response.choices[0].message.content for response in responses] == ["Q0", "Q1", "Q2", "Q3"]
+
+    def test_context_propagation(self, gateway, monkeypatch):
+        """Контекстные переменные вызывающего потока видны в задаче шлюза"""
+        async def complete(**kwargs):
+            return request_source.get()
+
+        monkeypatch.setattr(gateway, "_complete", complete)
+        request_source.set("upload")
+
+        assert gateway.submit(messages=[]).result() == "upload"
+
+    def test_without_api_key(self, monkeypatch):
+        """Без ключа запросы не отправляются"""
+        monkeypatch.setattr(config, "OPENAI_API_KEY", None)
+        gateway = LLMGateway()
+
+        assert not gateway.available
+        with pytest.raises(RuntimeError):
+            gateway.submit(messages=[])
+
+
+def test_processor_batch_uses_gateway(server, gateway, monkeypatch):
+    """Неуверенные документы пакета классифицируются параллельными запросами через шлюз"""
+    answer = {"type": "contract", "confidence": 0.9, "data": {"number": "15"}}
+    server.responder = lambda body: json.dumps(answer)
+    server.delay = 0.05
+    monkeypatch.setattr(config, "LOCAL_CLASSIFIER_ENABLED", False)
+    processor = DocumentProcessor()
+    processor.client = gateway
+
+    results = processor.classify_batch(["lorem ipsum", "dolor sit amet", "consectetur"], "ro")
+
+    assert [result[:2] for result in results] == [("contract", 0.9)] * 3
+    assert results[0][2]["number"] == "15"
+    assert server.max_in_flight == 3
+
+
+class TestEnhanceAndClassify:
+    """Тесты для исправления текста и классификации одним запросом"""
+
+    @pytest.fixture
+    def processor(self, gateway, monkeypatch):
+        monkeypatch.setattr(config, "LOCAL_CLASSIFIER_ENABLED", False)
+        monkeypatch.setattr(config, "USE_OPENAI_FOR_ENHANCEMENT", True)
+        processor = DocumentProcessor()
+        processor.client = processor.enhancement_client = gateway
+        return processor
+
+    def test_single_round_trip(self, server, processor):
+        """Неуверенный документ: один запрос в JSON-режиме даёт исправленный текст, тип и поля"""
+        server.responder = lambda body: json.dumps({
+            "text": "CONTRACT Nr. 15 din 01.03.2025", "type": "contract", "confidence": 0.9, "data": {"number": "15"}})
+
+        doc_data, _ = processor.analyze_text("C0NTRACT Nr. 1S din 01.O3.2025 lorem ipsum dolor sit", "ro")
+
+        assert len(server.requests) == 1
+        assert server.requests[0]["response_format"] == {"type": "json_object"}
+        assert doc_data.raw_text == "CONTRACT Nr. 15 din 01.03.2025"
+        assert (doc_data.doc_type, doc_data.confidence) == ("contract", 0.9)
+
+    def test_keywords_win_when_confident(self, server, processor):
+        """Уверенная классификация по ключевым словам не заменяется ответом OpenAI, текст — исправленный"""
+        corrected = "BON FISCAL Nr. 1042\nCasă 3\nData 12.03.2025\nTVA 20%\nTotal 150,00 L"
+        server.responder = lambda body: json.dumps({"text": corrected, "type": "contract", "confidence": 0.99})
+        processor.classification_threshold = 0.2
+
+        doc_data, _ = processor.analyze_text("B0N FISCAL Nr. 1O42\nCasa 3\nTotal 150,00 L", "ro")
+
+        assert len(server.requests) == 1
+        assert doc_data.doc_type == "bon_fiscal"
+        assert doc_data.raw_text == corrected
+
+    def test_invalid_answer_keeps_text(self, server, processor):
+        """Ответ не в виде объекта JSON игнорируется"""
+        server.responder = lambda body: "[1, 2, 3]"
+
+        doc_data, _ = processor.analyze_text("lorem ipsum dolor sit amet", "ro")
+
+        assert doc_data.raw_text == "lorem ipsum dolor sit amet"
+        assert doc_data.doc_type == "unknown"
+
+
+class TestLLMProviders:
+    """Тесты для выбора поставщика LLM"""
+
+    @pytest.fixture
+    def local_provider(self, server, monkeypatch):
+        provider = LLMProvider("local", "local-model", server.base_url, "local", timeout=5, max_concurrency=2)
+        monkeypatch.setitem(config.LLM_PROVIDERS, "local", provider)
+        monkeypatch.setattr("llm_gateway._gateways", {})
+        return provider
+
+    def test_openai_is_shared_gateway(self):
+        """Поставщик openai — общий шлюз"""
+        assert get_gateway("openai") is llm_gateway
+        assert get_gateway() is llm_gateway
+
+    def test_local_provider(self, local_provider):
+        """Локальный поставщик создаётся из настроек один раз, со своим выключателем"""
+        gateway = get_gateway("local")
+        try:
+            assert gateway is get_gateway("local")
+            assert (gateway.model, gateway.base_url, gateway.breaker.name) == ("local-model", local_provider.base_url, "local")
+            assert gateway.breaker is not llm_gateway.breaker
+            assert created_gateways() == {"openai": llm_gateway, "local": gateway}
+        finally:
+            gateway.close()
+
+    def test_unknown_provider(self):
+        """Неизвестный поставщик — ошибка настройки"""
+        with pytest.raises(ValueError):
+            get_gateway("missing")
+
+    def test_processor_uses_configured_providers(self, server, local_provider, monkeypatch):
+        """Классификация уходит локальной модели с её именем модели; неизвестный поставщик отключает LLM"""
+        monkeypatch.setattr(config, "LLM_CLASSIFICATION_PROVIDER", "local")
+        monkeypatch.setattr(config, "LLM_ENHANCEMENT_PROVIDER", "missing")
+        server.responder = lambda body: json.dumps({"type": "contract", "confidence": 0.9})
+        processor = DocumentProcessor()
+        token = llm_cache_bypass.set(True)
+        try:
+            assert processor.enhancement_client is None
+            result = processor.classify_with_openai("CONTRACT Nr. 15", "ro")
+            assert result["type"] == "contract"
+            assert server.requests[-1]["model"] == "local-model"
+        finally:
+            llm_cache_bypass.reset(token)
+            processor.client.close()
+
+
+class TestGatewayCache:
+    """Тесты для кэша ответов в шлюзе"""
+
+    def test_repeated_request_served_from_cache(self, server, gateway):
+        """Повторный запрос с другими пробелами не доходит до сервера"""
+        first = gateway.chat_sync([{"role": "user", "content": "factura  15"}], temperature=0.1)
+        second = gateway.chat_sync([{"role": "user", "content": "factura 15\n"}], temperature=0.1)
+
+        assert len(server.requests) == 1
+        assert second.choices[0].message.content == first.choices[0].message.content == "FACTURA  15"
+
+    def test_bypass(self, server, gateway):
+        """При обходе кэша запрос всегда отправляется"""
+        gateway.chat_sync([{"role": "user", "content": "q"}])
+        token = llm_cache_bypass.set(True)
+        try:
+            gateway.chat_sync([{"role": "user", "content": "q"}])
+        finally:
+            llm_cache_bypass.reset(token)
+        gateway.chat_sync([{"role": "user", "content": "q"}], use_cache=False)
+
+        assert len(server.requests) == 3
+
+    def test_concurrent_duplicates_coalesced(self, server, gateway):
+        """Одинаковые одновременные запросы отправляются на сервер один раз"""
+        server.delay = 0.1
+        futures = [gateway.submit(messages=[{"role": "user", "content": "factura"}], use_cache=False)
+                   for _ in range(5)]
+
+        assert {future.result().choices[0].message.content for future in futures} == {"FACTURA"}
+        assert len(server.requests) == 1
+
+
+class TestGatewayResilience:
+    """Тесты для выключателя и бюджета времени в шлюзе"""
+
+    @pytest.fixture
+    def gateway(self, server, tmp_path):
+        gateway = LLMGateway(api_key="test", base_url=server.base_url, model="mock-model", max_retries=0,
+                             cache=LLMCache(str(tmp_path / "llm_cache.db")))
+        gateway.breaker = CircuitBreaker("test", failure_threshold=2, cooldown=60)
+        yield gateway
+        gateway.close()
+
+    def test_breaker_fast_fails_after_errors(self, server, gateway):
+        """После серии ошибок сервера запросы отклоняются, не доходя до сервера"""
+        server.status = 500
+        for index in range(2):
+            with pytest.raises(openai.InternalServerError):
+                gateway.chat_sync([{"role": "user", "content": f"q{index}"}])
+
+        server.status = 200
+        with pytest.raises(CircuitOpenError):
+            gateway.chat_sync([{"role": "user", "content": "q2"}])
+
+        assert gateway.breaker.state == "open"
+        assert len(server.requests) == 2
+
+    def test_client_errors_do_not_open_breaker(self, server, gateway):
+        """Ошибки запроса (4xx) не размыкают выключатель"""
+        server.status = 400
+        for index in range(3):
+            with pytest.raises(openai.BadRequestError):
+                gateway.chat_sync([{"role": "user", "content": f"q{index}"}])
+
+        assert gateway.breaker.state == "closed"
+
+    def test_budget_limits_slow_call(self, server, gateway):
+        """Медленный ответ обрывается по остатку бюджета; это не сбой сервиса"""
+        server.delay = 1.0
+        start = time.monotonic()
+        with latency_budget(0.2):
+            with pytest.raises(LatencyBudgetExceeded):
+                gateway.chat_sync([{"role": "user", "content": "slow"}])
+
+        assert time.monotonic() - start < 0.8
+        assert gateway.breaker.snapshot()["consecutive_failures"] == 0
+
+    def test_budget_timeouts_do_not_open_breaker(self, server, gateway):
+        """Таймауты из-за малого бюджета документов не размыкают выключатель"""
+        server.delay = 0.5
+        for index in range(5):
+            with latency_budget(0.05):
+                with pytest.raises(LatencyBudgetExceeded):
+                    gateway.chat_sync([{"role": "user", "content": f"slow {index}"}])
+
+        assert gateway.breaker.state == "closed"
+
+    def test_provider_timeout_counts_as_failure(self, server, gateway):
+        """Истёкший таймаут самого сервиса считается сбоем"""
+        server.delay = 1.0
+        gateway.timeout = 0.1
+
+        with pytest.raises(asyncio.TimeoutError):
+            gateway.chat_sync([{"role": "user", "content": "slow"}])
+
+        assert gateway.breaker.snapshot()["consecutive_failures"] == 1
+
+    def test_exhausted_budget_skips_call(self, server, gateway):
+        """Если бюджет исчерпан, запрос не отправляется"""
+        with latency_budget(0.001):
+            time.sleep(0.01)
+            with pytest.raises(LatencyBudgetExceeded):
+                gateway.chat_sync([{"role": "user", "content": "late"}])
+
+        assert server.requests == []
+
+    def test_processor_falls_back_when_open(self, server, gateway, monkeypatch):
+        """При разомкнутом выключателе документ классифицируется без OpenAI"""
+        monkeypatch.setattr(config, "LOCAL_CLASSIFIER_ENABLED", False)
+        processor = DocumentProcessor()
+        processor.client = gateway
+        gateway.breaker.record_failure()
+        gateway.breaker.record_failure()
+
+        doc_type, _, _ = processor.classify_document("BON FISCAL Nr. 1042\nCasa 3\nTotal 150,00 L", "ro")
+
+        assert doc_type == "bon_fiscal"
+        assert server.requests == []
+
+
+class TestGatewayStream:
+    """Тесты для потоковых ответов"""
+
+    def test_stream_chunks(self, server, gateway):
+        """Ответ приходит фрагментами, задержка до первого фрагмента учитывается в метриках"""
+        metrics.reset()
+
+        chunks = list(gateway.stream([{"role": "user", "content": "hello streaming world"}]))
+
+        assert chunks == ["HELLO", " STREAMING", " WORLD"]
+        assert server.requests[0]["stream"] is True
+        assert metrics.get("llm_streams") == 1
+        assert "llm_first_token_avg_ms" in metrics.snapshot()["ratios"]
+
+    def test_first_chunk_before_full_answer(self, server, gateway):
+        """Первый фрагмент доступен до окончания генерации"""
+        server.stream_delay = 0.1
+        start = time.monotonic()
+        chunks = gateway.stream([{"role": "user", "content": "a b c d e f"}])
+
+        next(chunks)
+        first = time.monotonic() - start
+        list(chunks)
+
+        assert first < 0.3
+        assert time.monotonic() - start >= 0.5
+
+    def test_stream_cached(self, server, gateway):
+        """Повторный вопрос отвечается из кэша, в том числе обычным запросом"""
+        messages = [{"role": "user", "content": "cached question"}]
+        assert "".join(gateway.stream(messages)) == "CACHED QUESTION"
+
+        assert list(gateway.stream(messages)) == ["CACHED QUESTION"]
+        assert gateway.chat_sync(messages).choices[0].message.content == "CACHED QUESTION"
+        assert len(server.requests) == 1
+
+    def test_stream_rejected_before_start(self, server, gateway):
+        """При разомкнутом выключателе ошибка возникает сразу, до начала потока"""
+        gateway.breaker = CircuitBreaker("test", failure_threshold=1, cooldown=60)
+        gateway.breaker.record_failure()
+
+        with pytest.raises(CircuitOpenError):
+            gateway.stream([{"role": "user", "content": "q"}])
+        assert server.requests == []
+
+    def test_stream_error(self, server, gateway):
+        """Ошибка сервера передаётся при чтении потока"""
+        server.status = 500
+        gateway_without_retries = LLMGateway(api_key="test", base_url=server.base_url, model="mock-model",
+                                             max_retries=0, cache=gateway.cache)
+        try:
+            with pytest.raises(openai.InternalServerError):
+                list(gateway_without_retries.stream([{"role": "user", "content": "q"}]))
+        finally:
+            gateway_without_retries.close()
@@ -0,0 +1,154 @@
+"""
+Тесты для журнала расхода и задержки вызовов LLM
+"""
+
+import threading
+
+import openai
+import pytest
+
+from benchmarks.mock_openai import MockOpenAIServer
+from config import LLMProvider, config
+from llm_cache import LLMCache
+from llm_gateway import LLMGateway
+from llm_usage import LLMUsageLog, llm_usage_scope, usage_scope
+
+
+@pytest.fixture
+def usage(tmp_path):
+    return LLMUsageLog(str(tmp_path / "llm_usage.db"), retention_days=0)
+
+
+@pytest.fixture
+def prices(monkeypatch):
+    """Цены поставщика test: $1 за 1 млн токенов запроса и $4 за 1 млн токенов ответа"""
+    monkeypatch.setitem(config.LLM_PROVIDERS, "test", LLMProvider("test", "mock-model", input_price=1.0,
+                                                                   output_price=4.0))
+
+
+class TestUsageScope:
+    """Тесты для контекста вызовов"""
+
+    def test_nested_scope_inherits_fields(self):
+        """Вложенный контекст наследует незаданные поля и восстанавливает внешний при выходе"""
+        with usage_scope(endpoint="/upload"):
+            with usage_scope(document="scan.png") as scope:
+                assert (scope.endpoint, scope.document) == ("/upload", "scan.png")
+            assert llm_usage_scope.get().document is None
+        assert llm_usage_scope.get().endpoint is None
+
+
+class TestUsageLog:
+    """Тесты для журнала вызовов"""
+
+    def test_cost_by_provider_prices(self, usage, prices):
+        """Стоимость считается по ценам поставщика; ответ из кэша бесплатен, пакетный — со скидкой"""
+        with usage_scope(endpoint="/upload", document="a.png"):
+            usage.record("test", "mock-model", 1000, 500, latency_ms=120, wait_ms=5)
+            usage.record("test", "mock-model", 1000, 500, status="cached")
+        usage.record("test", "mock-model", 1000, 500, cost_factor=0.5)
+
+        by_endpoint = {row["endpoint"]: row for row in usage.summary("endpoint")}
+
+        assert by_endpoint["/upload"]["cost_usd"] == pytest.approx(0.003)
+        assert by_endpoint["/upload"]["cached_calls"] == 1
+        assert by_endpoint["/upload"]["avg_latency_ms"] == 120
+        assert by_endpoint[None]["cost_usd"] == pytest.approx(0.0015)
+
+    def test_summary_by_document_type(self, usage, prices):
+        """После обработки вызовы относятся к типу документа; дорогие типы — первыми"""
+        for document, tokens in (("a.png", 100), ("b.png", 300), ("c.pdf", 5000)):
+            with usage_scope(endpoint="/upload", document=document):
+                usage.record("test", "mock-model", tokens, 50)
+        usage.attribute("a.png", doc_type="bon_fiscal")
+        usage.attribute("b.png", document_id=7, doc_type="bon_fiscal")
+        usage.attribute("c.pdf", doc_type="contract")
+        usage.attribute("b.png", document_id=None, doc_type=None)
+
+        summary = usage.summary("doc_type")
+
+        assert [row["doc_type"] for row in summary] == ["contract", "bon_fiscal"]
+        assert (summary[1]["calls"], summary[1]["documents"], summary[1]["prompt_tokens"]) == (2, 2, 400)
+        assert summary[1]["cost_per_document_usd"] == pytest.approx(0.0004)
+        assert usage.summary("document")[-1]["document"] in ("a.png", "b.png")
+
+    def test_invalid_group(self, usage):
+        """Группировка только по известным полям"""
+        with pytest.raises(ValueError):
+            usage.summary("prompt_tokens; DROP TABLE llm_usage")
+
+    def test_since_and_retention(self, tmp_path):
+        """Сводка за период; при открытии журнала старые записи удаляются"""
+        now = [1_000_000.0]
+        path = str(tmp_path / "llm_usage.db")
+        usage = LLMUsageLog(path, retention_days=1, clock=lambda: now[0])
+        usage.record("test", "mock-model", 10, 5)
+        now[0] += 3600
+        usage.record("test", "mock-model", 10, 5)
+
+        assert usage.summary("model", since=now[0] - 60)[0]["calls"] == 1
+
+        now[0] += 86400
+        assert LLMUsageLog(path, retention_days=1, clock=lambda: now[0]).summary("model")[0]["calls"] == 1
+
+
+class TestGatewayUsage:
+    """Тесты для записи вызовов шлюза"""
+
+    @pytest.fixture
+    def server(self):
+        with MockOpenAIServer(responder=lambda body: "answer text") as server:
+            yield server
+
+    @pytest.fixture
+    def gateway(self, server, usage, tmp_path):
+        gateway = LLMGateway(api_key="test", base_url=server.base_url, model="mock-model", max_retries=0,
+                             cache=LLMCache(str(tmp_path / "llm_cache.db")), usage=usage, name="test")
+        yield gateway
+        gateway.close()
+
+    def test_call_recorded_with_scope(self, gateway, usage, prices):
+        """Вызов записывается с токенами из ответа, задержкой и контекстом вызывающего потока"""
+        with usage_scope(endpoint="/upload", document="scan.png"):
+            gateway.chat_sync([{"role": "user", "content": "q"}])
+            gateway.chat_sync([{"role": "user", "content": "q"}])
+
+        row = usage.summary("document")[0]
+
+        assert row["document"] == "scan.png"
+        assert (row["calls"], row["cached_calls"]) == (2, 1)
+        assert (row["prompt_tokens"], row["completion_tokens"]) == (20, 10)
+        assert row["cost_usd"] == pytest.approx((10 * 1.0 + 5 * 4.0) / 1_000_000)
+        assert row["avg_latency_ms"] > 0
+
+    def test_failed_call_recorded(self, server, gateway, usage):
+        """Неудачный вызов тоже попадает в журнал"""
+        server.status = 500
+
+        with pytest.raises(openai.InternalServerError):
+            gateway.chat_sync([{"role": "user", "content": "q"}])
+
+        assert usage.summary("model")[0]["failed_calls"] == 1
+
+    def test_stream_usage(self, server, gateway, usage):
+        """Потоковый ответ запрашивает расход токенов в последнем фрагменте"""
+        assert "".join(gateway.stream([{"role": "user", "content": "q"}])) == "answer text"
+
+        assert server.requests[0]["stream_options"] == {"include_usage": True}
+        row = usage.summary("model")[0]
+        assert (row["calls"], row["prompt_tokens"], row["completion_tokens"]) == (1, 10, 5)
+
+    def test_writes_off_event_loop(self, gateway, usage, monkeypatch):
+        """Журнал и кэш пишутся в потоке записи шлюза, а не в его цикле событий"""
+        threads = []
+        record, put = usage.record, gateway.cache.put
+        monkeypatch.setattr(usage, "record", lambda *args, **kwargs: threads.append(
+            threading.current_thread().name) or record(*args, **kwargs))
+        monkeypatch.setattr(gateway.cache, "put", lambda *args: threads.append(
+            threading.current_thread().name) or put(*args))
+
+        with usage_scope(endpoint="/upload"):
+            gateway.chat_sync([{"role": "user", "content": "q"}])
+
+        assert len(threads) == 2 and all(name.startswith("llm-gateway-writer") for name in threads)
+        assert usage.summary("endpoint")[0]["endpoint"] == "/upload"
@@ -0,0 +1,157 @@
+"""
+Тесты для локального классификатора типов документов
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from benchmarks.corpus import augment_corpus
+from config import config
+from data_models import DocumentData
+from document_processor import DocumentProcessor
+from llm_gateway import LLMGateway
+from document_storage import DocumentStorage
+from local_classifier import (
+    HashingFeaturizer, LocalClassifierProvider, LocalDocumentClassifier, load_training_data,
+)
+
+
+@pytest.fixture(scope="module")
+def model():
+    train = augment_corpus(3, seed=1)
+    return LocalDocumentClassifier().fit([doc.text for doc in train], [doc.doc_type for doc in train], epochs=100)
+
+
+class TestHashingFeaturizer:
+    """Тесты для хешированных n-грамм"""
+
+    def test_case_and_whitespace_insensitive(self):
+        """Регистр и лишние пробелы OCR не меняют признаки"""
+        featurizer = HashingFeaturizer(2 ** 12)
+        first = featurizer.transform(["BON  FISCAL\nTotal"])
+        second = featurizer.transform(["bon fiscal total"])
+
+        for left, right in zip(first, second):
+            assert np.array_equal(left, right)
+
+    def test_empty_text(self):
+        """Пустой и короткий текст дают пустую строку матрицы"""
+        indptr, indices, _ = HashingFeaturizer(2 ** 12).transform(["", "ab", "abc"])
+
+        assert list(indptr) == [0, 0, 0, 1]
+        assert indices.max() < 2 ** 12
+
+
+class TestLocalDocumentClassifier:
+    """Тесты для обучения, предсказания и сохранения модели"""
+
+    def test_accuracy_on_unseen_variants(self, model):
+        """Новые варианты документов классифицируются уверенно и верно"""
+        test = augment_corpus(2, seed=2)
+        probabilities = model.predict_proba([doc.text for doc in test])
+        predicted = [model.labels[index] for index in np.argmax(probabilities, axis=1)]
+
+        accuracy = np.mean([label == doc.doc_type for label, doc in zip(predicted, test)])
+        assert accuracy >= 0.9
+        assert np.allclose(probabilities.sum(axis=1), 1.0, atol=1e-5)
+
+    def test_batch_matches_single(self, model):
+        """Пакетная классификация совпадает с поштучной"""
+        texts = [doc.text for doc in augment_corpus(1, seed=3)]
+        probabilities = model.predict_proba(texts)
+
+        for text, row in zip(texts, probabilities):
+            label, probability = model.classify(text)
+            assert label == model.labels[int(np.argmax(row))]
+            assert probability == pytest.approx(float(row.max()), rel=1e-5)
+
+    def test_save_and_load(self, model, tmp_path):
+        """Загруженная модель даёт те же вероятности"""
+        path = tmp_path / "model.npz"
+        model.save(path)
+        loaded = LocalDocumentClassifier.load(path)
+        texts = [doc.text for doc in augment_corpus(1, seed=4)]
+
+        assert loaded.labels == model.labels
+        assert np.allclose(loaded.predict_proba(texts), model.predict_proba(texts))
+
+    def test_failed_save_keeps_model(self, model, tmp_path, monkeypatch):
+        """Ошибка записи не портит сохранённую модель и не оставляет временных файлов"""
+        path = tmp_path / "model.npz"
+        model.save(path)
+        saved = path.read_bytes()
+
+        def fail(*args, **kwargs):
+            raise OSError("диск заполнен")
+
+        monkeypatch.setattr(np, "savez_compressed", fail)
+        with pytest.raises(OSError):
+            model.save(path)
+
+        assert path.read_bytes() == saved
+        assert [file.name for file in tmp_path.iterdir()] == ["model.npz"]
+
+
+class TestLocalClassifierProvider:
+    """Тесты для загрузки модели с диска"""
+
+    def test_missing_model(self, tmp_path):
+        """Без файла модели локальный уровень отключён"""
+        assert LocalClassifierProvider(tmp_path / "missing.npz").get() is None
+
+    def test_reload_on_change(self, model, tmp_path):
+        """Модель перечитывается только после изменения файла"""
+        path = tmp_path / "model.npz"
+        model.save(path)
+        provider = LocalClassifierProvider(path)
+
+        first = provider.get()
+        assert provider.get() is first
+
+        model.save(path)
+        os.utime(path, (0, os.stat(path).st_mtime + 10))
+        assert provider.get() is not first
+
+
+def test_load_training_data():
+    """В обучающую выборку попадают только документы, подтверждённые или исправленные пользователем"""
+    storage = DocumentStorage(":memory:")
+    ids = {}
+    for doc_type, text, errors in [
+        ("bon_fiscal", "BON FISCAL", []),
+        ("factura_fiscala", "FACTURA", []),
+        ("unknown", "CONTRACT", ["Неизвестный тип"]),
+        ("unknown", "lorem", []),
+        ("chitanta", "CHITANTA", ["Отсутствует сумма"]),
+        ("contract", "", []),
+    ]:
+        ids[text] = storage.store_document(DocumentData(doc_type, [], text), f"{doc_type}.png",
+                                           f"/tmp/{doc_type}.png", {"errors": errors, "warnings": []})
+
+    # Подтверждение без изменений, исправление типа и правка неизвестного документа
+    storage.update_document(ids["BON FISCAL"], {})
+    storage.update_document(ids["CONTRACT"], {}, "contract")
+    storage.update_document(ids["lorem"], {})
+    storage.update_document(ids[""], {})
+
+    texts, labels = load_training_data(storage)
+    assert sorted(zip(texts, labels)) == [("BON FISCAL", "bon_fiscal"), ("CONTRACT", "contract")]
+
+
+def test_processor_uses_local_tier(model, monkeypatch):
+    """Уверенный ответ локальной модели заменяет вызов OpenAI"""
+    processor = DocumentProcessor()
+    processor.client = LLMGateway(api_key="test")
+    monkeypatch.setattr(config, "LOCAL_CLASSIFIER_ENABLED", True)
+    monkeypatch.setattr("document_processor.local_classifier.get", lambda: model)
+    monkeypatch.setattr(processor, "classify_with_openai_batch",
+                        lambda *args: pytest.fail("OpenAI не должен вызываться"))
+    document = next(doc for doc in augment_corpus(1, seed=5) if doc.doc_type == "stat_plata")
+
+    doc_type, confidence, data = processor.classify_document(document.text, document.language)
+
+    assert doc_type == "stat_plata"
+    assert confidence >= config.LOCAL_CLASSIFIER_THRESHOLD
+    assert data
@@ -0,0 +1,35 @@
+"""
+Тесты для метрик работы сервиса
+"""
+
+import threading
+
+from metrics import Metrics
+
+
+class TestMetrics:
+    """Тесты для реестра счётчиков"""
+
+    def test_concurrent_increments(self):
+        """Счётчик не теряет увеличения из разных потоков"""
+        metrics = Metrics()
+        threads = [threading.Thread(target=lambda: [metrics.increment("uploads") for _ in range(1000)])
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert metrics.get("uploads") == 8000
+
+    def test_ratio(self):
+        """Доля считается по текущим счётчикам, без знаменателя равна нулю"""
+        metrics = Metrics()
+        metrics.register_ratio("escalation_rate", "escalated", "documents")
+        assert metrics.snapshot()["ratios"] == {"escalation_rate": 0.0}
+
+        metrics.increment("documents", 4)
+        metrics.increment("escalated")
+
+        assert metrics.snapshot() == {"counters": {"documents": 4, "escalated": 1},
+                                      "ratios": {"escalation_rate": 0.25}}
@@ -0,0 +1,118 @@
+"""
+Тесты для определения языка страницы перед OCR
+"""
+
+import sqlite3
+
+import pytest
+import pytesseract
+from PIL import Image
+
+from benchmarks.corpus import OCR_CORPUS
+from data_models import DocumentData
+from document_storage import DocumentStorage
+from ocr_language import OcrLanguage, OcrLanguageDetector, detect_text_language
+
+
+@pytest.fixture
+def image():
+    return Image.new("L", (2400, 1600), 255)
+
+
+class TestDetectTextLanguage:
+    """Тесты для определения языка по письменности текста"""
+
+    @pytest.mark.parametrize("document", OCR_CORPUS, ids=lambda document: document.name)
+    def test_corpus_languages(self, document):
+        """Язык каждого документа корпуса определяется верно"""
+        assert detect_text_language(document.text).language == document.language
+
+    def test_mixed_text_uses_both_models(self):
+        """Для смешанного текста подключается вторая модель, основная идёт первой"""
+        result = detect_text_language("Поставщик ООО Гранд Строй, покупатель SRL Euro Casa Trade Market")
+
+        assert result == OcrLanguage("ru", "rus+ron", "text")
+
+    def test_too_few_letters(self):
+        """По цифрам и коротким строкам язык не определяется"""
+        assert detect_text_language("12.03.2025 150,00 L") is None
+
+
+class TestOcrLanguageDetector:
+    """Тесты для выбора модели Tesseract по странице"""
+
+    def test_osd_script(self, monkeypatch, image):
+        """Письменность из OSD выбирает одну модель без пробного распознавания"""
+        monkeypatch.setattr(pytesseract, "image_to_osd",
+                            lambda *args, **kwargs: {"script": "Cyrillic", "script_conf": 4.2})
+        monkeypatch.setattr(pytesseract, "image_to_string",
+                            lambda *args, **kwargs: pytest.fail("Пробное распознавание не нужно"))
+
+        assert OcrLanguageDetector().detect(image, "ro") == OcrLanguage("ru", "rus", "osd")
+
+    def test_probe_without_osd_data(self, monkeypatch, image):
+        """Без osd.traineddata язык определяется по уменьшенной копии, OSD больше не вызывается"""
+        osd_calls, probe_sizes = [], []
+
+        def image_to_osd(*args, **kwargs):
+            osd_calls.append(1)
+            raise pytesseract.TesseractError(1, "Failed loading language 'osd' osd.traineddata")
+
+        def image_to_string(small, **kwargs):
+            probe_sizes.append(small.size)
+            return "FACTURĂ FISCALĂ Furnizor Cumpărător Denumirea mărfii"
+
+        monkeypatch.setattr(pytesseract, "image_to_osd", image_to_osd)
+        monkeypatch.setattr(pytesseract, "image_to_string", image_to_string)
+        detector = OcrLanguageDetector()
+
+        assert detector.detect(image, "ru") == OcrLanguage("ro", "ron", "probe")
+        assert detector.detect(image, "ru").language == "ro"
+        assert len(osd_calls) == 1
+        assert probe_sizes[0] == (1000, 667)
+
+    def test_hint_fallback(self, monkeypatch, image):
+        """Если язык не определён, используется язык из запроса"""
+        monkeypatch.setattr(pytesseract, "image_to_osd",
+                            lambda *args, **kwargs: {"script": "Latin", "script_conf": 0.1})
+        monkeypatch.setattr(pytesseract, "image_to_string", lambda *args, **kwargs: "")
+        detector = OcrLanguageDetector()
+
+        assert detector.detect(image, "ro") == OcrLanguage("ro", "ron", "hint")
+        assert detector.detect(image, None) == OcrLanguage("ru", "rus+ron", "hint")
+
+
+class TestStoredLanguage:
+    """Тесты для сохранения определённого языка"""
+
+    def test_language_round_trip(self):
+        """Язык документа сохраняется и возвращается в API"""
+        storage = DocumentStorage(":memory:")
+        doc_id = storage.store_document(DocumentData("bon_fiscal", [], "BON FISCAL", language="ro"),
+                                        "bon.png", "/tmp/bon.png")
+
+        assert storage.get_document(doc_id).language == "ro"
+        assert storage.get_document_for_api(doc_id)["language"] == "ro"
+
+    def test_migrates_existing_database(self, tmp_path):
+        """В существующую базу без колонки language она добавляется при запуске"""
+        path = tmp_path / "old.db"
+        with sqlite3.connect(path) as conn:
+            conn.execute("""
+                CREATE TABLE documents (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, filename TEXT NOT NULL, doc_type TEXT NOT NULL,
+                    fields TEXT NOT NULL, raw_text TEXT, upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    file_path TEXT NOT NULL, confidence REAL DEFAULT 1.0,
+                    validation_errors TEXT, validation_warnings TEXT
+                )
+            """)
+            conn.execute("INSERT INTO documents (filename, doc_type, fields, file_path) "
+                         "VALUES ('a.png', 'contract', '[]', '/tmp/a.png')")
+        conn.close()
+
+        storage = DocumentStorage(str(path))
+
+        assert storage.get_document(1).language is None
+        doc_id = storage.store_document(DocumentData("contract", [], "CONTRACT", language="ru"),
+                                        "b.png", "/tmp/b.png")
+        assert storage.get_document(doc_id).language == "ru"
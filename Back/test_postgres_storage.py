@@ -0,0 +1,206 @@
+"""
+Тесты для выбора хранилища и PostgreSQL-бэкенда
+SQL-запросы PostgreSQL проверяются без сервера, тесты на живой базе запускаются
+при заданной переменной TEST_POSTGRES_URL
+"""
+
+import os
+from datetime import date
+
+import pytest
+
+from data_models import DocumentData, DocumentField
+from document_storage import ClassificationUpdate, DocumentStorage, create_storage
+from postgres_storage import DOCUMENT_COLUMNS, HAS_ERRORS_SQL, Jsonb, PostgresDocumentStorage
+
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+
+def _store(storage, doc_type, errors=None, **fields):
+    """Сохраняет документ с заданными полями"""
+    doc_data = DocumentData(
+        doc_type=doc_type,
+        fields=[DocumentField(name=name, value=str(value)) for name, value in fields.items()],
+        raw_text=f"{doc_type} text",
+        confidence=0.9,
+    )
+    return storage.store_document(doc_data, f"{doc_type}.pdf", f"/tmp/{doc_type}.pdf",
+                                  {"errors": errors or [], "warnings": []})
+
+
+class TestCreateStorage:
+    """Тесты для выбора бэкенда по DATABASE_URL"""
+
+    def test_sqlite_url(self):
+        """sqlite:/// создаёт SQLite-хранилище с путём из URL"""
+        storage = create_storage("sqlite:///:memory:")
+        assert isinstance(storage, DocumentStorage)
+        assert storage.db_path == ":memory:"
+
+    def test_unknown_scheme(self):
+        """Неизвестная схема отклоняется"""
+        with pytest.raises(ValueError):
+            create_storage("mysql://localhost/documents")
+
+    def test_renamed_doc_types_migrated(self, tmp_path):
+        """Документы с прежним id типа переводятся на новый при открытии базы"""
+        path = str(tmp_path / "documents.db")
+        doc_id = _store(DocumentStorage(path), "ordin_plata")
+
+        assert DocumentStorage(path).get_document(doc_id).doc_type == "ordine_plata"
+
+
+class TestPostgresQueries:
+    """Тесты для построения SQL-запросов PostgreSQL без сервера"""
+
+    def test_documents_query_without_filters(self):
+        """Без фильтров выбираются все документы, новые первыми"""
+        query, params = PostgresDocumentStorage._documents_query()
+        assert query == f"SELECT {DOCUMENT_COLUMNS} FROM documents WHERE 1=1 ORDER BY upload_date DESC"
+        assert params == []
+
+    def test_status_filters(self):
+        """Статус проверяется по JSONB-списку ошибок валидации"""
+        pending, _ = PostgresDocumentStorage._documents_query({"status": "pending"})
+        with_errors, _ = PostgresDocumentStorage._documents_query({"has_validation_errors": True})
+        processed, _ = PostgresDocumentStorage._documents_query({"status": "processed"})
+
+        assert f" AND {HAS_ERRORS_SQL}" in pending
+        assert with_errors == pending
+        assert f" AND NOT {HAS_ERRORS_SQL}" in processed
+        assert "'[]'::jsonb" in HAS_ERRORS_SQL
+
+    def test_documents_query_filters_and_params(self):
+        """Условия и параметры идут в одном порядке, число параметров совпадает с плейсхолдерами"""
+        query, params = PostgresDocumentStorage._documents_query({
+            "doc_type": "bon_fiscal",
+            "verified": True,
+            "search": "Alfa",
+            "date_from": "2025-03-01",
+            "end_date": "2025-03-31",
+        })
+
+        assert query.endswith(" AND doc_type = %s AND verified"
+                              " AND (filename ILIKE %s OR raw_text ILIKE %s)"
+                              " AND upload_date::date >= %s AND upload_date::date <= %s"
+                              " ORDER BY upload_date DESC")
+        assert params == ["bon_fiscal", "%Alfa%", "%Alfa%", date(2025, 3, 1), date(2025, 3, 31)]
+        assert query.count("%s") == len(params)
+
+    def test_invalid_date_is_skipped(self):
+        """Дата в неверном формате не добавляет ни условия, ни параметра"""
+        query, params = PostgresDocumentStorage._documents_query({"date_from": "01.03.2025", "date_to": "2025-03-31"})
+
+        assert "upload_date::date >=" not in query
+        assert " AND upload_date::date <= %s" in query
+        assert params == [date(2025, 3, 31)]
+
+    @pytest.mark.skipif(Jsonb is None, reason="psycopg не установлен")
+    def test_search_query_uses_jsonb_containment(self):
+        """Поиск по IDNO сужается в базе условием @> по полю idno, которое обслуживает GIN-индекс"""
+        query, params = PostgresDocumentStorage._search_query(doc_type="factura_fiscala", idno="10036",
+                                                              date_to="2025-03-31", filename="scan")
+
+        assert query.endswith(" AND doc_type = %s AND filename ILIKE %s AND fields @> %s"
+                              " AND upload_date::date <= %s")
+        assert params[:2] == ["factura_fiscala", "%scan%"]
+        assert isinstance(params[2], Jsonb) and params[2].obj == [{"name": "idno"}]
+        assert params[3] == date(2025, 3, 31)
+
+    def test_frame_query_extracts_fields_from_jsonb(self):
+        """Колоночная выгрузка берёт каждое поле из JSONB по имени и фильтрует по типу и датам"""
+        query, params = PostgresDocumentStorage._frame_query(date_from="2025-03-01", doc_type="bon_fiscal")
+
+        for name in PostgresDocumentStorage.FRAME_FIELDS:
+            assert f"WHERE f->>'name' = '{name}' LIMIT 1) AS {name}" in query
+        assert "jsonb_array_elements(d.fields)" in query
+        assert query.rstrip().endswith(" AND d.doc_type = %s AND upload_date::date >= %s ORDER BY d.id")
+        assert params == ["bon_fiscal", date(2025, 3, 1)]
+
+
+@pytest.mark.skipif(not TEST_POSTGRES_URL, reason="TEST_POSTGRES_URL не задан")
+class TestPostgresDocumentStorage:
+    """Тесты для хранилища на PostgreSQL"""
+
+    @pytest.fixture
+    def storage(self):
+        storage = create_storage(TEST_POSTGRES_URL)
+        with storage.pool.connection() as conn:
+            conn.execute("TRUNCATE documents RESTART IDENTITY")
+        yield storage
+        storage.close()
+
+    def test_renamed_doc_types_migrated(self, storage):
+        """Документы с прежним id типа переводятся на новый при открытии базы"""
+        doc_id = _store(storage, "ordin_plata")
+
+        reopened = create_storage(TEST_POSTGRES_URL)
+        try:
+            assert reopened.get_document(doc_id).doc_type == "ordine_plata"
+        finally:
+            reopened.close()
+
+    def test_store_and_get(self, storage):
+        """Документ сохраняется и читается с полями из JSONB"""
+        doc_id = _store(storage, "factura_fiscala", company="Alfa", idno="1003600012345")
+
+        document = storage.get_document(doc_id)
+        assert document.doc_type == "factura_fiscala"
+        assert {field.name: field.value for field in document.fields}["idno"] == "1003600012345"
+        assert document.validation_errors == []
+
+    def test_search_and_filters(self, storage):
+        """Поиск по IDNO и сумме, фильтр проблемных документов"""
+        _store(storage, "factura_fiscala", idno="1003600012345", total_amount=1200)
+        _store(storage, "bon_fiscal", total_amount=50, errors=["Отсутствует обязательное поле: time"])
+
+        found = storage.search_documents(idno="10036", amount_min=1000)
+        assert [doc.doc_type for doc in found] == ["factura_fiscala"]
+
+        pending = storage.get_documents({"status": "pending"})
+        assert [doc.doc_type for doc in pending] == ["bon_fiscal"]
+
+    def test_update_and_statistics(self, storage):
+        """Обновление полей сбрасывает ошибки и меняет статистику"""
+        doc_id = _store(storage, "bon_fiscal", total_amount=50, errors=["Отсутствует обязательное поле: time"])
+        assert storage.get_statistics()["by_status"] == {"valid": 0, "invalid": 1}
+
+        assert storage.update_document(doc_id, {"total_amount": 75})
+        stats = storage.get_statistics()
+        assert stats["by_status"] == {"valid": 1, "invalid": 0}
+        assert stats["by_type"] == {"bon_fiscal": 1}
+
+    def test_update_marks_verified(self, storage):
+        """Правка пользователя исправляет тип и отмечает документ проверенным"""
+        corrected = _store(storage, "unknown", number="15")
+        _store(storage, "bon_fiscal", total_amount=50)
+
+        assert storage.update_document(corrected, {}, "contract")
+        assert [(doc.id, doc.doc_type) for doc in storage.get_documents({"verified": True})] == [(corrected, "contract")]
+
+    def test_load_documents_frame(self, storage):
+        """Колоночная выгрузка совпадает с SQLite-реализацией"""
+        _store(storage, "factura_fiscala", company="Alfa", total_amount="1,200.00", vat_amount=200)
+        _store(storage, "bon_fiscal", total_amount=50, errors=["Отсутствует обязательное поле: time"])
+
+        frame = storage.load_documents_frame()
+        assert list(frame["id"]) == [1, 2]
+        assert frame.loc[0, "total_amount"] == 1200.0
+        assert frame.loc[1, "vat_amount"] == 0.0
+        assert list(frame["is_valid"]) == [True, False]
+
+    def test_iter_and_update_classifications(self, storage):
+        """Чтение порциями и пакетная запись новой классификации"""
+        first = _store(storage, "unknown", company="Alfa")
+        second = _store(storage, "unknown", company="Beta")
+
+        chunks = list(storage.iter_documents(chunk_size=1))
+        assert [[doc.id for doc in chunk] for chunk in chunks] == [[first], [second]]
+
+        assert storage.update_classifications([
+            ClassificationUpdate(first, "contract", 0.85),
+            ClassificationUpdate(second, "chitanta", 0.95, [DocumentField("amount", "10.0")]),
+        ]) == 2
+        assert storage.get_document(first).extracted_data == {"company": "Alfa"}
+        assert storage.get_document(second).doc_type == "chitanta"
+        assert storage.get_document(second).extracted_data == {"amount": "10.0"}
@@ -0,0 +1,115 @@
+"""
+Тесты для сжатия текста OCR в промптах LLM
+"""
+
+import json
+
+import pytest
+
+from benchmarks.corpus import OCR_CORPUS
+from benchmarks.mock_openai import MockOpenAIServer
+from config import config
+from document_processor import DocumentProcessor
+from field_extractor import field_extractor
+from llm_gateway import LLMGateway
+from metrics import metrics
+from prompt_compaction import compact_text, count_tokens, line_quality
+
+INVOICE = OCR_CORPUS[0].text
+FILLER = "\n".join(f"Lorem ipsum dolor sit amet, consectetur adipiscing elit {index}" for index in range(120))
+GARBAGE = "\n".join(["|~ ;' .", "—— _ ,", "i", "::: ||| ..."] * 20)
+HEADER, TOTALS = INVOICE.split("Nr. Denumirea")[0], "Total fără TVA: 1 858,33 L\nTVA 20%: 371,67 L\nTotal: 2 230,00 L"
+
+# Длинный шумный документ: заголовок, много строк без полей и мусора OCR, итоги в самом конце
+NOISY_INVOICE = f"{HEADER}\n{FILLER}\n{GARBAGE}\n{TOTALS}"
+
+
+class TestPromptCompaction:
+    """Тесты для compact_text"""
+
+    def test_short_text_only_normalized(self):
+        """Короткий текст не урезается, только схлопываются пробелы и пустые строки"""
+        result = compact_text("FACTURĂ   FISCALĂ\n\n\n   Total:\t2 230,00 L  ", budget=500)
+
+        assert result.text == "FACTURĂ FISCALĂ\nTotal: 2 230,00 L"
+        assert result.dropped_lines == 0
+
+    def test_garbage_lines_dropped(self):
+        """Строки из знаков препинания и одиночных символов не попадают в промпт"""
+        assert line_quality("|~ ;' .") == 0.0
+        assert line_quality("i") == 0.0
+        assert line_quality("Total: 2 230,00 L") > config.PROMPT_MIN_LINE_QUALITY
+
+        result = compact_text(f"{INVOICE}\n{GARBAGE}", budget=5000)
+
+        assert result.text == compact_text(INVOICE, budget=5000).text
+        assert len(result.text.splitlines()) == len(INVOICE.splitlines())
+        assert result.dropped_lines == 80
+
+    def test_key_lines_kept_within_budget(self):
+        """В бюджет попадают номер, дата и итоги в конце документа, а не начало длинного шума"""
+        result = compact_text(NOISY_INVOICE, budget=120)
+
+        assert result.tokens <= 120
+        assert result.original_tokens == count_tokens(NOISY_INVOICE)
+        assert result.tokens_saved > 1000
+        assert "Total: 2 230,00 L" in result.text
+        assert "Data eliberării: 14.03.2025" in result.text
+        data = field_extractor.extract(result.text)
+        assert data["total_amount"] == 2230.0 and data["number"] == "0458213"
+        # Прежнее усечение по символам теряло итоги
+        assert "Total:" not in NOISY_INVOICE[:2000]
+
+    def test_lines_keep_document_order(self):
+        """Отобранные строки идут в исходном порядке"""
+        lines = compact_text(NOISY_INVOICE, budget=120).text.splitlines()
+
+        assert lines.index("Seria MD AAA Nr. 0458213") < lines.index("Total: 2 230,00 L")
+
+    def test_single_long_line_truncated(self):
+        """Текст без переносов строк, не помещающийся в бюджет, обрезается"""
+        result = compact_text("слово " * 1000, budget=50)
+
+        assert 0 < result.tokens <= 50
+
+    def test_tokens_saved_reported(self):
+        """Сэкономленные токены учитываются в метриках"""
+        metrics.reset()
+
+        result = compact_text(NOISY_INVOICE, budget=120)
+
+        assert metrics.get("llm_prompt_tokens_saved") == result.tokens_saved
+        assert metrics.snapshot()["ratios"]["llm_prompt_compaction_ratio"] == pytest.approx(
+            result.tokens / result.original_tokens, abs=1e-3)
+
+
+class TestCompactedPrompts:
+    """Тесты для промптов DocumentProcessor"""
+
+    def test_classification_prompt_contains_totals(self, monkeypatch):
+        """Промпт классификации содержит итоги длинного документа и не содержит мусор OCR"""
+        monkeypatch.setattr(config, "OPENAI_CLASSIFICATION_PROMPT_TOKENS", 120)
+
+        prompt = DocumentProcessor()._classification_prompt(NOISY_INVOICE, "ro")
+
+        assert "Total: 2 230,00 L" in prompt
+        assert "|~ ;' ." not in prompt
+
+    @pytest.mark.parametrize("text, replaced", [(INVOICE, True), (NOISY_INVOICE, False)])
+    def test_enhanced_text_only_from_full_prompt(self, monkeypatch, text, replaced):
+        """Исправленный LLM текст заменяет распознанный, только если документ вошёл в промпт целиком"""
+        monkeypatch.setattr(config, "USE_OPENAI_FOR_ENHANCEMENT", True)
+        monkeypatch.setattr(config, "OPENAI_ENHANCEMENT_PROMPT_TOKENS", 120)
+        answer = json.dumps({"text": "corrected text", "type": "factura_fiscala", "confidence": 0.9})
+        processor = DocumentProcessor()
+        with MockOpenAIServer(responder=lambda body: answer) as server:
+            gateway = LLMGateway(api_key="test", base_url=server.base_url, model="mock-model")
+            gateway.cache = None
+            processor.enhancement_client = gateway
+            try:
+                doc_data, _ = processor.analyze_text(text, "ro")
+            finally:
+                gateway.close()
+
+        assert len(server.requests) == 1
+        assert doc_data.raw_text == ("corrected text" if replaced else text)
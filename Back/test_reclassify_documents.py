@@ -0,0 +1,198 @@
+"""
+Тесты для переклассификации сохранённых документов
+"""
+
+import json
+import sys
+
+import pytest
+from openai import OpenAI
+
+import reclassify_documents
+from benchmarks.mock_openai import MockOpenAIServer
+from data_models import DocumentData, DocumentField
+from document_storage import ClassificationUpdate, DocumentStorage, set_storage, get_storage
+from llm_batch import LLMBatchClient
+from llm_usage import LLMUsageLog, call_cost
+
+RECEIPT_TEXT = "BON FISCAL Nr. 1042\nCasă 3\nData 12.03.2025\nTVA 20%\nTotal 150,00 L"
+
+
+def _store(storage, doc_type, raw_text, confidence=0.9, **fields):
+    """Сохраняет документ с заданным типом и текстом"""
+    doc_data = DocumentData(
+        doc_type=doc_type,
+        fields=[DocumentField(name=name, value=str(value)) for name, value in fields.items()],
+        raw_text=raw_text,
+        confidence=confidence,
+    )
+    return storage.store_document(doc_data, f"{doc_type}.pdf", f"/tmp/{doc_type}.pdf")
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    previous = get_storage()
+    storage = DocumentStorage(":memory:")
+    set_storage(storage)
+    monkeypatch.setattr("config.config.LOCAL_CLASSIFIER_ENABLED", False)
+    yield storage
+    set_storage(previous)
+
+
+class TestStorageChunks:
+    """Тесты для чтения порциями и пакетного обновления"""
+
+    def test_iter_documents(self, storage):
+        """Документы читаются порциями в порядке ID"""
+        ids = [_store(storage, "unknown", f"text {index}") for index in range(5)]
+
+        chunks = list(storage.iter_documents(chunk_size=2))
+
+        assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+        assert [doc.id for chunk in chunks for doc in chunk] == ids
+
+    def test_update_classifications(self, storage):
+        """Тип и уверенность обновляются, поля — только если переданы"""
+        kept = _store(storage, "unknown", "a", company="Alfa")
+        replaced = _store(storage, "unknown", "b", company="Beta")
+
+        count = storage.update_classifications([
+            ClassificationUpdate(kept, "contract", 0.85),
+            ClassificationUpdate(replaced, "chitanta", 0.95, [DocumentField("amount", "10.0")]),
+        ])
+
+        assert count == 2
+        assert storage.get_document(kept).doc_type == "contract"
+        assert storage.get_document(kept).extracted_data == {"company": "Alfa"}
+        assert storage.get_document(replaced).confidence == 0.95
+        assert storage.get_document(replaced).extracted_data == {"amount": "10.0"}
+
+
+def test_reclassify_cli(storage, monkeypatch, capsys):
+    """CLI меняет тип и поля только у документов, классификация которых изменилась, и сбрасывает их отчёты"""
+    monkeypatch.setattr("config.config.CLASSIFICATION_CONFIDENCE_THRESHOLD", 0.7)
+    changed = _store(storage, "unknown", RECEIPT_TEXT, confidence=1.0, note="manual")
+    unchanged = _store(storage, "unknown", "lorem ipsum", confidence=1.0, note="manual")
+    invalidated = []
+    monkeypatch.setattr(reclassify_documents.fiscal_report_scheduler, "invalidate_documents",
+                        lambda doc_ids: invalidated.extend(doc_ids))
+    monkeypatch.setattr(sys, "argv", ["reclassify_documents.py", "--chunk-size", "1", "--language", "ro"])
+
+    reclassify_documents.main()
+
+    document = storage.get_document(changed)
+    assert document.doc_type == "bon_fiscal"
+    assert document.confidence == 0.75
+    assert document.extracted_data["date"] == "12.03.2025"
+    assert storage.get_document(unchanged).extracted_data == {"note": "manual"}
+    assert "Обработано документов: 2, изменено: 1" in capsys.readouterr().out
+    assert invalidated == [changed]
+
+
+def test_reclassify_keeps_better_stored_result(storage, monkeypatch, capsys):
+    """Уверенный сохранённый тип не заменяется неизвестным или менее уверенным результатом, поля не теряются"""
+    monkeypatch.setattr("config.config.CLASSIFICATION_CONFIDENCE_THRESHOLD", 0.7)
+    contract = _store(storage, "contract", "lorem ipsum", confidence=0.92, number="15")
+    confident = _store(storage, "factura_fiscala", RECEIPT_TEXT, confidence=0.95, number="FF1")
+    monkeypatch.setattr(sys, "argv", ["reclassify_documents.py", "--language", "ro"])
+
+    reclassify_documents.main()
+
+    document = storage.get_document(contract)
+    assert (document.doc_type, document.confidence) == ("contract", 0.92)
+    assert document.extracted_data == {"number": "15"}
+    assert storage.get_document(confident).doc_type == "factura_fiscala"
+    assert "изменено: 0" in capsys.readouterr().out
+
+
+def test_reclassify_keeps_verified_documents(storage, monkeypatch):
+    """Тип, исправленный пользователем, не перезаписывается переклассификацией"""
+    monkeypatch.setattr("config.config.CLASSIFICATION_CONFIDENCE_THRESHOLD", 0.7)
+    corrected = _store(storage, "unknown", RECEIPT_TEXT, confidence=1.0, number="FF1")
+    storage.update_document(corrected, {}, "factura_fiscala")
+    monkeypatch.setattr(sys, "argv", ["reclassify_documents.py", "--language", "ro"])
+
+    reclassify_documents.main()
+
+    document = storage.get_document(corrected)
+    assert (document.doc_type, document.verified) == ("factura_fiscala", True)
+    assert document.extracted_data == {"number": "FF1"}
+
+
+@pytest.fixture
+def batch_server(monkeypatch):
+    answer = json.dumps({"type": "contract", "confidence": 0.9, "data": {"number": "77"}})
+    with MockOpenAIServer(responder=lambda body: answer) as server:
+        client = OpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+        monkeypatch.setattr(reclassify_documents, "LLMBatchClient",
+                            lambda: LLMBatchClient(client=client, poll_interval=0))
+        yield server
+
+
+class TestBatchReclassification:
+    """Тесты для переклассификации через OpenAI Batch API"""
+
+    def test_batch_applies_results(self, storage, batch_server, monkeypatch, capsys):
+        """В пакет попадают документы с неуверенной сохранённой классификацией, ответы записываются в базу"""
+        monkeypatch.setattr("config.config.CLASSIFICATION_CONFIDENCE_THRESHOLD", 0.7)
+        receipt = _store(storage, "factura_fiscala", RECEIPT_TEXT, confidence=0.5)
+        confident = _store(storage, "contract", "lorem ipsum", confidence=0.95)
+        uncertain = _store(storage, "unknown", "lorem ipsum dolor", confidence=1.0, note="manual")
+        monkeypatch.setattr(sys, "argv", ["reclassify_documents.py", "--batch", "--language", "ro"])
+
+        reclassify_documents.main()
+
+        assert storage.get_document(receipt).doc_type == "bon_fiscal"
+        assert storage.get_document(confident).doc_type == "contract"
+        document = storage.get_document(uncertain)
+        assert document.doc_type == "contract"
+        assert document.confidence == 0.9
+        assert document.extracted_data == {"number": "77"}
+        assert len(batch_server.requests) == 2
+        assert "lorem ipsum dolor" in batch_server.requests[1]["messages"][-1]["content"]
+        output = capsys.readouterr().out
+        assert "Обработано документов: 3, изменено: 0" in output
+        assert "Пакет batch_1: ответов 2, изменено документов: 2" in output
+
+    def test_batch_skips_local_results(self, storage, batch_server, monkeypatch):
+        """Локальный результат документа из пакета не записывается: тип определяет ответ OpenAI"""
+        monkeypatch.setattr("config.config.CLASSIFICATION_CONFIDENCE_THRESHOLD", 0.7)
+        uncertain = _store(storage, "unknown", RECEIPT_TEXT, confidence=1.0)
+        written = []
+        monkeypatch.setattr(storage, "update_classifications", lambda updates: written.append(updates) or len(updates))
+        monkeypatch.setattr(sys, "argv", ["reclassify_documents.py", "--batch", "--language", "ro"])
+
+        reclassify_documents.main()
+
+        assert len(batch_server.requests) == 1
+        assert [[update.doc_id for update in updates] for updates in written] == [[uncertain]]
+
+    def test_batch_dry_run_submits_nothing(self, storage, batch_server, monkeypatch, capsys):
+        """В режиме --dry-run пакет не отправляется"""
+        uncertain = _store(storage, "unknown", "lorem ipsum dolor", confidence=1.0)
+        monkeypatch.setattr(sys, "argv", ["reclassify_documents.py", "--batch", "--dry-run"])
+
+        reclassify_documents.main()
+
+        assert batch_server.batches == {}
+        assert storage.get_document(uncertain).doc_type == "unknown"
+        assert "было бы отправлено документов: 1" in capsys.readouterr().out
+
+    def test_resume_by_batch_id(self, storage, batch_server, monkeypatch, tmp_path):
+        """Результаты ранее отправленного пакета применяются по --batch-id, расход записывается по документам"""
+        usage = LLMUsageLog(str(tmp_path / "llm_usage.db"))
+        monkeypatch.setattr(reclassify_documents, "llm_usage", usage)
+        uncertain = _store(storage, "unknown", "lorem ipsum dolor", confidence=1.0)
+        processor = reclassify_documents.DocumentProcessor()
+        batch_client = reclassify_documents.LLMBatchClient()
+        [batch_id] = batch_client.submit([reclassify_documents.BatchRequest(
+            f"{uncertain}:ro", processor.classification_request("lorem ipsum dolor", "ro"))])
+        monkeypatch.setattr(sys, "argv", ["reclassify_documents.py", "--batch-id", batch_id])
+
+        reclassify_documents.main()
+
+        assert storage.get_document(uncertain).doc_type == "contract"
+        [row] = usage.summary("doc_type")
+        assert (row["doc_type"], row["calls"], row["documents"]) == ("contract", 1, 1)
+        assert row["cost_usd"] == pytest.approx(call_cost("openai", 10, 5) / 2)
+        assert usage.summary("endpoint")[0]["endpoint"] == f"batch:{batch_id}"
@@ -0,0 +1,97 @@
+"""
+Тесты для аналитических отчётов генератора v2
+"""
+
+import pytest
+
+from data_models import DocumentData, DocumentField
+from document_storage import DocumentStorage
+from report_generator_v2 import ReportGeneratorV2
+
+
+def _store(storage, doc_type, confidence=0.9, errors=None, **fields):
+    """Сохраняет документ с заданными полями"""
+    doc_data = DocumentData(
+        doc_type=doc_type,
+        fields=[DocumentField(name=name, value=str(value)) for name, value in fields.items()],
+        raw_text="",
+        confidence=confidence,
+    )
+    return storage.store_document(doc_data, "doc.pdf", "/tmp/doc.pdf",
+                                  {"errors": errors or [], "warnings": []})
+
+
+@pytest.fixture
+def generator():
+    generator = ReportGeneratorV2(storage=DocumentStorage(":memory:"))
+    storage = generator.storage
+    _store(storage, "factura_fiscala", company="Alfa", total_amount="1,200.00", vat_amount=200)
+    _store(storage, "factura_fiscala", company="Alfa", total_amount=108, vat_amount=8, confidence=0.6)
+    _store(storage, "bon_fiscal", company="Beta", total_amount=50, confidence=0.3,
+           errors=["Отсутствует обязательное поле: time"])
+    _store(storage, "contract", total_amount=500, vat_amount=30,
+           errors=["Отсутствует обязательное поле: time", "Неверный формат даты: 99"])
+    return generator
+
+
+class TestColumnarAnalytics:
+    """Тесты для колоночной выгрузки и векторных отчётов"""
+
+    def test_load_documents_frame(self, generator):
+        """Поля документа выгружаются в колонки с числовыми суммами"""
+        frame = generator.storage.load_documents_frame()
+
+        assert list(frame["id"]) == [1, 2, 3, 4]
+        assert frame.loc[0, "company"] == "Alfa"
+        assert frame.loc[0, "total_amount"] == 1200.0
+        assert frame.loc[2, "vat_amount"] == 0.0
+        assert list(frame["is_valid"]) == [True, True, False, False]
+
+    def test_load_documents_frame_filters(self, generator):
+        """Фильтры по типу и дате применяются в запросе"""
+        with generator.storage._connect() as conn:
+            conn.execute("UPDATE documents SET upload_date = '2024-01-15 10:00:00' WHERE id = 1")
+
+        frame = generator.storage.load_documents_frame(date_from="2024-01-01", date_to="2024-01-31")
+        assert list(frame["id"]) == [1]
+
+        frame = generator.storage.load_documents_frame(doc_type="factura_fiscala")
+        assert list(frame["id"]) == [1, 2]
+
+    def test_company_analysis(self, generator):
+        """Группировка по компаниям"""
+        report = generator.generate_custom_report("company_analysis", {}, "ru")
+        companies = report["companies"]
+
+        assert companies["Alfa"]["total_amount"] == 1308.0
+        assert companies["Alfa"]["total_vat"] == 208.0
+        assert companies["Alfa"]["document_ids"] == [1, 2]
+        assert companies["Неизвестная компания"]["document_types"] == {"contract": 1}
+
+    def test_company_analysis_filter(self, generator):
+        """Фильтр по одной компании"""
+        report = generator.generate_custom_report("company_analysis", {"company": "Beta"}, "ru")
+        assert list(report["companies"]) == ["Beta"]
+
+    def test_vat_analysis(self, generator):
+        """Суммы НДС и распределение по ставкам"""
+        vat_data = generator.generate_custom_report("vat_analysis", {}, "ru")["vat_data"]
+
+        assert vat_data["total_vat"] == 238.0
+        assert vat_data["vat_by_type"] == {"bon_fiscal": 0.0, "contract": 30.0, "factura_fiscala": 208.0}
+        assert vat_data["vat_rate_analysis"] == {
+            "20%": 1, "12%": 0, "8%": 1, "no_vat": 1, "nonstandard": 1
+        }
+
+    def test_quality_report(self, generator):
+        """Гистограмма уверенности и частота ошибок валидации"""
+        stats = generator.generate_custom_report("document_quality", {}, "ru")["quality_stats"]
+
+        assert stats["valid_documents"] == 2
+        assert stats["invalid_documents"] == 2
+        assert stats["confidence_distribution"] == {"high": 2, "medium": 1, "low": 1}
+        assert stats["average_confidence"] == pytest.approx(0.675)
+        assert stats["validation_errors"] == {
+            "Отсутствует обязательное поле: time": 2,
+            "Неверный формат даты: 99": 1,
+        }
@@ -0,0 +1,129 @@
+"""
+Тесты для планировщика фискальных отчётов
+"""
+
+from datetime import date
+
+import pytest
+
+from data_models import DocumentData, DocumentField
+from document_storage import ClassificationUpdate, DocumentStorage
+from report_generator_v2 import ReportGeneratorV2
+from report_scheduler import FiscalReportScheduler
+
+
+def _store_invoice(storage, company, amount, vat, upload_date=None, doc_date=None):
+    """Сохраняет счёт-фактуру с заданной датой загрузки (по умолчанию — текущей) и датой документа"""
+    fields = [
+        DocumentField(name="company", value=company),
+        DocumentField(name="total_amount", value=str(amount)),
+        DocumentField(name="vat_amount", value=str(vat)),
+    ]
+    if doc_date:
+        fields.append(DocumentField(name="date", value=doc_date))
+    doc_data = DocumentData(doc_type="factura_fiscala", fields=fields, raw_text="FACTURĂ FISCALĂ")
+    doc_id = storage.store_document(doc_data, "factura.pdf", "/tmp/factura.pdf")
+    if upload_date:
+        with storage._connect() as conn:
+            conn.execute("UPDATE documents SET upload_date = ? WHERE id = ?", (upload_date, doc_id))
+    return doc_id
+
+
+@pytest.fixture
+def scheduler():
+    generator = ReportGeneratorV2(storage=DocumentStorage(":memory:"))
+    return FiscalReportScheduler(generator=generator)
+
+
+class TestFiscalReportScheduler:
+    """Тесты для предварительной генерации фискальных отчётов"""
+
+    def test_precompute_closed_month(self, scheduler):
+        """Отчёт за закрытый месяц готовится заранее и выдаётся из кэша"""
+        _store_invoice(scheduler.generator.storage, "Alfa", 1200.0, 200.0, "2025-05-10 10:00:00")
+
+        scheduler.precompute_closed_month(today=date(2025, 6, 3))
+
+        calls = []
+        original = scheduler.generator.generate_fiscal_report
+        scheduler.generator.generate_fiscal_report = lambda *args: calls.append(args) or original(*args)
+
+        report = scheduler.get_fiscal_report(5, 2025, "ru")
+        assert calls == []
+        assert report["fiscal_data"]["total_documents"] == 1
+        assert report["fiscal_data"]["total_sales"] == 1200.0
+        assert report["fisc_format"]["submission_deadline"] == "2025-06-25"
+
+    def test_late_document_updates_cache(self, scheduler):
+        """Поздний документ добавляется в кэшированный отчёт без перегенерации"""
+        storage = scheduler.generator.storage
+        _store_invoice(storage, "Alfa", 1200.0, 200.0, "2025-05-10 10:00:00")
+        scheduler.precompute_closed_month(today=date(2025, 6, 3))
+
+        late_id = _store_invoice(storage, "Beta", 600.0, 100.0, "2025-05-31 23:00:00")
+        scheduler.on_document_stored(late_id)
+
+        report = scheduler.get_fiscal_report(5, 2025, "ro")
+        fiscal_data = report["fiscal_data"]
+        assert fiscal_data["total_documents"] == 2
+        assert fiscal_data["total_vat"] == 300.0
+        assert set(fiscal_data["companies"]) == {"Alfa", "Beta"}
+
+    def test_invalidate_document(self, scheduler):
+        """Изменённый документ сбрасывает отчёт из кэша"""
+        doc_id = _store_invoice(scheduler.generator.storage, "Alfa", 1200.0, 200.0, "2025-05-10 10:00:00")
+        scheduler.precompute_closed_month(today=date(2025, 6, 3))
+
+        scheduler.invalidate_document(doc_id)
+
+        assert scheduler._cache == {}
+
+    def test_reclassified_document_invalidates_its_month(self, scheduler):
+        """Документ, ставший фискальным после переклассификации, сбрасывает отчёт за месяц своей загрузки"""
+        storage = scheduler.generator.storage
+        _store_invoice(storage, "Alfa", 1200.0, 200.0, "2025-05-10 10:00:00")
+        receipt = _store_invoice(storage, "Beta", 600.0, 100.0, "2025-05-20 10:00:00")
+        other_month = _store_invoice(storage, "Gamma", 300.0, 50.0, "2025-04-20 10:00:00")
+        storage.update_classifications([ClassificationUpdate(receipt, "contract", 0.9),
+                                        ClassificationUpdate(other_month, "contract", 0.9)])
+        scheduler.precompute_closed_month(today=date(2025, 6, 3))
+        scheduler.get_fiscal_report(4, 2025, "ru")
+
+        storage.update_classifications([ClassificationUpdate(receipt, "bon_fiscal", 0.9)])
+        scheduler.invalidate_documents([receipt])
+
+        assert {key[:2] for key in scheduler._cache} == {(4, 2025)}
+        assert scheduler.get_fiscal_report(5, 2025, "ru")["fiscal_data"]["total_documents"] == 2
+
+    def test_late_upload_reaches_closed_month(self, scheduler):
+        """Документ за закрытый месяц, загруженный сегодня, попадает в отчёт своего месяца, а не текущего"""
+        storage = scheduler.generator.storage
+        _store_invoice(storage, "Alfa", 1200.0, 200.0, "2025-05-10 10:00:00")
+        scheduler.precompute_closed_month(today=date(2025, 6, 3))
+
+        late_id = _store_invoice(storage, "Beta", 600.0, 100.0, doc_date="31.05.2025")
+        scheduler.on_document_stored(late_id)
+
+        assert scheduler.get_fiscal_report(5, 2025, "ro")["fiscal_data"]["total_documents"] == 2
+        scheduler._cache.clear()
+        assert scheduler.get_fiscal_report(5, 2025, "ro")["fiscal_data"]["total_documents"] == 2
+
+    def test_document_stored_during_generation(self, scheduler):
+        """Отчёт, во время генерации которого сохранён документ, не кэшируется и не теряет документ"""
+        storage = scheduler.generator.storage
+        _store_invoice(storage, "Alfa", 1200.0, 200.0, "2025-05-10 10:00:00")
+        original = scheduler.generator.generate_fiscal_report
+        stored = []
+
+        def generate(*args):
+            report = original(*args)
+            if not stored:
+                stored.append(_store_invoice(storage, "Beta", 600.0, 100.0, "2025-05-20 10:00:00"))
+                scheduler.on_document_stored(stored[0])
+            return report
+
+        scheduler.generator.generate_fiscal_report = generate
+
+        assert scheduler.get_fiscal_report(5, 2025, "ru")["fiscal_data"]["total_documents"] == 1
+        assert scheduler._cache == {}
+        assert scheduler.get_fiscal_report(5, 2025, "ru")["fiscal_data"]["total_documents"] == 2
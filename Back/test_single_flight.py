@@ -0,0 +1,65 @@
+"""
+Тесты для объединения одновременных одинаковых заданий
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from metrics import metrics
+from single_flight import SingleFlight
+
+
+class TestSingleFlight:
+    """Тесты для SingleFlight"""
+
+    def test_concurrent_calls_share_result(self):
+        """Одновременные вызовы с одним ключом выполняют функцию один раз"""
+        flight = SingleFlight("test")
+        calls = []
+        started = threading.Event()
+
+        def work():
+            calls.append(1)
+            started.set()
+            time.sleep(0.1)
+            return object()
+
+        coalesced = metrics.get("test_coalesced")
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            first = executor.submit(flight.do, "file", work)
+            started.wait()
+            others = [executor.submit(flight.do, "file", work) for _ in range(4)]
+            results = [first.result()] + [future.result() for future in others]
+
+        assert len(calls) == 1
+        assert all(result is results[0] for result in results)
+        assert metrics.get("test_coalesced") == coalesced + 4
+        assert flight.in_flight() == 0
+
+    def test_key_released_after_completion(self):
+        """После завершения задание с тем же ключом выполняется заново"""
+        flight = SingleFlight("test")
+
+        assert flight.do("a", lambda: 1) == 1
+        assert flight.do("a", lambda: 2) == 2
+
+    def test_error_reaches_waiters(self):
+        """Ошибка ведущего получают и ожидающие вызовы"""
+        flight = SingleFlight("test")
+        started = threading.Event()
+
+        def fail():
+            started.set()
+            time.sleep(0.05)
+            raise ValueError("OCR failed")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(flight.do, "a", fail)
+            started.wait()
+            second = executor.submit(flight.do, "a", fail)
+            for future in (first, second):
+                with pytest.raises(ValueError):
+                    future.result()
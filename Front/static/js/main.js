@@ -23,23 +23,61 @@ document.addEventListener('DOMContentLoaded', function() {
             try {
                 const res = await fetch('/ask_ai', {
                     method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ question })
+                    headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+                    body: JSON.stringify({ question, stream: true })
                 });
-                const data = await res.json();
-                if (res.ok) {
-                    responseDiv.textContent = data.answer || 'Нет ответа от ИИ.';
+                const contentType = res.headers.get('Content-Type') || '';
+                if (res.ok && contentType.includes('text/event-stream')) {
+                    // Ответ приходит потоком: текст дописывается по мере генерации
+                    showResponse('');
+                    const error = await readAnswerStream(res, aiResponse);
+                    if (error) {
+                        showError(error);
+                    } else if (!aiResponse.textContent) {
+                        showResponse('Нет ответа от ИИ.');
+                    }
                 } else {
-                    responseDiv.textContent = data.answer || 'Ошибка сервера.';
+                    const data = await res.json();
+                    if (res.ok) {
+                        showResponse(data.answer || 'Нет ответа от ИИ.');
+                    } else {
+                        showError(data.error || 'Ошибка сервера.');
+                    }
                 }
             } catch (err) {
-                responseDiv.textContent = 'Ошибка соединения с сервером.';
+                showError('Ошибка соединения с сервером.');
             } finally {
                 setLoadingState(false);
             }
         });
     }
 
+    async function readAnswerStream(res, target) {
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+            for (const raw of events) {
+                let event = 'message';
+                let data = '';
+                for (const line of raw.split('\n')) {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                }
+                const payload = data ? JSON.parse(data) : {};
+                if (event === 'error') return payload.error || 'Ошибка сервера.';
+                if (event === 'done') return null;
+                target.textContent += payload.delta || '';
+            }
+        }
+        return null;
+    }
+
     function setLoadingState(isLoading) {
         if (submitBtn) {
             const btnText = submitBtn.querySelector('.btn-text');